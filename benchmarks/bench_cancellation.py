@@ -0,0 +1,222 @@
+"""
+Client-disconnect cancellation and admission control of /chat/stream.
+
+The API app is driven in-process through ASGI (no server, no network) with the stub
+causal LM (benchmarks/stub_models.py) and a fixed one-chunk retrieval. The client
+behaves like uvicorn with ASGI spec 2.4: after a disconnect, receive() returns
+http.disconnect and send() raises OSError.
+
+cancellation, for GENERATION_MODE thread and batched:
+  full run          seconds and tokens of a request that reads the whole answer
+                    (max_new_tokens), what an abandoned request used to cost
+  stop ms           disconnect after the first token frame -> generation stopped
+  streamed          tokens the client received before disconnecting
+  after             tokens generated after the disconnect (rag_cancelled_tokens_total - streamed)
+
+admission, GENERATION_MAX_ACTIVE=2, GENERATION_MAX_QUEUE=2, --burst requests at once:
+  queue wait long   two are served, two wait and are served, the rest get 429; an
+                    answer cache hit in the same burst is served without a slot
+  queue wait short  two are served, two time out with 503, the rest get 429
+  reject ms         slowest 429 / 503 response
+
+Checks that cancelled requests stop within DISCONNECT_POLL_SECONDS plus a small slack
+and before max_new_tokens, that the admission statuses are as above, that 429s
+are immediate, and that every slot is released and the gauges are back to zero.
+
+Usage (from the project root):
+    python benchmarks/bench_cancellation.py [--max-new-tokens 512] [--burst 6]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.getcwd())
+
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ["WARMUP_LLM"] = "0"
+
+STOP_SLACK_SECONDS = 0.25
+STOP_WAIT_SECONDS = 30.0
+CACHED_QUERY = "Cache'teki soru"
+
+
+async def call(app, query: str, disconnect_after: int = None):
+    """One POST /chat/stream; disconnects after disconnect_after token frames."""
+    body = json.dumps({"query": query}).encode("utf-8")
+    gone = asyncio.Event()
+    result = {"status": None, "frames": 0, "chars": 0, "started_at": time.perf_counter()}
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if gone.is_set():
+            raise OSError("client disconnected")
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["status_seconds"] = time.perf_counter() - result["started_at"]
+        elif message.get("body", b"").startswith(b'data: {"token"'):
+            result["frames"] += 1
+            result["chars"] += len(json.loads(message["body"][len(b"data: "):])["token"])
+            if disconnect_after is not None and result["frames"] >= disconnect_after:
+                result["disconnected_at"] = time.perf_counter()
+                gone.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/chat/stream", "raw_path": b"/chat/stream",
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    try:
+        await app(scope, receive, send)
+    except Exception as e:  # starlette raises ClientDisconnect once send fails
+        result["error"] = type(e).__name__
+    result["seconds"] = time.perf_counter() - result["started_at"]
+    return result
+
+
+async def measure_cancellation(api, telemetry, mode: str):
+    import src.chat_engine as chat_engine
+
+    chat_engine.GENERATION_MODE = mode
+    full = await call(api.app, "Lisans nedir?")
+
+    before = telemetry.cancelled_tokens.value()
+    cancelled = await call(api.app, "Lisans nedir?", disconnect_after=1)
+    deadline = time.perf_counter() + STOP_WAIT_SECONDS
+    while telemetry.cancelled_tokens.value() == before and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+    stopped_at = time.perf_counter()
+    return {
+        "full_seconds": full["seconds"],
+        "full_tokens": full["chars"],
+        "stop_seconds": stopped_at - cancelled["disconnected_at"],
+        "tokens": int(telemetry.cancelled_tokens.value() - before),
+        "streamed": cancelled["chars"],  # the stub tokenizer decodes one character per token
+    }
+
+
+async def measure_admission(api, burst: int, timeout: float):
+    from src.admission import AdmissionController
+
+    api.admission = AdmissionController(max_active=2, max_queue=2, timeout=timeout)
+    queries = [f"Soru {i}" for i in range(burst)] + [CACHED_QUERY]
+    results = await asyncio.gather(*(call(api.app, query) for query in queries))
+    statuses = Counter(r["status"] for r in results)
+    rejected = [r["status_seconds"] for r in results if r["status"] in (429, 503)]
+    fast_rejects = [r["status_seconds"] for r in results if r["status"] == 429]
+    return {"statuses": dict(statuses), "reject_seconds": max(rejected, default=0.0),
+            "fast_reject_seconds": max(fast_rejects, default=0.0),
+            "active": api.admission.active, "queued": api.admission.queue_depth}
+
+
+async def run(args):
+    import torch
+    from langchain_core.documents import Document
+
+    from benchmarks.stub_models import make_stub_causal_lm
+    import src.chat_engine as chat_engine
+    import src.api as api
+    from src.telemetry import TELEMETRY
+
+    model, tokenizer = make_stub_causal_lm()
+    chat_engine._global_model, chat_engine._global_tokenizer = model, tokenizer
+    chat_engine.PREFIX_CACHE_ENABLED = False
+    # Sampled: TextIteratorStreamer only emits at spaces, which greedy decoding of random weights never produces
+    torch.manual_seed(0)
+    chat_engine.GENERATION_KWARGS = dict(max_new_tokens=args.max_new_tokens, do_sample=True, temperature=1.0,
+                                         top_p=1.0)
+
+    class FixedRetrieval:
+        search_kwargs = {"k": 3}
+
+        def lookup_article(self, query):
+            return None
+
+        def search_with_scores(self, query, k):
+            doc = Document(page_content="MADDE 1: Lisans, piyasa faaliyeti için verilen izindir.",
+                           metadata={"source_file": "kanun.pdf", "article_number": "MADDE 1", "section": "Genel"})
+            return [(doc, 0.2)]
+
+    api.retriever = api.query_cache = FixedRetrieval()
+    class OneCachedAnswer:
+        similarity_threshold = None
+
+        def lookup(self, query, chunk_ids, query_embedding=None):
+            return {"answer": "Cache'teki cevap.", "sources": []} if query == CACHED_QUERY else None
+
+        def store(self, *args):
+            pass
+
+    api.answer_cache = OneCachedAnswer()
+
+    cancellation = {mode: await measure_cancellation(api, TELEMETRY, mode) for mode in ("thread", "batched")}
+    chat_engine.GENERATION_MODE = "thread"
+    admission = {
+        "long": await measure_admission(api, args.burst, timeout=60.0),
+        "short": await measure_admission(api, args.burst, timeout=0.05),
+    }
+    await asyncio.sleep(0.2)  # let abandoned streams finish their cleanup
+    return cancellation, admission, api.admission, TELEMETRY.render()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--burst", type=int, default=6)
+    args = parser.parse_args()
+
+    cancellation, admission, controller, metrics = asyncio.run(run(args))
+    from src.api import DISCONNECT_POLL_SECONDS
+
+    print("-" * 72)
+    print(f"stub LM, max_new_tokens {args.max_new_tokens}, disconnect poll {DISCONNECT_POLL_SECONDS}s")
+    print(f"{'mode':<8} {'full s':>7} {'full tok':>9} {'stop ms':>8} {'streamed':>9} {'after':>6}")
+    for mode, r in cancellation.items():
+        print(f"{mode:<8} {r['full_seconds']:>7.2f} {r['full_tokens']:>9} {r['stop_seconds'] * 1000:>8.0f} "
+              f"{r['streamed']:>9} {r['tokens'] - r['streamed']:>6}")
+    print(f"admission (2 active, 2 queued, burst {args.burst} + 1 answer cache hit):")
+    for name, r in admission.items():
+        print(f"  queue wait {name:<6} statuses {r['statuses']}, slowest reject {r['reject_seconds'] * 1000:.0f} ms")
+    for line in metrics.splitlines():
+        if line.startswith(("rag_generation_active", "rag_generation_queue_depth", "rag_admission_rejected_total",
+                            "rag_cancelled_")):
+            print(f"  {line}")
+    print("-" * 72)
+
+    for mode, r in cancellation.items():
+        if r["stop_seconds"] > DISCONNECT_POLL_SECONDS + STOP_SLACK_SECONDS:
+            print(f"FAIL: {mode} generation stopped {r['stop_seconds']:.2f}s after the disconnect")
+            sys.exit(1)
+        if r["tokens"] >= args.max_new_tokens:
+            print(f"FAIL: {mode} generated {r['tokens']} tokens for a cancelled request")
+            sys.exit(1)
+    rejected = args.burst - 4
+    if admission["long"]["statuses"] != {200: 5, 429: rejected}:
+        print(f"FAIL: unexpected statuses with a long queue wait: {admission['long']['statuses']}")
+        sys.exit(1)
+    if admission["short"]["statuses"] != {200: 3, 503: 2, 429: rejected}:
+        print(f"FAIL: unexpected statuses with a short queue wait: {admission['short']['statuses']}")
+        sys.exit(1)
+    if max(r["fast_reject_seconds"] for r in admission.values()) > 0.05:
+        print("FAIL: 429 rejections are not immediate")
+        sys.exit(1)
+    if controller.active or controller.queue_depth or "rag_generation_active 0" not in metrics:
+        print(f"FAIL: slots leaked (active {controller.active}, queued {controller.queue_depth})")
+        sys.exit(1)
+    print("OK: disconnected requests stop within one poll interval, overload is rejected with 429 / 503")
+
+
+if __name__ == "__main__":
+    main()
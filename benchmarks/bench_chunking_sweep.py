@@ -0,0 +1,258 @@
+"""
+Retrieval quality vs. cost sweep over the chunking parameters (TextSplitter
+max_tokens / overlap) and the number of retrieved chunks k.
+
+Every (chunk size, overlap) pair is ingested from scratch in its own worker process
+(spawn pool, like the pipelined ingest) into a temporary directory: split, embed with
+RAGPipeline.compute_embeddings, write an exact numpy store and the BM25 index. Each k
+is then scored on the data.jsonl questions through the API's search path
+(QueryCache.search_with_scores: dense + BM25 fused, or --retrieval dense):
+  recall@k   gold answer contained in the top-k chunks (benchmarks.workload.answer_found)
+  ctx tok    mean prompt context tokens of the top-k chunks after ContextBuilder merging
+             (no budget), counted with --tokenizer; this is what prefill pays for
+  chunks     number of chunks in the index
+  index MB   size of the store on disk (vectors + texts + metadata)
+  ingest s   split + embed + write, model load excluded
+  search ms  p50 latency of one top-k search (query embedding excluded, it does not
+             depend on the chunking)
+Article lookups (questions naming an article) are not used, every question is searched.
+
+The table is sorted by context tokens; "*" marks the Pareto front on recall@k vs.
+context tokens (no other setting has at least the same recall with fewer tokens).
+The current setting (500 / 50, k=3) is marked and compared with the cheapest
+setting that keeps its recall.
+
+Usage (from the project root):
+    python benchmarks/bench_chunking_sweep.py [--chunk-sizes 200,300,500,800] [--overlaps 0,50,100]
+        [--ks 1,3,5,8] [--workers 4] [--tokenizer google/gemma-3-4b-it] [--output sweep.json]
+    --encoder stub / --tokenizer regex run offline (random BERT with a WordPiece vocab
+    built from the corpus / word count instead of Gemma tokens). The stub's dense ranking
+    is noise: recall then comes from the BM25 side only, and at k=1 (where RRF breaks the
+    rank-1 tie in favour of the dense hit) it is ~0.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.getcwd())
+
+from benchmarks.workload import answer_found, load_qa, percentile
+
+DEFAULT_ENCODER = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
+CURRENT_SETTING = (500, 50, 3)
+
+
+def _init_worker(project_root: str, threads: int):
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if project_root not in sys.path:
+        sys.path.append(project_root)
+    import torch
+    # Workers share the cores; without this every process starts one thread per core
+    torch.set_num_threads(threads)
+
+
+class PrecomputedEmbeddings:
+    """embed_query for the workload questions, from one batched compute_embeddings call."""
+    def __init__(self, texts, vectors):
+        self.vectors = dict(zip(texts, vectors))
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def build_and_score(chunk_size, overlap, shared):
+    """Runs in a worker: ingests one chunking setting into a fresh directory and scores every k."""
+    import numpy as np
+
+    from benchmarks.bench_context_builder import token_counter
+    from src.chat_engine import LEXICAL_FUSION_CANDIDATES
+    from src.context_builder import ContextBuilder
+    from src.ingest_manifest import make_chunk_id
+    from src.lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+    from src.numpy_store import NumpyVectorStore, write_numpy_store
+    from src.query_cache import QueryCache
+    from src.rag_pipeline import RAGPipeline
+    from src.text_splitter import TextSplitter
+
+    with open(shared["texts_path"], "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    index_dir = os.path.join(shared["workdir"], f"index-{chunk_size}-{overlap}")
+    os.makedirs(index_dir)
+    with contextlib.redirect_stdout(io.StringIO()):  # RAGPipeline reports every batch
+        pipeline = RAGPipeline(persist_directory=index_dir, embedding_cache_dir=None, model_name=shared["encoder"])
+        splitter = TextSplitter(model_name=shared["encoder"], max_tokens=chunk_size, overlap=overlap)
+
+        start = time.perf_counter()
+        chunks = {}
+        for file_name, text in texts.items():
+            for chunk in splitter.split_text(text, {"source_file": file_name,
+                                                    "document_title": file_name.replace(".pdf", "")}):
+                # Identical chunks share an ID; the ingest keeps the first one as well
+                chunks.setdefault(make_chunk_id(chunk["metadata"], chunk["text"]), chunk)
+        ids = list(chunks)
+        documents = [chunk["text"] for chunk in chunks.values()]
+        vectors = pipeline.compute_embeddings(documents)
+        write_numpy_store(index_dir, ids, documents, [chunk["metadata"] for chunk in chunks.values()], vectors,
+                          first_stage_modes=())
+        lexical_index = None
+        if shared["retrieval"] == "hybrid":
+            lexical_index = LexicalIndex.build(ids, documents)
+            lexical_index.save(os.path.join(index_dir, LEXICAL_INDEX_FILE))
+        ingest_seconds = time.perf_counter() - start
+
+        query_vectors = pipeline.compute_embeddings(shared["questions"])
+    index_bytes = sum(entry.stat().st_size for entry in os.scandir(index_dir) if entry.is_file())
+
+    # The API's search path (dense, or dense + BM25 fused), with its result caching disabled
+    store = NumpyVectorStore(index_dir, PrecomputedEmbeddings(shared["questions"], query_vectors))
+    search = QueryCache(store, version_fn=lambda: None, max_entries=0,
+                        lexical_index_fn=(lambda: lexical_index) if lexical_index is not None else None,
+                        fusion_candidates=LEXICAL_FUSION_CANDIDATES)
+    builder = ContextBuilder(token_counter(shared["tokenizer"]))
+    rows = []
+    for k in shared["ks"]:
+        hits, tokens, latencies = 0, [], []
+        for question, answer in zip(shared["questions"], shared["answers"]):
+            start = time.perf_counter()
+            docs_with_scores = search.search_with_scores(question, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += answer_found(answer, [doc.page_content for doc, _ in docs_with_scores])
+            tokens.append(builder.build(docs_with_scores).tokens)
+        rows.append({
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "k": k,
+            "recall": hits / len(shared["answers"]),
+            "context_tokens": float(np.mean(tokens)),
+            "chunks": len(ids),
+            "index_mb": index_bytes / 2 ** 20,
+            "ingest_s": ingest_seconds,
+            "search_p50_ms": percentile(latencies, 50),
+        })
+    return rows
+
+
+def pareto_front(rows):
+    """Rows no other row dominates on (recall higher or equal, context tokens lower or equal)."""
+    front = []
+    for row in rows:
+        dominated = any(other["recall"] >= row["recall"] and other["context_tokens"] <= row["context_tokens"] and
+                        (other["recall"] > row["recall"] or other["context_tokens"] < row["context_tokens"])
+                        for other in rows)
+        if not dominated:
+            front.append(row)
+    return front
+
+
+def setting(row):
+    return row["chunk_size"], row["overlap"], row["k"]
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-sizes", type=int_list, default=[200, 300, 500, 800])
+    parser.add_argument("--overlaps", type=int_list, default=[0, 50, 100])
+    parser.add_argument("--ks", type=int_list, default=[1, 3, 5, 8])
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER, help="HF encoder name/path, or 'stub'")
+    parser.add_argument("--tokenizer", default="google/gemma-3-4b-it", help="context token counter, or 'regex'")
+    parser.add_argument("--retrieval", choices=("hybrid", "dense"), default="hybrid",
+                        help="hybrid = dense + BM25 fused, as the API with LEXICAL_SEARCH_ENABLED=1")
+    parser.add_argument("--pdf-dir", default="ENERJI DATA")
+    parser.add_argument("--data", default="data.jsonl")
+    parser.add_argument("--output", default=None, help="also write all rows as JSON")
+    args = parser.parse_args()
+
+    from src.pdf_extractor import PDFExtractor
+
+    qa = load_qa(args.data)
+    pdfs = sorted(name for name in os.listdir(args.pdf_dir) if name.lower().endswith(".pdf"))
+    configs = [(size, overlap) for size in args.chunk_sizes for overlap in args.overlaps if overlap < size]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Extracted once, every worker splits the same text
+        texts = {name: PDFExtractor(os.path.join(args.pdf_dir, name)).extract_text() for name in pdfs}
+        texts_path = os.path.join(workdir, "texts.json")
+        with open(texts_path, "w", encoding="utf-8") as f:
+            json.dump(texts, f, ensure_ascii=False)
+        encoder = args.encoder
+        if encoder == "stub":
+            from benchmarks.stub_models import write_stub_encoder
+            encoder = write_stub_encoder(os.path.join(workdir, "encoder"), texts.values(), hidden_size=256, layers=4,
+                                         heads=4)
+        shared = {
+            "workdir": workdir,
+            "texts_path": texts_path,
+            "encoder": encoder,
+            "tokenizer": args.tokenizer,
+            "questions": [pair["question"] for pair in qa],
+            "answers": [pair["answer"] for pair in qa],
+            "ks": args.ks,
+            "retrieval": args.retrieval,
+        }
+
+        rows, failed = [], []
+        threads = max(1, (os.cpu_count() or 1) // args.workers)
+        start = time.perf_counter()
+        # spawn: fork would copy the parent's torch/tokenizer state into every worker
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(os.getcwd(), threads)) as executor:
+            futures = {executor.submit(build_and_score, size, overlap, shared): (size, overlap)
+                       for size, overlap in configs}
+            for future in as_completed(futures):
+                size, overlap = futures[future]
+                try:
+                    rows.extend(future.result())
+                    print(f"  chunk {size} / overlap {overlap} done", flush=True)
+                except Exception as e:
+                    print(f"  chunk {size} / overlap {overlap} failed: {e}", flush=True)
+                    failed.append((size, overlap))
+        wall_seconds = time.perf_counter() - start
+
+    front = {setting(row) for row in pareto_front(rows)}
+    rows.sort(key=lambda row: (row["context_tokens"], -row["recall"]))
+    print("-" * 92)
+    print(f"{len(qa)} questions, {len(configs)} indices built by {args.workers} workers in {wall_seconds:.0f}s, "
+          f"{args.retrieval} retrieval, encoder {args.encoder}, tokens {args.tokenizer}")
+    print(f"{'chunk':>5} {'overlap':>7} {'k':>3} {'recall@k':>9} {'ctx tok':>8} {'chunks':>7} {'index MB':>9} "
+          f"{'ingest s':>9} {'search ms':>10}")
+    for row in rows:
+        marks = ("*" if setting(row) in front else " ") + (" current" if setting(row) == CURRENT_SETTING else "")
+        print(f"{row['chunk_size']:>5} {row['overlap']:>7} {row['k']:>3} {row['recall']:>9.1%} "
+              f"{row['context_tokens']:>8.0f} {row['chunks']:>7} {row['index_mb']:>9.2f} {row['ingest_s']:>9.1f} "
+              f"{row['search_p50_ms']:>10.3f} {marks}")
+    print("-" * 92)
+
+    current = next((row for row in rows if setting(row) == CURRENT_SETTING), None)
+    if current is not None:
+        keeps_recall = [row for row in rows if row["recall"] >= current["recall"]]
+        cheapest = min(keeps_recall, key=lambda row: row["context_tokens"])
+        print(f"current 500/50 k=3: recall {current['recall']:.1%}, {current['context_tokens']:.0f} context tokens; "
+              f"cheapest with the same recall: {cheapest['chunk_size']}/{cheapest['overlap']} k={cheapest['k']} "
+              f"({cheapest['context_tokens']:.0f} tokens, {1 - cheapest['context_tokens'] / current['context_tokens']:.0%}"
+              f" fewer)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "pareto": sorted(front), "options": vars(args)}, f, indent=2, sort_keys=True)
+        print(f"rows written to {args.output}")
+
+    if failed:
+        print(f"FAIL: {len(failed)} settings could not be built: {failed}")
+        sys.exit(1)
+    print(f"OK: {len(rows)} settings scored, {len(front)} on the Pareto front")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Cold start: base model + LoRA merge on every start vs. the cached merged artifact
+(src/model_artifact.py), plus the import cost of the API modules.
+
+A stub Llama model and a random LoRA adapter are written to a temporary directory;
+every measurement runs in a fresh subprocess so nothing is shared:
+  api import   import src.chat_engine (what src.api pulls in), must not pull in torch
+  merge        from_pretrained(base) + PeftModel.from_pretrained + merge_and_unload
+  artifact     from_pretrained(merged safetensors artifact, memory mapped)
+Library imports (torch, transformers, peft) are timed separately from loading.
+
+Checks that both load paths produce identical greedy output.
+
+Usage (from the project root, needs peft):
+    python benchmarks/bench_cold_start.py [--hidden-size 1024] [--layers 8]
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+from benchmarks.workload import peak_rss_mb
+
+PROMPT_IDS = [1, 40, 41, 42, 43, 44, 45, 46]
+
+
+def measure(args):
+    if args.run == "prepare":
+        version, build_seconds = prepare(args.workdir, args.hidden_size, args.layers)
+        print(json.dumps({"version": version, "build_seconds": build_seconds}))
+        return
+
+    start = time.perf_counter()
+    import torch
+    from transformers import AutoModelForCausalLM
+    # transformers imports the model class lazily on first use; keep that out of the load timing
+    importlib.import_module("transformers.models.llama.modeling_llama")
+    if args.run == "merge":
+        from peft import PeftModel
+    else:
+        from src.model_artifact import find_artifact
+    import_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.run == "merge":
+        model = AutoModelForCausalLM.from_pretrained(os.path.join(args.workdir, "base"), torch_dtype=torch.float32)
+        model = PeftModel.from_pretrained(model, os.path.join(args.workdir, "adapter")).merge_and_unload()
+    else:
+        model = AutoModelForCausalLM.from_pretrained(find_artifact(os.path.join(args.workdir, "merged"), args.version),
+                                                     torch_dtype=torch.float32)
+    seconds = time.perf_counter() - start
+    with torch.no_grad():
+        output = model.generate(torch.tensor([PROMPT_IDS]), max_new_tokens=16, do_sample=False)
+    print(json.dumps({"import_seconds": import_seconds, "seconds": seconds, "peak_rss_mb": peak_rss_mb(),
+                      "output": output[0].tolist()}))
+
+
+def measure_api_import():
+    """Fresh interpreter importing src.chat_engine (what src.api pulls in at import time)."""
+    code = ("import json, sys, time; start = time.perf_counter(); import src.chat_engine; "
+            "print(json.dumps({'seconds': time.perf_counter() - start, 'torch_imported': 'torch' in sys.modules}))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.getcwd())
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def prepare(workdir, hidden_size, layers):
+    """Writes base model, LoRA adapter and the merged artifact; returns the artifact version."""
+    import torch
+    from peft import LoraConfig, PeftModel, get_peft_model
+
+    from benchmarks.stub_models import make_stub_causal_lm
+    from src.model_artifact import artifact_version, write_artifact
+
+    base_dir, adapter_dir = os.path.join(workdir, "base"), os.path.join(workdir, "adapter")
+    model, tokenizer = make_stub_causal_lm(hidden_size=hidden_size, layers=layers)
+    model.save_pretrained(base_dir, safe_serialization=True)
+    lora = get_peft_model(model, LoraConfig(r=8, lora_alpha=16, target_modules=["q_proj", "v_proj"],
+                                            init_lora_weights=False))
+    lora.save_pretrained(adapter_dir)
+
+    start = time.perf_counter()
+    merged = PeftModel.from_pretrained(make_stub_causal_lm(hidden_size=hidden_size, layers=layers)[0],
+                                       adapter_dir).merge_and_unload()
+    version = artifact_version(base_dir, adapter_dir, str(torch.float32))
+    write_artifact(merged, tokenizer, os.path.join(workdir, "merged"), version, base_dir, adapter_dir,
+                   str(torch.float32))
+    return version, time.perf_counter() - start
+
+
+def run(mode, workdir, version="", extra=()):
+    # Every phase (also preparation) runs in its own process: peak RSS is inherited across fork
+    output = subprocess.run([sys.executable, __file__, "--run", mode, "--workdir", workdir, "--version", version,
+                             *extra], capture_output=True, text=True, check=True, cwd=os.getcwd())
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hidden-size", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--run", choices=("prepare", "merge", "artifact"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--version", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        measure(args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        prepared = run("prepare", workdir, extra=("--hidden-size", str(args.hidden_size), "--layers", str(args.layers)))
+        results = {mode: [run(mode, workdir, prepared["version"]) for _ in range(args.repeats)]
+                   for mode in ("merge", "artifact")}
+    api_imports = [measure_api_import() for _ in range(args.repeats)]
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    print("-" * 66)
+    print(f"stub model: hidden {args.hidden_size}, {args.layers} layers; "
+          f"artifact built once in {prepared['build_seconds']:.2f}s")
+    print(f"api import (src.chat_engine): {median([r['seconds'] for r in api_imports]):.3f}s")
+    print(f"{'model load':<10} {'imports s':>10} {'load s':>8} {'peak RSS':>10}")
+    for mode, rows in results.items():
+        print(f"{mode:<10} {median([r['import_seconds'] for r in rows]):>10.3f} "
+              f"{median([r['seconds'] for r in rows]):>8.3f} {median([r['peak_rss_mb'] for r in rows]):>8.0f}MB")
+    speedup = median([r["seconds"] for r in results["merge"]]) / median([r["seconds"] for r in results["artifact"]])
+    print(f"artifact load vs base + merge: {speedup:.2f}x faster")
+    print("-" * 66)
+
+    if any(r["torch_imported"] for r in api_imports):
+        print("FAIL: importing src.chat_engine loads torch")
+        sys.exit(1)
+    if results["merge"][0]["output"] != results["artifact"][0]["output"]:
+        print("FAIL: merged artifact generates differently from base + LoRA merge")
+        sys.exit(1)
+    print("OK: merged artifact matches base + LoRA and API imports stay light")
+
+
+if __name__ == "__main__":
+    main()
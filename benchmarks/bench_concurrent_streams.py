@@ -0,0 +1,93 @@
+"""
+Concurrency check for the /chat/stream event generator.
+
+Simulates N simultaneous requests whose retrieval and token generation block (like
+similarity_search_with_score and TextIteratorStreamer do) and compares:
+  blocking : the previous pattern, sync calls on the event loop + asyncio.sleep(0.01) per token
+  threaded : asyncio.to_thread for retrieval + stream_in_thread with frame coalescing
+
+With the threaded path N streams should finish in about the time of one stream.
+No model or network needed.
+
+Usage (from the project root):
+    python benchmarks/bench_concurrent_streams.py [--streams 8] [--tokens 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+from src.streaming import stream_in_thread
+
+RETRIEVAL_SECONDS = 0.05
+DECODE_SECONDS_PER_TOKEN = 0.005
+
+
+def blocking_retrieval():
+    time.sleep(RETRIEVAL_SECONDS)
+    return ["doc"]
+
+
+def blocking_tokens(count: int):
+    for i in range(count):
+        time.sleep(DECODE_SECONDS_PER_TOKEN)
+        yield f"tok{i} "
+
+
+async def blocking_stream(tokens: int):
+    blocking_retrieval()
+    frames = 0
+    for _ in blocking_tokens(tokens):
+        frames += 1
+        await asyncio.sleep(0.01)
+    return frames
+
+
+async def threaded_stream(tokens: int):
+    await asyncio.to_thread(blocking_retrieval)
+    frames = 0
+    async for _ in stream_in_thread(blocking_tokens(tokens), flush_chars=32, flush_interval=0.05):
+        frames += 1
+    return frames
+
+
+async def run(stream_fn, streams: int, tokens: int):
+    start = time.perf_counter()
+    frames = await asyncio.gather(*(stream_fn(tokens) for _ in range(streams)))
+    return time.perf_counter() - start, sum(frames)
+
+
+async def main_async(streams: int, tokens: int):
+    single_blocking, _ = await run(blocking_stream, 1, tokens)
+    single_threaded, _ = await run(threaded_stream, 1, tokens)
+    many_blocking, blocking_frames = await run(blocking_stream, streams, tokens)
+    many_threaded, threaded_frames = await run(threaded_stream, streams, tokens)
+
+    print("-" * 64)
+    print(f"{'path':<10} {'1 stream':>10} {f'{streams} streams':>12} {'slowdown':>9} {'frames':>8} {'tok/s':>9}")
+    for name, single, many, frames in (("blocking", single_blocking, many_blocking, blocking_frames),
+                                       ("threaded", single_threaded, many_threaded, threaded_frames)):
+        print(f"{name:<10} {single:>9.2f}s {many:>11.2f}s {many / single:>8.1f}x {frames:>8} "
+              f"{streams * tokens / many:>9.0f}")
+    print("-" * 64)
+
+    # The threaded path must not serialize: N streams should take far less than N x one stream
+    if many_threaded > single_threaded * max(2.0, streams / 2):
+        print("FAIL: concurrent streams serialize on the event loop")
+        sys.exit(1)
+    print("OK: concurrent streams run in parallel")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.streams, args.tokens))
+
+
+if __name__ == "__main__":
+    main()
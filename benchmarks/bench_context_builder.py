@@ -0,0 +1,131 @@
+"""
+Prompt context size with ContextBuilder (merged neighbours, overlap removal, token
+budget) vs. plain format_docs, for the data.jsonl questions.
+
+Chunks are retrieved with the BM25 index built from chroma_db (no embedding model
+needed), --k per question plus --neighbours adjacent chunk_index pieces of every hit,
+the way an article lookup returns several chunks of one article. Reports:
+  tokens     prompt context tokens (mean / p95), measured with --tokenizer
+  build us   ContextBuilder.build latency (p50)
+  R          gold answer contained in the context
+
+Also checks that merging is lossless: every chunk of every article in the corpus,
+merged with its neighbours, is still contained in the merged passage.
+
+Usage (from the project root, after ingest_data.py):
+    python benchmarks/bench_context_builder.py [--k 3] [--budget 3000] [--tokenizer google/gemma-3-4b-it]
+    --tokenizer regex counts words and punctuation instead (offline approximation)
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.getcwd())
+
+from langchain_core.documents import Document
+
+from benchmarks.workload import answer_found, load_corpus, load_qa, percentile
+from src.context_builder import ContextBuilder, strip_article_prefix
+from src.lexical_index import LexicalIndex
+
+_REGEX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def token_counter(name):
+    if name == "regex":
+        return lambda text: len(_REGEX_TOKEN.findall(text))
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def check_lossless(builder, docs):
+    """Returns the number of chunks whose text is missing from their merged article passage."""
+    by_article = defaultdict(list)
+    for doc in docs:
+        by_article[(doc.metadata.get("source_file"), doc.metadata.get("article_number"))].append(doc)
+    missing = 0
+    for members in by_article.values():
+        for passage in builder.build([(doc, None) for doc in members]).passages:
+            for doc in passage.documents:
+                body = strip_article_prefix(doc.page_content, doc.metadata.get("article_number"))
+                missing += body not in passage.text
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-dir", default="chroma_db")
+    parser.add_argument("--qa", default="data.jsonl")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--neighbours", type=int, default=1)
+    parser.add_argument("--budget", type=int, default=3000)
+    parser.add_argument("--tokenizer", default="google/gemma-3-4b-it")
+    args = parser.parse_args()
+
+    ids, texts, metadatas = load_corpus(args.persist_dir)
+    if not ids:
+        print(f"FAIL: no chunks in {args.persist_dir}, run ingest_data.py first")
+        sys.exit(1)
+    docs = [Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+    docs_by_id = dict(zip(ids, docs))
+    position = {(d.metadata.get("source_file"), d.metadata.get("article_number"), d.metadata.get("chunk_index")): d
+                for d in docs}
+    count_tokens = token_counter(args.tokenizer)
+    index = LexicalIndex.build(ids, texts)
+    qa = load_qa(args.qa)
+
+    plain = ContextBuilder(count_tokens)
+    budgeted = ContextBuilder(count_tokens, token_budget=args.budget)
+    rows = {"format_docs": ([], []), "merged": ([], []), f"merged+budget{args.budget}": ([], [])}
+    latencies = []
+    for pair in qa:
+        retrieved = []
+        for chunk_id, _ in index.search(pair["question"], args.k):
+            hit = docs_by_id[chunk_id]
+            key = (hit.metadata.get("source_file"), hit.metadata.get("article_number"))
+            chunk_index = hit.metadata.get("chunk_index", 0)
+            for offset in range(-args.neighbours, args.neighbours + 1):
+                doc = hit if offset == 0 else position.get(key + (chunk_index + offset,))
+                if doc is not None and doc not in retrieved:
+                    retrieved.append(doc)
+        candidates = [(doc, None) for doc in retrieved]
+
+        merged = plain.build(candidates)
+        start = time.perf_counter()
+        packed = budgeted.build(candidates)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        for name, tokens, text in (("format_docs", merged.original_tokens, None),
+                                   ("merged", merged.tokens, merged.text),
+                                   (f"merged+budget{args.budget}", packed.tokens, packed.text)):
+            context = text if text is not None else " ".join(doc.page_content for doc in retrieved)
+            rows[name][0].append(tokens)
+            rows[name][1].append(answer_found(pair["answer"], [context]))
+
+    lost = check_lossless(plain, docs)
+
+    print("-" * 64)
+    print(f"{len(qa)} questions, k={args.k} + {args.neighbours} neighbours, tokenizer {args.tokenizer}")
+    print(f"{'context':<22} {'mean tok':>9} {'p95 tok':>8} {'saved':>7} {'R':>7}")
+    baseline = sum(rows["format_docs"][0])
+    for name, (tokens, found) in rows.items():
+        print(f"{name:<22} {sum(tokens) / len(tokens):>9.0f} {percentile(tokens, 95):>8.0f} "
+              f"{1 - sum(tokens) / baseline:>7.1%} {sum(found) / len(found):>7.1%}")
+    print(f"ContextBuilder.build p50: {percentile(latencies, 50):.0f} us (incl. token counting)")
+    print("-" * 64)
+
+    if lost:
+        print(f"FAIL: {lost} chunks are not contained in their merged passage")
+        sys.exit(1)
+    if sum(rows["merged"][1]) < sum(rows["format_docs"][1]):
+        print("FAIL: merging loses answers that format_docs contained")
+        sys.exit(1)
+    print("OK: merged context is lossless and shorter")
+
+
+if __name__ == "__main__":
+    main()
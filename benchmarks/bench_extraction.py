@@ -0,0 +1,214 @@
+"""
+PDF extraction + article splitting, as done by ingest_data.py, on one large synthetic
+gazette followed by the corpus PDFs:
+
+  baseline   the previous path: every page joined into one string, split_text -> chunk list
+  stream     PDFExtractor.iter_pages() consumed by TextSplitter.iter_chunks (no cache)
+  parallel   as stream, pages extracted in PAGES_PER_TASK ranges on a --workers process pool
+  cached     as stream, pages read from a filled extraction cache (the second ingest of a PDF)
+
+The gazette is made of --pages corpus pages, each stamped with a gazette title and a
+"Sayfa N" footer, the repeated lines strip_repeated_lines must remove. Every mode runs
+in its own process and reports:
+  seconds    extraction + splitting of all PDFs (parallel: pool already started)
+  pages/s    pages per second
+  heap MB    Python heap peak (tracemalloc, separate pass) of the gazette
+  RSS MB     peak resident memory of the process
+Checks that stream, parallel and cached produce the same chunks, that they equal the
+baseline chunks wherever no header line was removed, that exactly the stamped lines
+(and only those) are removed from the gazette, that streaming lowers the heap peak of a
+first extraction below the baseline, and that cached runs are faster than stream.
+
+Usage (from the project root):
+    python benchmarks/bench_extraction.py [--pages 600] [--workers 4]
+    --encoder stub   WordPiece vocab built from the corpus instead of the model's
+                     tokenizer, for machines without the model in the HF cache
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.getcwd())
+
+DEFAULT_ENCODER = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
+MODES = ("baseline", "stream", "parallel", "cached")
+GAZETTE_TITLE = "RESMI GAZETE 12 Ekim 2024 CUMARTESI Sayi : 32690"
+
+
+def chunk_digest(chunks) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(json.dumps(chunk, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_gazette(path: str, sources, page_count: int):
+    import fitz  # type: ignore
+
+    gazette = fitz.open()
+    while gazette.page_count < page_count:
+        for source in sources:
+            with fitz.open(source) as doc:
+                gazette.insert_pdf(doc, to_page=min(doc.page_count, page_count - gazette.page_count) - 1)
+            if gazette.page_count >= page_count:
+                break
+    for number, page in enumerate(gazette, start=1):
+        page.insert_text((72, 30), GAZETTE_TITLE, fontsize=8)
+        page.insert_text((280, page.rect.height - 20), f"Sayfa {number}", fontsize=8)
+    gazette.save(path)
+    gazette.close()
+
+
+def split_file(mode, splitter, path, cache_dir, pool):
+    import fitz  # type: ignore
+    from src.pdf_extractor import PDFExtractor
+
+    metadata = {"source_file": os.path.basename(path), "document_title": os.path.basename(path)[:-4]}
+    if mode == "baseline":
+        with fitz.open(path) as doc:
+            text = "\n".join(page.get_text() for page in doc)
+        return splitter.split_text(text, metadata), 0
+    extractor = PDFExtractor(path, cache_dir=cache_dir if mode in ("cached", "fill") else None)
+    chunks = list(splitter.iter_chunks(extractor.iter_pages(pool if mode == "parallel" else None), metadata))
+    return chunks, extractor.removed_lines
+
+
+def measure(args):
+    import fitz  # type: ignore
+    from benchmarks.workload import peak_rss_mb
+    from src.text_splitter import TextSplitter
+
+    splitter = TextSplitter(model_name=args.encoder_path)
+    files = [args.gazette] + sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+    cache_dir = os.path.join(args.workdir, "extraction_cache")
+    pool = None
+    if args.run == "parallel":
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+        list(pool.map(abs, range(args.workers)))  # start the workers outside the timing
+
+    pages = 0
+    for path in files:
+        with fitz.open(path) as doc:
+            pages += doc.page_count
+
+    results = {}
+    start = time.perf_counter()
+    for path in files:
+        chunks, removed = split_file(args.run, splitter, path, cache_dir, pool)
+        results[os.path.basename(path)] = {"digest": chunk_digest(chunks), "chunks": len(chunks), "removed": removed}
+    seconds = time.perf_counter() - start
+
+    # Heap peak of the gazette alone; a second pass, tracemalloc slows allocation down
+    tracemalloc.start()
+    split_file(args.run, splitter, args.gazette, cache_dir, pool)
+    heap_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    if pool is not None:
+        pool.shutdown()
+
+    print(json.dumps({"seconds": seconds, "pages": pages, "heap_mb": heap_peak, "rss_mb": peak_rss_mb(),
+                      "files": results}))
+
+
+def run(mode, args, gazette, encoder_path, workdir):
+    output = subprocess.run([sys.executable, __file__, "--run", mode, "--gazette", gazette, "--encoder-path",
+                             encoder_path, "--workdir", workdir, "--data-dir", args.data_dir, "--workers",
+                             str(args.workers)], capture_output=True, text=True, check=True, cwd=os.getcwd())
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def check_gazette(gazette, sources, page_count):
+    """The cleaned gazette pages must equal the unstamped source pages."""
+    import fitz  # type: ignore
+    from src.pdf_extractor import PDFExtractor
+
+    expected = []
+    while len(expected) < page_count:
+        for source in sources:
+            with fitz.open(source) as doc:
+                expected.extend(page.get_text() for page in doc)
+    expected = expected[:page_count]
+    extractor = PDFExtractor(gazette)
+    return extractor.extract_pages() == expected, extractor.removed_lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default="ENERJI DATA")
+    parser.add_argument("--pages", type=int, default=600, help="pages of the synthetic gazette")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER, help="tokenizer model name/path, or 'stub'")
+    parser.add_argument("--run", choices=MODES + ("fill",), help=argparse.SUPPRESS)
+    parser.add_argument("--gazette", help=argparse.SUPPRESS)
+    parser.add_argument("--encoder-path", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        measure(args)
+        return
+
+    from benchmarks.stub_models import write_stub_encoder
+    from src.pdf_extractor import PDFExtractor
+
+    sources = sorted(glob.glob(os.path.join(args.data_dir, "*.pdf")))
+    with tempfile.TemporaryDirectory() as workdir:
+        gazette = os.path.join(workdir, "gazette.pdf")
+        build_gazette(gazette, sources, args.pages)
+        encoder = args.encoder
+        if encoder == "stub":
+            texts = ["\n".join(PDFExtractor(source).iter_pages()) for source in sources]
+            encoder = write_stub_encoder(os.path.join(workdir, "encoder"), texts, hidden_size=64, layers=1, heads=1,
+                                         vocab_size=4000)
+        gazette_clean, gazette_removed = check_gazette(gazette, sources, args.pages)
+        run("fill", args, gazette, encoder, workdir)
+        results = {mode: run(mode, args, gazette, encoder, workdir) for mode in MODES}
+
+    print("-" * 72)
+    print(f"gazette of {args.pages} pages + {len(sources)} corpus PDFs, {args.workers} workers, "
+          f"encoder {args.encoder}")
+    print(f"{'mode':<10} {'seconds':>8} {'pages/s':>8} {'chunks':>7} {'heap MB':>8} {'RSS MB':>7}")
+    for mode, r in results.items():
+        chunks = sum(f["chunks"] for f in r["files"].values())
+        print(f"{mode:<10} {r['seconds']:>8.2f} {r['pages'] / r['seconds']:>8.0f} {chunks:>7} "
+              f"{r['heap_mb']:>8.1f} {r['rss_mb']:>7.0f}")
+    removed = {name: f["removed"] for name, f in results["stream"]["files"].items() if f["removed"]}
+    print(f"header/footer lines removed: {removed or 'none'}")
+    print("-" * 72)
+
+    stream = results["stream"]["files"]
+    for mode in ("parallel", "cached"):
+        if results[mode]["files"] != stream:
+            print(f"FAIL: {mode} chunks differ from stream chunks")
+            sys.exit(1)
+    changed = [name for name, f in stream.items()
+               if not f["removed"] and f["digest"] != results["baseline"]["files"][name]["digest"]]
+    if changed:
+        print(f"FAIL: streamed chunks differ from the baseline for {changed}")
+        sys.exit(1)
+    if not gazette_clean or gazette_removed != 2 * args.pages:
+        print(f"FAIL: gazette cleaning removed {gazette_removed} lines (expected {2 * args.pages}) "
+              f"or changed body text")
+        sys.exit(1)
+    if results["stream"]["heap_mb"] >= results["baseline"]["heap_mb"]:
+        print(f"FAIL: streamed extraction peaks at {results['stream']['heap_mb']:.1f} MB heap, "
+              f"baseline {results['baseline']['heap_mb']:.1f} MB")
+        sys.exit(1)
+    speedup = results["stream"]["seconds"] / results["cached"]["seconds"]
+    if speedup <= 1.0:
+        print(f"FAIL: cached extraction is not faster ({speedup:.2f}x)")
+        sys.exit(1)
+    print(f"OK: same chunks in every mode, gazette headers removed, heap peak "
+          f"{results['baseline']['heap_mb']:.1f} -> {results['stream']['heap_mb']:.1f} MB, cached run {speedup:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
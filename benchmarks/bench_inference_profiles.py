@@ -0,0 +1,189 @@
+"""
+Inference profiles on CPU: bfloat16 (the default load dtype), float32 and cpu-int8
+(dynamic int8 Linear layers, src/cpu_profile.py) for the generator and the
+embedding encoder.
+
+Stub models (random Llama causal LM, random BERT-base-sized encoder) are written to
+a temporary directory; every profile runs in a fresh subprocess and reports:
+  load s        model load (cpu-int8: quantize + verify + cache; "cached": from the cache)
+  tok/s         greedy decode tokens/s, batch 1
+  emb/s         encoder embeddings/s, batch --embed-batch x --embed-tokens tokens
+  RSS           peak resident memory of the process
+  KL / top1     mean KL and top-1 agreement of the next-token distributions vs. float32
+  cos           min embedding cosine vs. float32
+Random weights give near-flat logits, so top-1 agreement is low for any rounding;
+the generator is judged by KL (src/cpu_profile.MAX_MEAN_KL).
+
+Usage (from the project root):
+    python benchmarks/bench_inference_profiles.py [--threads 8] [--new-tokens 64]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from benchmarks.workload import peak_rss_mb
+
+PROFILES = ("bf16", "fp32", "cpu-int8", "cpu-int8 cached")
+PROMPT_IDS = list(range(2, 66))
+
+
+def prepare(workdir, args):
+    import torch
+    from transformers import BertConfig, BertModel
+
+    from benchmarks.stub_models import make_stub_causal_lm
+
+    model, _ = make_stub_causal_lm(hidden_size=args.hidden_size, layers=args.layers)
+    model.save_pretrained(os.path.join(workdir, "generator"), safe_serialization=True)
+    torch.manual_seed(0)
+    encoder = BertModel(BertConfig(vocab_size=32000, hidden_size=768, num_hidden_layers=12, num_attention_heads=12,
+                                   intermediate_size=3072)).eval()
+    encoder.save_pretrained(os.path.join(workdir, "encoder"), safe_serialization=True)
+
+
+def mean_pool(model, input_ids):
+    import torch
+
+    with torch.no_grad():
+        hidden = model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids)).last_hidden_state
+    return hidden.mean(dim=1).float().numpy()
+
+
+def measure(profile, workdir, args):
+    import torch
+    from transformers import AutoConfig, AutoModel, AutoModelForCausalLM
+
+    from benchmarks.stub_models import StubTokenizer
+    from src.cpu_profile import (configure_threads, empty_skeleton, load_quantized, quantize_encoder,
+                                 quantize_generator)
+
+    configure_threads(args.threads)
+    generator_dir, encoder_dir = os.path.join(workdir, "generator"), os.path.join(workdir, "encoder")
+    embed_ids = torch.randint(5, 32000, (args.embed_batch, args.embed_tokens), generator=torch.Generator().manual_seed(0))
+
+    start = time.perf_counter()
+    if profile.startswith("cpu-int8"):
+        cache = os.path.join(workdir, "int8")
+        generator = load_quantized(lambda: empty_skeleton(
+            lambda: AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(generator_dir))), os.path.join(cache, "generator"))
+        if generator is None:
+            generator = quantize_generator(AutoModelForCausalLM.from_pretrained(generator_dir, torch_dtype=torch.float32),
+                                           StubTokenizer(), "".join(chr(97 + i % 26) for i in range(256)),
+                                           cache_dir=os.path.join(cache, "generator"))
+        encoder = AutoModel.from_pretrained(encoder_dir, torch_dtype=torch.float32)
+        encoder = quantize_encoder(encoder, lambda model: mean_pool(model, embed_ids[:4]),
+                                   cache_dir=os.path.join(cache, "encoder"))
+    else:
+        dtype = torch.bfloat16 if profile == "bf16" else torch.float32
+        generator = AutoModelForCausalLM.from_pretrained(generator_dir, torch_dtype=dtype)
+        encoder = AutoModel.from_pretrained(encoder_dir, torch_dtype=dtype)
+    load_seconds = time.perf_counter() - start
+    generator.eval()
+    encoder.eval()
+
+    with torch.no_grad():
+        generator.generate(torch.tensor([PROMPT_IDS]), max_new_tokens=4, do_sample=False)  # warmup
+        start = time.perf_counter()
+        output = generator.generate(torch.tensor([PROMPT_IDS]), max_new_tokens=args.new_tokens, do_sample=False,
+                                    min_new_tokens=args.new_tokens)
+        decode_seconds = time.perf_counter() - start
+        probe = torch.tensor([PROMPT_IDS * 4])
+        logits = generator(input_ids=probe).logits[0].float().numpy()
+
+    mean_pool(encoder, embed_ids[:2])  # warmup
+    start = time.perf_counter()
+    vectors = mean_pool(encoder, embed_ids)
+    embed_seconds = time.perf_counter() - start
+    np.savez(os.path.join(workdir, f"{profile.replace(' ', '_')}.npz"), vectors=vectors, logits=logits)
+
+    print(json.dumps({
+        "load_s": load_seconds,
+        "tok_s": args.new_tokens / decode_seconds,
+        "emb_s": args.embed_batch / embed_seconds,
+        "rss_mb": peak_rss_mb(),
+        "generated": output[0].tolist(),
+    }))
+
+
+def run(mode, workdir, args):
+    command = [sys.executable, __file__, "--run", mode, "--workdir", workdir,
+               "--hidden-size", str(args.hidden_size), "--layers", str(args.layers),
+               "--new-tokens", str(args.new_tokens), "--embed-batch", str(args.embed_batch),
+               "--embed-tokens", str(args.embed_tokens)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    output = subprocess.run(command, capture_output=True, text=True, cwd=os.getcwd())
+    if output.returncode != 0:
+        print(output.stderr[-2000:])
+        print(f"FAIL: {mode} run failed")
+        sys.exit(1)
+    lines = output.stdout.strip().splitlines()
+    return json.loads(lines[-1]) if lines else {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hidden-size", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--embed-batch", type=int, default=32)
+    parser.add_argument("--embed-tokens", type=int, default=128)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--run", choices=("prepare",) + PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run == "prepare":
+        prepare(args.workdir, args)
+        return
+    if args.run:
+        measure(args.run, args.workdir, args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        run("prepare", workdir, args)
+        results = {profile: run(profile, workdir, args) for profile in PROFILES}
+        outputs = {profile: dict(np.load(os.path.join(workdir, f"{profile.replace(' ', '_')}.npz")))
+                   for profile in PROFILES}
+
+    from src.cpu_profile import MAX_MEAN_KL, MIN_EMBEDDING_COSINE, embedding_cosine
+
+    def log_softmax(logits):
+        shifted = logits - logits.max(axis=-1, keepdims=True)
+        return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+    reference = log_softmax(outputs["fp32"]["logits"])
+    print("-" * 80)
+    print(f"generator: stub Llama hidden {args.hidden_size} x {args.layers} layers; encoder: BERT-base size; "
+          f"threads {args.threads or os.cpu_count()}")
+    print(f"{'profile':<16} {'load s':>7} {'tok/s':>8} {'emb/s':>8} {'RSS':>8} {'KL':>8} {'top1':>6} {'cos':>8}")
+    quality = {}
+    for profile, r in results.items():
+        candidate = log_softmax(outputs[profile]["logits"])
+        kl = float(np.mean(np.sum(np.exp(reference) * (reference - candidate), axis=-1)))
+        top1 = float(np.mean(reference.argmax(-1) == candidate.argmax(-1)))
+        cosine = embedding_cosine(outputs["fp32"]["vectors"], outputs[profile]["vectors"])
+        quality[profile] = (kl, cosine)
+        print(f"{profile:<16} {r['load_s']:>7.2f} {r['tok_s']:>8.1f} {r['emb_s']:>8.1f} {r['rss_mb']:>6.0f}MB "
+              f"{kl:>8.4f} {top1:>6.1%} {cosine:>8.4f}")
+    print("-" * 80)
+
+    if results["cpu-int8"]["generated"] != results["cpu-int8 cached"]["generated"]:
+        print("FAIL: the cached int8 model generates differently from the freshly quantized one")
+        sys.exit(1)
+    kl, cosine = quality["cpu-int8"]
+    if kl > MAX_MEAN_KL or cosine < MIN_EMBEDDING_COSINE:
+        print(f"FAIL: cpu-int8 outside tolerance (KL {kl:.4f}, cosine {cosine:.4f})")
+        sys.exit(1)
+    print("OK: cpu-int8 within tolerance and the cached artifact reproduces it")
+
+
+if __name__ == "__main__":
+    main()
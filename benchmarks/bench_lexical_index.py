@@ -0,0 +1,116 @@
+"""
+BM25 lexical index vs. dense retrieval on the data.jsonl questions.
+
+Builds the index from the chunks in chroma_db, checks that the saved .npz reloads to
+identical rankings, then reports per-query latency (p50/p95/p99) and recall@k
+(gold answer contained in one of the top-k chunks) for:
+  lexical : BM25 only
+  dense   : Chroma vector search (with --dense, loads the embedding model)
+  hybrid  : reciprocal rank fusion of both
+
+Usage (from the project root, after ingest_data.py):
+    python benchmarks/bench_lexical_index.py [--k 3] [--dense] [--no-stemming]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+from benchmarks.workload import answer_found, load_corpus, load_qa, percentile
+from src.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+MAX_P50_MICROSECONDS = 1000.0
+
+
+def recall(rankings, qa, texts_by_id, k):
+    found = sum(answer_found(pair["answer"], [texts_by_id[i] for i in ranking[:k] if i in texts_by_id])
+                for ranking, pair in zip(rankings, qa))
+    return found / len(qa) if qa else 0.0
+
+
+def dense_rankings(persist_dir, questions, candidates):
+    from src.rag_pipeline import RAGPipeline
+
+    with RAGPipeline(persist_directory=persist_dir, embedding_cache_dir=None) as pipeline:
+        embeddings = pipeline.compute_embeddings(questions)
+        latencies = []
+        rankings = []
+        for embedding in embeddings:
+            start = time.perf_counter()
+            result = pipeline.worker.query(embedding[None, :], n_results=candidates)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            rankings.append(result["ids"][0])
+    return rankings, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-dir", default="chroma_db")
+    parser.add_argument("--qa", default="data.jsonl")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fusion-candidates", type=int, default=4)
+    parser.add_argument("--dense", action="store_true", help="also run dense and hybrid retrieval")
+    parser.add_argument("--no-stemming", action="store_true")
+    args = parser.parse_args()
+
+    ids, texts, _ = load_corpus(args.persist_dir)
+    if not ids:
+        print(f"FAIL: no chunks in {args.persist_dir}, run ingest_data.py first")
+        sys.exit(1)
+    texts_by_id = dict(zip(ids, texts))
+    qa = load_qa(args.qa)
+    questions = [pair["question"] for pair in qa]
+    candidates = args.k * args.fusion_candidates
+
+    start = time.perf_counter()
+    index = LexicalIndex.build(ids, texts, stemming=not args.no_stemming)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lexical_index.npz")
+        index.save(path)
+        index_bytes = os.path.getsize(path)
+        reloaded = LexicalIndex.load(path)
+    if any(index.search(q, candidates) != reloaded.search(q, candidates) for q in questions):
+        print("FAIL: reloaded index ranks differently")
+        sys.exit(1)
+
+    for question in questions[:20]:  # warmup
+        index.search(question, candidates)
+    lexical, lexical_latencies = [], []
+    for question in questions:
+        start = time.perf_counter()
+        hits = index.search(question, candidates)
+        lexical_latencies.append((time.perf_counter() - start) * 1e6)
+        lexical.append([chunk_id for chunk_id, _ in hits])
+
+    rows = [("lexical", lexical_latencies, lexical)]
+    if args.dense:
+        dense, dense_latencies = dense_rankings(args.persist_dir, questions, candidates)
+        hybrid = [[chunk_id for chunk_id, _ in reciprocal_rank_fusion([d, l])] for d, l in zip(dense, lexical)]
+        rows.append(("dense", dense_latencies, dense))
+        rows.append(("hybrid", [d + l for d, l in zip(dense_latencies, lexical_latencies)], hybrid))
+
+    stats = index.stats()
+    print("-" * 72)
+    print(f"{stats['chunks']} chunks, {stats['terms']} terms, {stats['postings']} postings, "
+          f"{index_bytes / 1024:.0f} KiB on disk, built in {build_seconds:.2f}s")
+    print(f"{len(qa)} questions, recall = gold answer in top-k chunks")
+    print(f"{'method':<8} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {f'R@{args.k}':>7} {f'R@{candidates}':>7}")
+    for name, latencies, rankings in rows:
+        print(f"{name:<8} {percentile(latencies, 50):>9.0f} {percentile(latencies, 95):>9.0f} "
+              f"{percentile(latencies, 99):>9.0f} {recall(rankings, qa, texts_by_id, args.k):>7.1%} "
+              f"{recall(rankings, qa, texts_by_id, candidates):>7.1%}")
+    print("-" * 72)
+
+    if percentile(lexical_latencies, 50) > MAX_P50_MICROSECONDS:
+        print(f"FAIL: lexical p50 above {MAX_P50_MICROSECONDS:.0f} us")
+        sys.exit(1)
+    print("OK: lexical index answers in microseconds and reloads identically")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Embedding encoder: eager PyTorch (AutoModel + mean pooling, as in RAGPipeline) vs.
+the ONNX Runtime export with the pooling in the graph (src/onnx_encoder.py).
+
+Texts are the ingested chunks (chroma_db) and the questions in data.jsonl. The
+export (with its own parity check) happens once; every backend then runs in a
+fresh subprocess and reports:
+  load s     tokenizer + model / session creation
+  docs/s     chunk embedding throughput (length-bucketed batches, token budget 8192)
+  query ms   p50 / p95 latency of a single query, as on the chat path
+  RSS        peak resident memory of the process
+Checks that the vectors of both backends agree (lowest cosine > 0.999).
+
+Usage (from the project root, needs onnxruntime and onnxscript):
+    python benchmarks/bench_onnx_encoder.py [--docs 512] [--queries 200]
+    --model stub   random BERT-base weights and a WordPiece vocab built from the
+                   corpus, for machines without the model in the HF cache
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from benchmarks.workload import load_corpus, load_qa, peak_rss_mb, percentile
+
+DEFAULT_MODEL = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
+BACKENDS = ("torch", "onnx")
+
+
+def load_texts(args):
+    _, documents, _ = load_corpus(args.persist_dir)
+    queries = [pair["question"] for pair in load_qa(args.data)]
+    return [text for text in documents if text.strip()][:args.docs], queries[:args.queries]
+
+
+def torch_encode(model, tokenizer, texts, max_length=512):
+    """Same batching and pooling as RAGPipeline._encode / _forward."""
+    import torch
+
+    from src.embedding_batcher import plan_batches
+
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    embeddings = np.zeros((len(texts), model.config.hidden_size), dtype=np.float32)
+    for batch in plan_batches(lengths):
+        features = {key: [values[i] for i in batch] for key, values in encodings.items()}
+        inputs = tokenizer.pad(features, padding=True, return_tensors="pt")
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).float()
+        embeddings[batch] = ((hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)).numpy()
+    return embeddings
+
+
+def prepare(args):
+    from transformers import AutoModel, AutoTokenizer
+
+    from benchmarks.stub_models import write_stub_encoder
+    from src.onnx_encoder import export_encoder
+
+    model_path = args.model
+    if args.model == "stub":
+        model_path = os.path.join(args.workdir, "stub")
+        write_stub_encoder(model_path, sum(load_texts(args), []))
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+    start = time.perf_counter()
+    export_encoder(model, tokenizer, os.path.join(args.workdir, "onnx"), model_path,
+                   lambda texts: torch_encode(model, tokenizer, list(texts)))
+    print(json.dumps({"model_path": model_path, "export_seconds": time.perf_counter() - start}))
+
+
+def measure(backend, model_path, args):
+    documents, queries = load_texts(args)
+    start = time.perf_counter()
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if backend == "onnx":
+        from src.onnx_encoder import OnnxEncoder, find_encoder
+        encoder = OnnxEncoder(find_encoder(os.path.join(args.workdir, "onnx"), model_path))
+        encode = lambda texts: encoder.embed(tokenizer, texts)
+    else:
+        from transformers import AutoModel
+        model = AutoModel.from_pretrained(model_path).eval()
+        encode = lambda texts: torch_encode(model, tokenizer, texts)
+    load_seconds = time.perf_counter() - start
+
+    encode(queries[:2])  # warmup
+    start = time.perf_counter()
+    document_vectors = encode(documents)
+    docs_seconds = time.perf_counter() - start
+    latencies, query_vectors = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(encode([query])[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+    np.savez(os.path.join(args.workdir, f"{backend}.npz"), documents=document_vectors, queries=np.stack(query_vectors))
+    print(json.dumps({
+        "load_s": load_seconds,
+        "docs_s": len(documents) / docs_seconds,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "rss_mb": peak_rss_mb(),
+    }))
+
+
+def run(mode, args, model_path=""):
+    # Every backend (also the export) runs in its own process: peak RSS is inherited across fork
+    command = [sys.executable, __file__, "--run", mode, "--workdir", args.workdir, "--model", args.model,
+               "--model-path", model_path, "--docs", str(args.docs), "--queries", str(args.queries),
+               "--persist-dir", args.persist_dir, "--data", args.data]
+    output = subprocess.run(command, capture_output=True, text=True, cwd=os.getcwd())
+    if output.returncode != 0:
+        print(output.stderr[-2000:])
+        print(f"FAIL: {mode} run failed")
+        sys.exit(1)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="HF model name/path, or 'stub'")
+    parser.add_argument("--persist-dir", default="chroma_db")
+    parser.add_argument("--data", default="data.jsonl")
+    parser.add_argument("--docs", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--run", choices=("prepare",) + BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--model-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run == "prepare":
+        prepare(args)
+        return
+    if args.run:
+        measure(args.run, args.model_path, args)
+        return
+
+    from src.cpu_profile import embedding_cosine
+    from src.onnx_encoder import MIN_PARITY_COSINE
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        prepared = run("prepare", args)
+        results = {backend: run(backend, args, prepared["model_path"]) for backend in BACKENDS}
+        vectors = {backend: np.load(os.path.join(workdir, f"{backend}.npz")) for backend in BACKENDS}
+        cosine = min(embedding_cosine(vectors["torch"][key], vectors["onnx"][key]) for key in ("documents", "queries"))
+
+    print("-" * 64)
+    print(f"model {args.model}, {args.docs} chunks, {args.queries} queries, "
+          f"export {prepared['export_seconds']:.1f}s, threads {os.cpu_count()}")
+    print(f"{'backend':<8} {'load s':>7} {'docs/s':>8} {'query p50':>10} {'p95':>8} {'RSS':>8}")
+    for backend, r in results.items():
+        print(f"{backend:<8} {r['load_s']:>7.2f} {r['docs_s']:>8.1f} {r['p50_ms']:>8.1f}ms {r['p95_ms']:>6.1f}ms "
+              f"{r['rss_mb']:>6.0f}MB")
+    print(f"query p50 speedup: {results['torch']['p50_ms'] / results['onnx']['p50_ms']:.2f}x, "
+          f"lowest cosine torch vs onnx: {cosine:.6f}")
+    print("-" * 64)
+
+    if cosine <= MIN_PARITY_COSINE:
+        print(f"FAIL: ONNX vectors differ from torch (cosine {cosine:.6f} <= {MIN_PARITY_COSINE})")
+        sys.exit(1)
+    print("OK: ONNX encoder matches the torch path")
+
+
+if __name__ == "__main__":
+    main()
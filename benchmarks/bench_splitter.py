@@ -0,0 +1,114 @@
+"""
+Article splitter engines on one large regulation: the single-pass "offsets" engine
+(one tokenization per article buffer, cuts by token index) vs. the "recursive"
+LangChain RecursiveCharacterTextSplitter it replaces (src/text_splitter.py).
+
+The PDF is extracted once; every engine then splits it --repeats times and reports:
+  split ms     p50 wall time of TextSplitter.split_text over the whole document
+  chunks       number of chunks
+  max / mean   encoder tokens per chunk (re-tokenized, without the "MADDE n: " prefix)
+  sentence     share of cuts that end a sentence (".", "?", "!")
+  overlap      share of neighbouring chunk pairs whose overlap merge_overlapping finds
+Checks that the offsets engine is faster, keeps every chunk within max_tokens and
+produces the same articles (number, section, chunk metadata keys) as the recursive one.
+
+Usage (from the project root):
+    python benchmarks/bench_splitter.py [--pdf "ENERJI DATA/7.5.18985.pdf"] [--repeats 5]
+    --encoder stub   WordPiece vocab built from the document instead of the model's
+                     tokenizer, for machines without the model in the HF cache
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+from benchmarks.workload import percentile
+
+DEFAULT_ENCODER = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
+ENGINES = ("recursive", "offsets")
+
+
+def article_key(chunk):
+    metadata = chunk["metadata"]
+    return metadata["article_number"], metadata["section"], tuple(sorted(metadata))
+
+
+def measure(engine, encoder, text, args):
+    from src.context_builder import merge_overlapping
+    from src.text_splitter import TextSplitter
+
+    splitter = TextSplitter(model_name=encoder, max_tokens=args.max_tokens, overlap=args.overlap, engine=engine)
+    metadata = {"source_file": os.path.basename(args.pdf), "document_title": os.path.basename(args.pdf)[:-4]}
+    splitter.split_text(text, metadata)  # warmup
+    timings = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        chunks = splitter.split_text(text, metadata)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    bodies = [chunk["text"].split(": ", 1)[1] for chunk in chunks]
+    tokens = [len(splitter.tokenizer(body, add_special_tokens=False, verbose=False)["input_ids"]) for body in bodies]
+    pairs = [(left, right) for left, right, chunk in zip(bodies, bodies[1:], chunks[1:])
+             if chunk["metadata"]["chunk_index"] > 0]
+    sentence_cuts = sum(left.rstrip()[-1:] in ".?!" for left, _ in pairs)
+    overlaps = sum(len(merge_overlapping(left, right)) < len(left) + len(right) for left, right in pairs)
+    return {
+        "ms": percentile(timings, 50),
+        "chunks": len(chunks),
+        "max_tokens": max(tokens),
+        "mean_tokens": sum(tokens) / len(tokens),
+        "sentence": sentence_cuts / len(pairs) if pairs else 1.0,
+        "overlap": overlaps / len(pairs) if pairs else 1.0,
+        "articles": [article_key(chunk) for chunk in chunks if chunk["metadata"]["chunk_index"] == 0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=os.path.join("ENERJI DATA", "7.5.18985.pdf"))
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER, help="tokenizer model name/path, or 'stub'")
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    from benchmarks.stub_models import write_stub_encoder
+    from src.pdf_extractor import PDFExtractor
+
+    text = PDFExtractor(args.pdf).extract_text()
+    with tempfile.TemporaryDirectory() as workdir:
+        encoder = args.encoder
+        if encoder == "stub":
+            encoder = write_stub_encoder(os.path.join(workdir, "encoder"), [text], hidden_size=64, layers=1, heads=1,
+                                         vocab_size=4000)
+        results = {engine: measure(engine, encoder, text, args) for engine in ENGINES}
+
+    print("-" * 72)
+    print(f"{os.path.basename(args.pdf)}: {len(text)} chars, max_tokens {args.max_tokens}, overlap {args.overlap}, "
+          f"encoder {args.encoder}")
+    print(f"{'engine':<10} {'split ms':>9} {'chunks':>7} {'max tok':>8} {'mean tok':>9} {'sentence':>9} {'overlap':>8}")
+    for engine, r in results.items():
+        print(f"{engine:<10} {r['ms']:>9.1f} {r['chunks']:>7} {r['max_tokens']:>8} {r['mean_tokens']:>9.1f} "
+              f"{r['sentence']:>9.1%} {r['overlap']:>8.1%}")
+    speedup = results["recursive"]["ms"] / results["offsets"]["ms"]
+    print(f"speedup: {speedup:.2f}x")
+    print("-" * 72)
+
+    offsets = results["offsets"]
+    if offsets["articles"] != results["recursive"]["articles"]:
+        print("FAIL: the engines produce different articles or chunk metadata")
+        sys.exit(1)
+    if offsets["max_tokens"] > args.max_tokens:
+        print(f"FAIL: an offsets chunk has {offsets['max_tokens']} tokens (max {args.max_tokens})")
+        sys.exit(1)
+    if speedup <= 1.0:
+        print(f"FAIL: the offsets engine is not faster ({speedup:.2f}x)")
+        sys.exit(1)
+    print(f"OK: offsets engine {speedup:.1f}x faster with the same article metadata")
+
+
+if __name__ == "__main__":
+    main()
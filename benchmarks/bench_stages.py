@@ -0,0 +1,315 @@
+"""
+Stage-level benchmark suite: the PDFs in ENERJI DATA and the QA pairs in data.jsonl
+run through the ingest and chat paths, and every stage is timed on its own with
+the project's own code:
+
+  stage          one sample                                         throughput
+  extract        PDFExtractor.extract_text of one PDF               pages/s
+  split          TextSplitter.split_text of one extracted PDF       chars/s
+  embed_batch    one RAGPipeline.compute_embeddings batch (chunks)  texts/s
+  embed_query    RAGPipeline.compute_embeddings of one question     queries/s
+  vector_search  exact top-k over the embedded chunks (numpy store) queries/s
+  prompt         ContextBuilder + RAG_PROMPT_TEMPLATE + tokenize    prompts/s
+                 (what the API and get_rag_chain_streaming do)
+  prefill        forward pass over one prompt, KV cache built       tokens/s
+  decode         one greedy step with the KV cache                  tokens/s
+
+Runs on CPU without network: the encoder is a random BERT with a WordPiece vocab
+built from the extracted text (--encoder names a real model instead), generation
+uses the tiny stub Llama + character tokenizer from benchmarks/stub_models.py.
+Absolute numbers are therefore only comparable between runs with the same options;
+the options, the workload size and the commit are recorded next to the results.
+
+The result is JSON (sorted keys, fixed rounding) with count, mean/p50/p95/p99 ms
+and throughput per stage, so two runs diff cleanly. --baseline compares with an
+earlier result and fails if a stage's p50 got slower by more than --max-regression.
+
+Usage (from the project root):
+    python benchmarks/bench_stages.py [--output benchmarks/results/stages.json] [--baseline old.json]
+    python benchmarks/bench_stages.py --diff old.json new.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.getcwd())
+
+from benchmarks.workload import load_qa, percentile
+
+RESULT_FORMAT = 1
+STAGES = ("extract", "split", "embed_batch", "embed_query", "vector_search", "prompt", "prefill", "decode")
+
+
+class StageTimer:
+    """Per-stage samples: wall time of one call and the units it processed."""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.units: Dict[str, float] = {}
+        self.unit_names: Dict[str, str] = {}
+
+    def record(self, stage: str, seconds: float, units: float, unit_name: str):
+        self.samples.setdefault(stage, []).append(seconds)
+        self.units[stage] = self.units.get(stage, 0) + units
+        self.unit_names[stage] = unit_name
+
+    def time(self, stage: str, function, *args, units: float = 1, unit_name: str = "calls", **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.record(stage, time.perf_counter() - start, units, unit_name)
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        stages = {}
+        for stage, samples in self.samples.items():
+            milliseconds = [s * 1000 for s in samples]
+            total = sum(samples)
+            stages[stage] = {
+                "count": len(samples),
+                "total_s": round(total, 4),
+                "mean_ms": round(total * 1000 / len(samples), 4),
+                "p50_ms": round(percentile(milliseconds, 50), 4),
+                "p95_ms": round(percentile(milliseconds, 95), 4),
+                "p99_ms": round(percentile(milliseconds, 99), 4),
+                "throughput": round(self.units[stage] / total, 4) if total > 0 else None,
+                "throughput_unit": f"{self.unit_names[stage]}/s",
+            }
+        return stages
+
+
+def git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run_suite(args, workdir: str) -> Dict[str, Any]:
+    import fitz  # type: ignore
+    import numpy as np
+    import torch
+
+    from benchmarks.stub_models import make_stub_causal_lm, write_stub_encoder
+    from src.context_builder import ContextBuilder
+    from src.numpy_store import NumpyVectorStore, write_numpy_store
+    from src.pdf_extractor import PDFExtractor
+    from src.prompts import RAG_PROMPT_TEMPLATE
+    from src.rag_pipeline import RAGPipeline
+    from src.text_splitter import TextSplitter
+
+    torch.manual_seed(0)
+    timer = StageTimer()
+    questions = [pair["question"] for pair in load_qa(args.data)][:args.questions]
+    pdfs = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))[:args.max_pdfs]
+    if not pdfs or not questions:
+        raise SystemExit(f"FAIL: no PDFs in {args.pdf_dir} or no questions in {args.data}")
+
+    # --- ingest path ---
+    texts = {}
+    for _ in range(args.repeats):
+        for path in pdfs:
+            pages = fitz.open(path).page_count
+            texts[path] = timer.time("extract", PDFExtractor(path).extract_text, units=pages, unit_name="pages")
+
+    encoder = args.encoder
+    if encoder == "stub":
+        encoder = write_stub_encoder(os.path.join(workdir, "encoder"), texts.values(), hidden_size=args.encoder_hidden,
+                                     layers=args.encoder_layers, heads=args.encoder_hidden // 64)
+    splitter = TextSplitter(model_name=encoder)
+    chunks = []
+    for repeat in range(args.repeats):
+        for path in pdfs:
+            metadata = {"source_file": os.path.basename(path)}
+            split = timer.time("split", splitter.split_text, texts[path], metadata,
+                               units=len(texts[path]), unit_name="chars")
+            if repeat == 0:
+                chunks.extend(split)
+    chunks = chunks[:args.max_chunks] if args.max_chunks else chunks
+
+    pipeline = RAGPipeline(persist_directory=os.path.join(workdir, "chroma_db"), embedding_cache_dir=None,
+                           model_name=encoder)
+    forward = pipeline._forward
+    # Every padded batch compute_embeddings plans goes through _forward
+    pipeline._forward = lambda inputs, model=None: timer.time(
+        "embed_batch", forward, inputs, model, units=len(inputs["input_ids"]), unit_name="texts")
+    chunk_texts = [chunk["text"] for chunk in chunks]
+    chunk_vectors = pipeline.compute_embeddings(chunk_texts)
+    pipeline._forward = forward
+
+    pipeline.compute_embeddings(questions[:2])  # warmup
+    query_vectors = [timer.time("embed_query", pipeline.compute_embeddings, [question], unit_name="queries")[0]
+                     for question in questions]
+
+    # --- retrieval ---
+    store_dir = os.path.join(workdir, "numpy_store")
+    os.makedirs(store_dir)
+    ids = [f"chunk-{i}" for i in range(len(chunks))]
+    write_numpy_store(store_dir, ids, chunk_texts, [chunk["metadata"] for chunk in chunks], chunk_vectors,
+                      first_stage_modes=())
+    store = NumpyVectorStore(store_dir, None)
+    results = [timer.time("vector_search", store.similarity_search_by_vector_with_relevance_scores, vector, args.k,
+                          unit_name="queries")
+               for vector in query_vectors]
+
+    # --- prompt + generation ---
+    model, tokenizer = make_stub_causal_lm()
+    max_prompt = model.config.max_position_embeddings - args.new_tokens
+    builder = ContextBuilder(lambda text: len(tokenizer.encode(text, add_special_tokens=False)),
+                             token_budget=args.context_budget)
+
+    def build_prompt(question, docs_with_scores):
+        context = builder.build(docs_with_scores)
+        prompt_text = RAG_PROMPT_TEMPLATE.format(context=context.text, question=question)
+        return tokenizer(prompt_text)["input_ids"]
+
+    prompts = []
+    for question, docs_with_scores in zip(questions, results):
+        prompts.append(timer.time("prompt", build_prompt, question, docs_with_scores, unit_name="prompts")[-max_prompt:])
+
+    with torch.no_grad():
+        model(input_ids=torch.tensor([prompts[0][:32]]), use_cache=True)  # warmup
+        for prompt_ids in prompts:
+            outputs = timer.time("prefill", model, input_ids=torch.tensor([prompt_ids]), use_cache=True,
+                                 units=len(prompt_ids), unit_name="tokens")
+            past = outputs.past_key_values
+            next_token = outputs.logits[:, -1:].argmax(-1)
+            for _ in range(args.new_tokens):
+                outputs = timer.time("decode", model, input_ids=next_token, past_key_values=past, use_cache=True,
+                                     unit_name="tokens")
+                past = outputs.past_key_values
+                next_token = outputs.logits[:, -1:].argmax(-1)
+
+    return {
+        "workload": {
+            "pdfs": len(pdfs),
+            "pages": sum(fitz.open(path).page_count for path in pdfs),
+            "chunks": len(chunks),
+            "questions": len(questions),
+            "mean_prompt_tokens": round(float(np.mean([len(p) for p in prompts])), 1),
+        },
+        "stages": timer.summary(),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], max_regression: float) -> List[str]:
+    """Prints p50/p95/throughput side by side; returns the stages whose p50 regressed beyond max_regression."""
+    print(f"baseline {baseline['meta'].get('commit')} vs current {current['meta'].get('commit')}")
+    options = {key for key in set(baseline["meta"]["options"]) | set(current["meta"]["options"])
+               if baseline["meta"]["options"].get(key) != current["meta"]["options"].get(key)}
+    if options - {"max_regression"}:
+        print(f"note: the runs used different options ({', '.join(sorted(options))}), numbers are not comparable")
+    print(f"{'stage':<14} {'p50 ms':>18} {'ratio':>6} {'p95 ms':>18} {'throughput':>22}")
+    regressed = []
+    for stage in STAGES:
+        old, new = baseline["stages"].get(stage), current["stages"].get(stage)
+        if not old or not new:
+            continue
+        ratio = new["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = ""
+        if ratio > max_regression:
+            regressed.append(stage)
+            flag = "  <-- slower"
+        print(f"{stage:<14} {old['p50_ms']:>8.2f} -> {new['p50_ms']:>6.2f} {ratio:>6.2f} "
+              f"{old['p95_ms']:>8.2f} -> {new['p95_ms']:>6.2f} {old['throughput']:>10.1f} -> {new['throughput']:>9.1f}"
+              f"{flag}")
+    return regressed
+
+
+def print_table(result: Dict[str, Any]):
+    print("-" * 84)
+    workload = result["workload"]
+    print(f"commit {result['meta']['commit']}{' (dirty)' if result['meta']['dirty'] else ''}: "
+          f"{workload['pdfs']} PDFs / {workload['pages']} pages, {workload['chunks']} chunks, "
+          f"{workload['questions']} questions, {workload['mean_prompt_tokens']:.0f} prompt tokens on average")
+    print(f"{'stage':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'throughput':>20}")
+    for stage in STAGES:
+        s = result["stages"].get(stage)
+        if s:
+            print(f"{stage:<14} {s['count']:>6} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f} "
+                  f"{s['throughput']:>12.1f} {s['throughput_unit']:<9}")
+    print("-" * 84)
+
+
+def load_result(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data.jsonl")
+    parser.add_argument("--pdf-dir", default="ENERJI DATA")
+    parser.add_argument("--max-pdfs", type=int, default=None)
+    parser.add_argument("--questions", type=int, default=None, help="default: all QA pairs")
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the PDFs for extract/split")
+    parser.add_argument("--max-chunks", type=int, default=None)
+    parser.add_argument("--encoder", default="stub", help="'stub' or a local HF encoder name/path")
+    parser.add_argument("--encoder-hidden", type=int, default=256)
+    parser.add_argument("--encoder-layers", type=int, default=4)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--context-budget", type=int, default=3000)
+    parser.add_argument("--new-tokens", type=int, default=16)
+    parser.add_argument("--output", default=None, help="default: benchmarks/results/stages-<commit>.json")
+    parser.add_argument("--baseline", default=None, help="earlier result to compare with")
+    parser.add_argument("--max-regression", type=float, default=1.25, help="allowed p50 ratio vs. the baseline")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="only compare two result files")
+    args = parser.parse_args()
+
+    if args.diff:
+        regressed = compare(load_result(args.diff[0]), load_result(args.diff[1]), args.max_regression)
+        if regressed:
+            print(f"FAIL: p50 regressed by more than {args.max_regression:.2f}x: {', '.join(regressed)}")
+            sys.exit(1)
+        print("OK: no stage regressed")
+        return
+
+    import torch
+    import transformers
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "diff")}
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run_suite(args, workdir)
+    result["meta"] = {
+        **git_commit(),
+        "format": RESULT_FORMAT,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "cpu_count": os.cpu_count(),
+        "threads": torch.get_num_threads(),
+        "options": options,
+    }
+
+    output = args.output or os.path.join("benchmarks", "results", f"stages-{result['meta']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print_table(result)
+    print(f"results written to {output}")
+
+    missing = [stage for stage in STAGES if stage not in result["stages"]]
+    if missing:
+        print(f"FAIL: stages without samples: {', '.join(missing)}")
+        sys.exit(1)
+    if args.baseline:
+        regressed = compare(load_result(args.baseline), result, args.max_regression)
+        if regressed:
+            print(f"FAIL: p50 regressed by more than {args.max_regression:.2f}x: {', '.join(regressed)}")
+            sys.exit(1)
+    print("OK: all stages measured")
+
+
+if __name__ == "__main__":
+    main()
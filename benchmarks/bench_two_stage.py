@@ -0,0 +1,136 @@
+"""
+Two-stage retrieval (compressed first pass + exact rescoring) vs. exact NumPy search.
+
+For every first-stage mode (int8, pca, pca-int8) and candidate count reports:
+  RAM       in-memory size of the first-stage index (the full matrix stays memory-mapped)
+  p50/p95   single query latency
+  overlap   share of the exact top-k that two-stage search returns
+  R@k       gold answer of data.jsonl found in the top-k chunks (only without --replicate)
+
+Queries are the data.jsonl questions embedded with the production model; with
+--synthetic-queries noisy corpus vectors are used instead (no model needed).
+--replicate N grows the corpus N times with perturbed copies to look at larger scales.
+
+Usage (from the project root, after ingest_data.py):
+    python benchmarks/bench_two_stage.py [--k 3] [--candidates 32 64 128] [--replicate 1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from benchmarks.workload import answer_found, load_qa, percentile
+from src.numpy_store import NumpyVectorStore, write_numpy_store
+from src.vector_compression import DEFAULT_PCA_DIM, MODES
+
+MIN_INT8_OVERLAP = 0.95
+
+
+def embed_questions(questions):
+    from src.rag_pipeline import RAGPipeline
+
+    with RAGPipeline(embedding_cache_dir=None) as pipeline:
+        return pipeline.compute_embeddings(questions)
+
+
+def run(store, queries, k):
+    latencies, rankings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.batch_search_by_vectors(query[None, :], k)[0]
+        latencies.append((time.perf_counter() - start) * 1e6)
+        rankings.append([doc.id for doc, _ in hits])
+    return latencies, rankings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-dir", default="chroma_db")
+    parser.add_argument("--qa", default="data.jsonl")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--pca-dim", type=int, default=DEFAULT_PCA_DIM)
+    parser.add_argument("--replicate", type=int, default=1)
+    parser.add_argument("--synthetic-queries", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from src.worker_protocol import ChromaWorkerClient
+    with ChromaWorkerClient(args.persist_dir, "enerji_mevzuati") as worker:
+        collection = worker.get(include=["documents", "metadatas", "embeddings"])
+    if not collection["ids"]:
+        print(f"FAIL: no chunks in {args.persist_dir}, run ingest_data.py first")
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    ids, texts = list(collection["ids"]), list(collection["documents"])
+    metadatas = list(collection["metadatas"])
+    vectors = np.asarray(collection["embeddings"], dtype=np.float32)
+    base_vectors = vectors
+    for copy in range(1, args.replicate):
+        noise = rng.normal(0, 0.05 * np.abs(base_vectors).mean(), base_vectors.shape).astype(np.float32)
+        vectors = np.vstack([vectors, base_vectors + noise])
+        ids += [f"{chunk_id}#{copy}" for chunk_id in collection["ids"]]
+        texts += list(collection["documents"])
+        metadatas += list(collection["metadatas"])
+
+    qa = load_qa(args.qa)
+    if args.synthetic_queries:
+        picked = base_vectors[rng.integers(0, len(base_vectors), size=len(qa))]
+        queries = picked + rng.normal(0, 0.05 * np.abs(picked).mean(), picked.shape).astype(np.float32)
+    else:
+        queries = embed_questions([pair["question"] for pair in qa])
+    measure_answers = args.replicate == 1 and not args.synthetic_queries
+    texts_by_id = dict(zip(ids, texts))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as store_dir:
+        write_numpy_store(store_dir, ids, texts, metadatas, vectors, pca_dim=args.pca_dim)
+        exact_store = NumpyVectorStore(store_dir, embedding_function=None)
+        run(exact_store, queries[:20], args.k)  # warmup
+        exact_latencies, exact = run(exact_store, queries, args.k)
+        full_bytes = exact_store.vectors.nbytes
+        rows.append(("exact", "-", full_bytes, exact_latencies, exact))
+
+        for mode in MODES:
+            for candidates in args.candidates:
+                store = NumpyVectorStore(store_dir, embedding_function=None, first_stage=mode,
+                                         rescore_candidates=candidates)
+                run(store, queries[:20], args.k)
+                latencies, rankings = run(store, queries, args.k)
+                rows.append((mode, str(candidates), store.first_stage.nbytes, latencies, rankings))
+                del store
+
+    print("-" * 80)
+    print(f"{len(ids)} chunks x {vectors.shape[1]} dims (full matrix {full_bytes / 2**20:.1f} MiB, memory-mapped), "
+          f"{len(queries)} queries, k={args.k}, pca dim {args.pca_dim}")
+    print(f"{'first stage':<11} {'cand':>5} {'RAM MiB':>8} {'p50 us':>8} {'p95 us':>8} {'overlap':>8} "
+          f"{f'R@{args.k}':>7}")
+    int8_overlap = None
+    for mode, candidates, nbytes, latencies, rankings in rows:
+        overlap = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(rankings, exact)])
+        answer_recall = "-"
+        if measure_answers:
+            found = sum(answer_found(pair["answer"], [texts_by_id[i] for i in ranking])
+                        for ranking, pair in zip(rankings, qa))
+            answer_recall = f"{found / len(qa):.1%}"
+        print(f"{mode:<11} {candidates:>5} {nbytes / 2**20:>8.2f} {percentile(latencies, 50):>8.0f} "
+              f"{percentile(latencies, 95):>8.0f} {overlap:>8.1%} {answer_recall:>7}")
+        if mode == "int8" and candidates == str(max(args.candidates)):
+            int8_overlap = overlap
+    print("-" * 80)
+
+    if int8_overlap is not None and int8_overlap < MIN_INT8_OVERLAP:
+        print(f"FAIL: int8 first stage with {max(args.candidates)} candidates keeps only {int8_overlap:.1%} "
+              f"of the exact top-{args.k}")
+        sys.exit(1)
+    print("OK: int8 two-stage search matches exact search")
+
+
+if __name__ == "__main__":
+    main()
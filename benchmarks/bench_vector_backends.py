@@ -0,0 +1,140 @@
+"""
+NumpyVectorStore (in-process exact search) vs. Chroma (HNSW) on the ingested corpus.
+
+Exports the chroma_db collection into a temporary NumPy store, then measures every
+backend in a fresh subprocess so cold start and memory are not shared:
+  cold start : imports + opening the store + first query
+  p50/p95    : single query latency
+  batch q/s  : throughput of one call with --batch queries (median of 5)
+  peak RSS   : peak resident memory of the measuring process
+
+Queries are corpus vectors with Gaussian noise, so no embedding model is needed.
+Also reports how many of Chroma's top-k the exact search returns (overlap@k).
+
+Usage (from the project root, after ingest_data.py):
+    python benchmarks/bench_vector_backends.py [--k 3] [--queries 200] [--batch 64]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from benchmarks.workload import peak_rss_mb, percentile
+
+BACKENDS = ("numpy", "chroma")
+MIN_OVERLAP = 0.9
+
+
+def open_backend(backend, store_dir, persist_dir, collection_name):
+    """Returns search(queries: np.ndarray (n, dim), k) -> List[List[str]] for one backend."""
+    if backend == "numpy":
+        from src.numpy_store import NumpyVectorStore
+        store = NumpyVectorStore(store_dir, embedding_function=None)
+        return lambda queries, k: [[doc.id for doc, _ in hits] for hits in store.batch_search_by_vectors(queries, k)]
+
+    import chromadb
+    collection = chromadb.PersistentClient(path=persist_dir).get_collection(collection_name)
+    return lambda queries, k: collection.query(query_embeddings=queries, n_results=k, include=[])["ids"]
+
+
+def measure(args):
+    queries = np.load(os.path.join(args.store_dir, "queries.npy"))
+    start = time.perf_counter()
+    search = open_backend(args.run_backend, args.store_dir, args.persist_dir, args.collection)
+    search(queries[:1], args.k)
+    cold_start = time.perf_counter() - start
+
+    latencies = []
+    ids = []
+    for query in queries:
+        start = time.perf_counter()
+        ids.extend(search(query[None, :], args.k))
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    batch = queries[:args.batch]
+    batch_seconds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        search(batch, args.k)
+        batch_seconds.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        "cold_start_s": cold_start,
+        "p50_us": percentile(latencies, 50),
+        "p95_us": percentile(latencies, 95),
+        "batch_qps": len(batch) / percentile(batch_seconds, 50),
+        "peak_rss_mb": peak_rss_mb(),
+        "ids": ids,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-dir", default="chroma_db")
+    parser.add_argument("--collection", default="enerji_mevzuati")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run-backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--store-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_backend:
+        measure(args)
+        return
+
+    from src.numpy_store import export_numpy_store
+    from src.worker_protocol import ChromaWorkerClient
+
+    with ChromaWorkerClient(args.persist_dir, args.collection) as worker:
+        collection = worker.get(include=["documents", "metadatas", "embeddings"])
+    if not collection["ids"]:
+        print(f"FAIL: no chunks in {args.persist_dir}, run ingest_data.py first")
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = np.asarray(collection["embeddings"], dtype=np.float32)
+    picked = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = picked + rng.normal(0, args.noise, picked.shape).astype(np.float32) * np.abs(picked).mean()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as store_dir:
+        export_numpy_store(collection, store_dir)
+        np.save(os.path.join(store_dir, "queries.npy"), queries.astype(np.float32))
+        for backend in BACKENDS:
+            output = subprocess.run(
+                [sys.executable, __file__, "--run-backend", backend, "--store-dir", store_dir,
+                 "--persist-dir", args.persist_dir, "--collection", args.collection,
+                 "--k", str(args.k), "--batch", str(args.batch)],
+                capture_output=True, text=True, check=True, cwd=os.getcwd())
+            results[backend] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    overlap = np.mean([len(set(a) & set(b)) / max(len(b), 1)
+                       for a, b in zip(results["numpy"]["ids"], results["chroma"]["ids"])])
+
+    print("-" * 72)
+    print(f"{len(vectors)} chunks x {vectors.shape[1]} dims, {args.queries} queries, k={args.k}")
+    print(f"{'backend':<8} {'cold start':>11} {'p50 us':>8} {'p95 us':>8} {f'batch{args.batch} q/s':>13} {'peak RSS':>10}")
+    for backend in BACKENDS:
+        r = results[backend]
+        print(f"{backend:<8} {r['cold_start_s']:>10.2f}s {r['p50_us']:>8.0f} {r['p95_us']:>8.0f} "
+              f"{r['batch_qps']:>13.0f} {r['peak_rss_mb']:>8.0f}MB")
+    print(f"overlap@{args.k} (exact vs HNSW): {overlap:.1%}")
+    print("-" * 72)
+
+    if overlap < MIN_OVERLAP:
+        print(f"FAIL: backends agree on only {overlap:.1%} of the top-{args.k}")
+        sys.exit(1)
+    print("OK: exact NumPy search matches Chroma")
+
+
+if __name__ == "__main__":
+    main()
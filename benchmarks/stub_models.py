@@ -0,0 +1,100 @@
+"""
+Tiny randomly initialised causal LM + character level tokenizer for CPU benchmarks,
+and a random BERT encoder with a WordPiece vocabulary built from the corpus.
+
+No downloads: the models are built from a LlamaConfig / BertConfig, so the benchmarks
+exercise the real transformers forward/generate/KV-cache code paths at a fraction of
+the cost of Gemma 3 4B.
+"""
+import collections
+import json
+import os
+import re
+from typing import Iterable
+
+import torch
+from transformers import BatchEncoding, BertConfig, BertModel, BertTokenizerFast, LlamaConfig, LlamaForCausalLM
+
+PAD_ID = 0
+BOS_ID = 1
+_FIRST_CHAR_ID = 2
+
+
+class StubTokenizer:
+    """Character level tokenizer with the subset of the HF tokenizer API the engine uses."""
+    def __init__(self, vocab_size: int = 512):
+        self.vocab_size = vocab_size
+        self.pad_token_id = PAD_ID
+        self.bos_token_id = BOS_ID
+        self.eos_token_id = None  # random weights: never stop early, always decode max_new_tokens
+        self.all_special_ids = [PAD_ID, BOS_ID]
+
+    def encode(self, text: str, add_special_tokens: bool = True):
+        ids = [_FIRST_CHAR_ID + (ord(ch) % (self.vocab_size - _FIRST_CHAR_ID)) for ch in text]
+        return [BOS_ID] + ids if add_special_tokens else ids
+
+    def __call__(self, text: str, return_tensors=None, add_special_tokens: bool = True):
+        ids = self.encode(text, add_special_tokens=add_special_tokens)
+        if return_tensors == "pt":
+            return BatchEncoding({"input_ids": torch.tensor([ids]),
+                                  "attention_mask": torch.ones(1, len(ids), dtype=torch.long)})
+        return BatchEncoding({"input_ids": ids, "attention_mask": [1] * len(ids)})
+
+    def save_pretrained(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "stub_tokenizer.json"), "w", encoding="utf-8") as f:
+            json.dump({"vocab_size": self.vocab_size}, f)
+
+    def decode(self, ids, skip_special_tokens: bool = True):
+        if isinstance(ids, torch.Tensor):
+            ids = ids.tolist()
+        chars = []
+        for token in ids:
+            if token in (PAD_ID, BOS_ID):
+                if not skip_special_tokens:
+                    chars.append("<s>" if token == BOS_ID else "<pad>")
+                continue
+            # Map ids onto printable Turkish-ish letters so streamed output looks like text
+            chars.append("abcçdefgğhıijklmnoöprsştuüvyz .,"[token % 32])
+        return "".join(chars)
+
+
+def make_stub_causal_lm(vocab_size: int = 512, hidden_size: int = 128, layers: int = 4, seed: int = 0):
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 4,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        pad_token_id=PAD_ID,
+        bos_token_id=BOS_ID,
+        eos_token_id=None,
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = PAD_ID
+    return model, StubTokenizer(vocab_size)
+
+
+def write_stub_encoder(path: str, texts: Iterable[str], hidden_size: int = 768, layers: int = 12, heads: int = 12,
+                       vocab_size: int = 30000, seed: int = 0) -> str:
+    """
+    Saves a random BertModel and a cased WordPiece tokenizer (characters + the most frequent
+    words of texts) to path, loadable with AutoModel / AutoTokenizer.from_pretrained(path).
+    """
+    os.makedirs(path, exist_ok=True)
+    words = collections.Counter(word for text in texts for word in re.findall(r"\w+|[^\w\s]", text))
+    chars = sorted({ch for word in words for ch in word})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + chars + [f"##{ch}" for ch in chars]
+    vocab += [word for word, _ in words.most_common(max(vocab_size - len(vocab), 0)) if len(word) > 1]
+    with open(os.path.join(path, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    BertTokenizerFast(vocab_file=os.path.join(path, "vocab.txt"), do_lower_case=False).save_pretrained(path)
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=heads, intermediate_size=hidden_size * 4)
+    BertModel(config).eval().save_pretrained(path, safe_serialization=True)
+    return path
@@ -0,0 +1,71 @@
+"""
+Shared workload for the retrieval benchmarks: the QA pairs in data.jsonl and the
+chunks already ingested into chroma_db (run ingest_data.py first).
+
+Relevance is judged by the gold answer: a retrieved chunk counts as a hit when it
+contains (almost) every token of the answer.
+"""
+import json
+import re
+import sys
+from typing import Any, Dict, List, Sequence, Tuple
+
+from src.query_cache import turkish_lower
+
+_TOKEN = re.compile(r"\w+")
+
+
+def load_qa(path: str = "data.jsonl") -> List[Dict[str, str]]:
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                pairs.append(json.loads(line))
+    return pairs
+
+
+def load_corpus(persist_dir: str = "chroma_db",
+                collection_name: str = "enerji_mevzuati") -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    from src.worker_protocol import ChromaWorkerClient
+
+    with ChromaWorkerClient(persist_dir, collection_name) as worker:
+        result = worker.get(include=["documents", "metadatas"])
+    return result["ids"], [text or "" for text in result["documents"]], result["metadatas"]
+
+
+def _tokens(text: str) -> set:
+    return set(_TOKEN.findall(turkish_lower(text)))
+
+
+def answer_found(answer: str, texts: Sequence[str], min_overlap: float = 0.8) -> bool:
+    answer_tokens = _tokens(answer)
+    if not answer_tokens:
+        return False
+    # Short answers (numbers, dates, names) must match completely
+    needed = len(answer_tokens) if len(answer_tokens) <= 3 else min_overlap * len(answer_tokens)
+    return any(len(answer_tokens & _tokens(text)) >= needed for text in texts)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MiB (0.0 where it cannot be read)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return 0.0
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
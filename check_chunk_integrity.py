@@ -5,7 +5,7 @@ import sys
 # Add project root to path to find src
 sys.path.append(os.getcwd())
 
-from src.pdf_extractor import PDFExtractor
+from src.pdf_extractor import PDFExtractor, EXTRACTION_CACHE_DIR
 from src.text_splitter import TextSplitter
 
 def main():
@@ -17,11 +17,11 @@ def main():
 
     print(f"Analyzing {file_path} for split integrity...")
     
-    extractor = PDFExtractor(file_path)
-    text = extractor.extract_text()
+    # Metin ingest_data.py'nin doldurduğu extraction cache'inden gelir (PDF tekrar okunmaz)
+    extractor = PDFExtractor(file_path, cache_dir=EXTRACTION_CACHE_DIR)
     
     splitter = TextSplitter()
-    chunks = splitter.split_text(text, {"source_file": "1.5.5346.pdf"})
+    chunks = list(splitter.iter_chunks(extractor.iter_pages(), {"source_file": "1.5.5346.pdf"}))
 
     # Group chunks by article to find split ones
     article_chunks = {}
@@ -1,3 +1,4 @@
+import argparse
 import glob
 import os
 import sys
@@ -8,21 +9,56 @@ os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 # Add project root to path
 sys.path.append(os.getcwd())
 
-from src.pdf_extractor import PDFExtractor
+from src.pdf_extractor import PDFExtractor, EXTRACTION_CACHE_DIR
 from src.text_splitter import TextSplitter
 # Import RAGPipeline last, which imports chromadb.
 # Trying to load torch (in TextSplitter) BEFORE chromadb to fix DLL crash.
 from src.rag_pipeline import RAGPipeline
+from src.ingest_manifest import IngestManifest
+from src.lexical_index import build_lexical_index, LEXICAL_INDEX_FILE
+from src.article_index import build_article_index, ARTICLE_INDEX_FILE
+from src.numpy_store import export_numpy_store, NUMPY_STORE_FILE
+from src.answer_cache import AnswerCache, ANSWER_CACHE_FILE
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ENERJI DATA klasöründeki PDF'leri ChromaDB'ye yükler.")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Extract/split işlemlerini process pool'da, embedding ve yazmayı ayrı aşamalarda paralel çalıştırır.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Extract/split worker process sayısı (varsayılan: CPU çekirdek sayısı).")
+    parser.add_argument("--write-batch-size", type=int, default=512,
+                        help="Pipelined modda tek seferde ChromaDB'ye yazılacak chunk sayısı.")
+    parser.add_argument("--no-embedding-cache", action="store_true",
+                        help="Disk üzerindeki embedding cache'ini kullanmadan tüm chunk'ları yeniden embed eder.")
+    parser.add_argument("--full", action="store_true",
+                        help="Manifest'i yok sayar, değişmemiş dosyalar dahil tüm PDF'leri yeniden işler.")
+    parser.add_argument("--no-stemming", action="store_true",
+                        help="BM25 sözlüksel indeksini Türkçe ek ayıklama (stemming) olmadan kurar.")
+    parser.add_argument("--profile", choices=("default", "cpu-int8"), default="default",
+                        help="cpu-int8: GPU'suz makinelerde embedding modelini dinamik int8 ile çalıştırır.")
+    parser.add_argument("--no-extraction-cache", action="store_true",
+                        help="PDF metinlerini extraction_cache'i kullanmadan yeniden çıkarır (ve cache'e yazmaz).")
+    parser.add_argument("--extract-workers", type=int, default=1,
+                        help="Seri modda büyük PDF'lerin sayfa aralıklarını bu kadar process'te paralel çıkarır.")
+    parser.add_argument("--embedding-backend", choices=("torch", "onnx"), default="torch",
+                        help="onnx: embedding modelini (mean pooling dahil) ONNX Runtime ile çalıştırır; "
+                             "ilk çalıştırmada embedding_cache/onnx altına dışa aktarılır.")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     data_dir = "ENERJI DATA"
     if not os.path.exists(data_dir):
         print(f"Directory {data_dir} not found.")
         return
 
     print("Initializing RAG Pipeline (loading models and DB)...")
-    pipeline = RAGPipeline(persist_directory="chroma_db")
-    splitter = TextSplitter()
+    pipeline = RAGPipeline(
+        persist_directory="chroma_db",
+        embedding_cache_dir=None if args.no_embedding_cache else "embedding_cache",
+        inference_profile=args.profile,
+        embedding_backend=args.embedding_backend
+    )
     
     files = glob.glob(os.path.join(data_dir, "*.pdf"))
     # TEST MODU KAPALI: Tüm dosyaları işle
@@ -33,48 +69,146 @@ def main():
     #     print(f"Test file {test_file} not found.")
     #     files = []
     
-    print(f"Found {len(files)} PDF files to ingest.")
+    print(f"Found {len(files)} PDF files.")
     
-    total_chunks = 0
+    manifest = IngestManifest(pipeline.persist_directory)
+    plan = manifest.plan(files, force=args.full)
+    print(f"Manifest: {plan.summary()}")
     
-    for file_path in files:
-        file_name = os.path.basename(file_path)
-        print(f"Processing {file_name}...", flush=True)
+    # API'nin cevap cache'i varsa, yeniden yüklenen/silinen chunk'lara atıf yapan cevapları geçersiz kıl
+    answer_cache_path = os.path.join(pipeline.persist_directory, ANSWER_CACHE_FILE)
+    answer_cache = AnswerCache(answer_cache_path) if os.path.exists(answer_cache_path) else None
+    
+    def invalidate_answers(chunk_ids):
+        if answer_cache is not None and chunk_ids:
+            removed = answer_cache.invalidate_chunks(chunk_ids)
+            if removed:
+                print(f"  Invalidated {removed} cached answers.", flush=True)
+    
+    try:
+        # Kaldırılan PDF'lerin chunk'larını sil
+        for file_name in plan.removed:
+            print(f"Removing chunks of deleted file {file_name}...", flush=True)
+            pipeline.delete_documents(where={"source_file": file_name})
+            invalidate_answers(manifest.chunk_ids(file_name))
+            manifest.forget(file_name)
+        if plan.removed:
+            manifest.save()
         
-        try:
-            # 1. Extract
-            print("  Extracting text...", flush=True)
-            extractor = PDFExtractor(file_path)
-            text = extractor.extract_text()
-            print("  Text extracted.", flush=True)
-            
-            # 2. Split
-            print("  Splitting text...", flush=True)
-            base_metadata = {
-                "source_file": file_name,
-                "document_title": file_name.replace(".pdf", "") 
-            }
-            chunks = splitter.split_text(text, base_metadata)
-            print(f"  Split into {len(chunks)} chunks.", flush=True)
-            
-            if not chunks:
-                print(f"  No chunks generated for {file_name}.", flush=True)
-                continue
-                
-            # 3. Ingest
-            print("  Adding to ChromaDB...", flush=True)
-            pipeline.add_documents(chunks)
-            total_chunks += len(chunks)
-            print("  Done with this file.", flush=True)
-            
-        except Exception as e:
-            print(f"  Error processing {file_name}: {e}", flush=True)
-            import traceback
-            traceback.print_exc()
+        # Manifest'te kaydı olmayan dosyalar: eski (uuid ID'li) çalıştırmalardan kalan kopyaları temizle
+        for file_path in plan.new:
+            pipeline.delete_documents(where={"source_file": os.path.basename(file_path)})
+        
+        hashes_by_name = {os.path.basename(path): sha for path, sha in plan.hashes.items()}
+        # Çıkarılan sayfa metinleri PDF hash'iyle saklanır; --full veya yeniden bölmede PDF tekrar okunmaz
+        extraction_cache_dir = None if args.no_extraction_cache else EXTRACTION_CACHE_DIR
+        
+        def on_file_written(file_name, chunk_ids):
+            # Değişen dosyada artık üretilmeyen eski chunk'ları sil
+            stale_ids = sorted(set(manifest.chunk_ids(file_name)) - set(chunk_ids))
+            if stale_ids:
+                pipeline.delete_documents(ids=stale_ids)
+            invalidate_answers(set(manifest.chunk_ids(file_name)) | set(chunk_ids))
+            manifest.record(file_name, hashes_by_name[file_name], chunk_ids)
+            manifest.save()
+        
+        if not plan.to_process:
+            total_chunks = 0
+        elif args.pipelined:
+            from src.ingest_pipeline import PipelinedIngestor
+            ingestor = PipelinedIngestor(pipeline, workers=args.workers, write_batch_size=args.write_batch_size,
+                                         extraction_cache_dir=extraction_cache_dir)
+            total_chunks = ingestor.run(plan.to_process, on_file_written=on_file_written)
+        else:
+            total_chunks = ingest_serial(pipeline, plan.to_process, on_file_written, extraction_cache_dir,
+                                         plan.hashes, args.extract_workers)
+        
+        # BM25 ve madde indekslerini ve NumPy vektör deposunu koleksiyonun tamamından yeniden kur
+        # (koleksiyon değiştiyse veya dosyalardan biri yoksa)
+        index_paths = [os.path.join(pipeline.persist_directory, name)
+                       for name in (LEXICAL_INDEX_FILE, ARTICLE_INDEX_FILE, NUMPY_STORE_FILE)]
+        if plan.to_process or plan.removed or args.no_stemming or not all(os.path.exists(path) for path in index_paths):
+            print("Building lexical (BM25) and article indexes, exporting NumPy vector store...", flush=True)
+            collection = pipeline.worker.get(include=["documents", "metadatas", "embeddings"])
+            lexical_stats = build_lexical_index(collection, pipeline.persist_directory,
+                                                stemming=not args.no_stemming).stats()
+            article_stats = build_article_index(collection, pipeline.persist_directory).stats()
+            print(f"  BM25: {lexical_stats['chunks']} chunks, {lexical_stats['terms']} terms, "
+                  f"{lexical_stats['postings']} postings.", flush=True)
+            print(f"  Articles: {article_stats['articles']} articles in {article_stats['laws']} files.", flush=True)
+            export_numpy_store(collection, pipeline.persist_directory)
+            # Manifest'i tekrar yaz: API cache'leri ve indeksleri manifest damgası değişince yeniden yükler
+            manifest.save()
+    finally:
+        # Embedding cache index'ini diske yaz ve persistent ChromaDB worker process'ini kapat
+        pipeline.close()
+        if answer_cache is not None:
+            answer_cache.close()
+    
+    if pipeline.embedding_cache is not None:
+        stats = pipeline.embedding_cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} entries, {stats['evictions']} evicted")
             
     print("="*60)
-    print(f"Ingestion Complete. Total Chunks Added: {total_chunks}")
+    print(f"Ingestion Complete. Total Chunks Upserted: {total_chunks} ({len(plan.unchanged)} unchanged files skipped)")
     print("="*60)
 
+def ingest_serial(pipeline: RAGPipeline, files, on_file_written, extraction_cache_dir=None, hashes=None,
+                  extract_workers: int = 1):
+    splitter = TextSplitter()
+    total_chunks = 0
+    # Sayfa aralıklarını paralel çıkaracak process pool (tüm dosyalar için bir kez açılır)
+    pool = None
+    if extract_workers > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=extract_workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for file_path in files:
+            total_chunks += ingest_file(pipeline, splitter, file_path, on_file_written, extraction_cache_dir,
+                                        (hashes or {}).get(file_path), pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return total_chunks
+
+def ingest_file(pipeline: RAGPipeline, splitter, file_path, on_file_written, extraction_cache_dir=None, sha256=None,
+                pool=None) -> int:
+    """Tek PDF: sayfalar (cache'ten veya PDF'ten) akış halinde bölünür ve veritabanına yazılır."""
+    file_name = os.path.basename(file_path)
+    print(f"Processing {file_name}...", flush=True)
+    
+    try:
+        # 1-2. Extract + Split: sayfalar geldikçe maddelere bölünür, tüm metin tek string olarak tutulmaz
+        print("  Extracting and splitting text...", flush=True)
+        extractor = PDFExtractor(file_path, cache_dir=extraction_cache_dir, sha256=sha256)
+        base_metadata = {
+            "source_file": file_name,
+            "document_title": file_name.replace(".pdf", "") 
+        }
+        chunks = list(splitter.iter_chunks(extractor.iter_pages(pool), base_metadata))
+        source = "extraction cache" if extractor.from_cache else "PDF"
+        print(f"  Split into {len(chunks)} chunks (text from {source}, "
+              f"{extractor.removed_lines} header/footer lines removed).", flush=True)
+        
+        if not chunks:
+            print(f"  No chunks generated for {file_name}.", flush=True)
+            on_file_written(file_name, [])
+            return 0
+            
+        # 3. Ingest
+        print("  Upserting to ChromaDB...", flush=True)
+        chunk_ids = pipeline.add_documents(chunks)
+        on_file_written(file_name, chunk_ids)
+        print("  Done with this file.", flush=True)
+        return len(chunks)
+        
+    except Exception as e:
+        print(f"  Error processing {file_name}: {e}", flush=True)
+        import traceback
+        traceback.print_exc()
+        return 0
+
 if __name__ == "__main__":
     main()
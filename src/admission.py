@@ -0,0 +1,100 @@
+"""
+Admission control for chat generation.
+
+At most max_active requests hold a generation slot at once. Up to max_queue more wait
+for one in FIFO order, each for at most timeout seconds. A request that finds the
+queue full is rejected at once (AdmissionRejected, 429), one whose wait runs out with
+503; both carry a retry_after hint. Overload thus becomes fast, retryable errors
+instead of every generation slowing down.
+
+Runs on the event loop only (no locks). Slot and queue counts are mirrored into the
+TELEMETRY gauges rag_generation_active / rag_generation_queue_depth, queue waits into
+rag_stage_duration_seconds{stage="admission_wait"}.
+"""
+import asyncio
+from collections import deque
+from typing import Deque
+
+from src.telemetry import TELEMETRY
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """A held generation slot. release() is idempotent, so every exit path may call it (on the event loop)."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    def __init__(self, max_active: int = 8, max_queue: int = 32, timeout: float = 30.0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._publish()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> AdmissionSlot:
+        """Waits for a slot; raises AdmissionRejected when the queue is full or the wait times out."""
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            self._publish()
+            return AdmissionSlot(self)
+        if len(self._waiters) >= self.max_queue:
+            TELEMETRY.admission_rejected.inc(reason="queue_full")
+            raise AdmissionRejected(429, "queue_full", self.timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            with TELEMETRY.span("admission_wait"):
+                # shield: a timeout must not cancel a slot handed over at the same moment
+                await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                self._publish()
+                TELEMETRY.admission_rejected.inc(reason="queue_timeout")
+                raise AdmissionRejected(503, "queue_timeout", self.timeout)
+        except asyncio.CancelledError:
+            if waiter.done():
+                self._release()  # pass the slot on
+            else:
+                self._waiters.remove(waiter)
+                self._publish()
+            raise
+        return AdmissionSlot(self)
+
+    def _release(self):
+        # A freed slot goes straight to the oldest waiter; active only drops when nobody waits
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def _publish(self):
+        TELEMETRY.generation_active.set(self.active)
+        TELEMETRY.generation_queue_depth.set(len(self._waiters))
@@ -0,0 +1,162 @@
+"""
+Persistent answer cache for /chat/stream.
+
+Key: normalized question + the exact set of retrieved chunk IDs. Optionally a
+near-duplicate question (cosine similarity of query embeddings above a threshold)
+that retrieved the same chunk set is served as well.
+
+Entries are invalidated when any chunk they cite is re-ingested or deleted:
+ingest_data.py calls invalidate_chunks() for every chunk it touches.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.query_cache import normalize_query
+
+ANSWER_CACHE_FILE = "answer_cache.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    chunk_set TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS answers_chunk_set ON answers(chunk_set);
+CREATE TABLE IF NOT EXISTS answer_chunks (
+    key TEXT NOT NULL,
+    chunk_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answer_chunks_chunk_id ON answer_chunks(chunk_id);
+CREATE INDEX IF NOT EXISTS answer_chunks_key ON answer_chunks(key);
+"""
+
+
+def chunk_set_hash(chunk_ids: Iterable[str]) -> str:
+    return hashlib.sha256(",".join(sorted(set(chunk_ids))).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path: str, similarity_threshold: Optional[float] = None, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+        self.hits = 0
+        self.near_duplicate_hits = 0
+        self.misses = 0
+
+    def _key(self, question: str, chunk_set: str) -> str:
+        return hashlib.sha256(f"{normalize_query(question)}\0{chunk_set}".encode("utf-8")).hexdigest()
+
+    def _fresh(self, created_at: float) -> bool:
+        return self.ttl_seconds is None or time.time() - created_at <= self.ttl_seconds
+
+    def lookup(self, question: str, chunk_ids: List[str], query_embedding=None) -> Optional[Dict[str, Any]]:
+        """
+        Returns {"answer": str, "sources": list} or None.
+        """
+        chunk_set = chunk_set_hash(chunk_ids)
+        key = self._key(question, chunk_set)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT key, answer, sources, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+
+            if (row is None or not self._fresh(row[3])) and self.similarity_threshold is not None and query_embedding is not None:
+                row = self._nearest(chunk_set, query_embedding)
+                if row is not None:
+                    self.near_duplicate_hits += 1
+
+            if row is None or not self._fresh(row[3]):
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE answers SET hits = hits + 1 WHERE key = ?", (row[0],))
+            self._connection.commit()
+            self.hits += 1
+            return {"answer": row[1], "sources": json.loads(row[2])}
+
+    def _nearest(self, chunk_set: str, query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best, best_score = None, self.similarity_threshold
+        rows = self._connection.execute(
+            "SELECT key, answer, sources, created_at, embedding FROM answers "
+            "WHERE chunk_set = ? AND embedding IS NOT NULL", (chunk_set,))
+        for key, answer, sources, created_at, blob in rows:
+            candidate = np.frombuffer(blob, dtype=np.float32)
+            if candidate.shape != query.shape:
+                continue
+            score = float(candidate @ query) / (float(np.linalg.norm(candidate)) or 1.0)
+            if score >= best_score:
+                best, best_score = (key, answer, sources, created_at), score
+        return best
+
+    def store(self, question: str, chunk_ids: List[str], answer: str, sources: List[Dict[str, Any]],
+              query_embedding=None):
+        chunk_set = chunk_set_hash(chunk_ids)
+        key = self._key(question, chunk_set)
+        blob = None
+        if query_embedding is not None:
+            blob = np.asarray(query_embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._connection.execute("DELETE FROM answer_chunks WHERE key = ?", (key,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO answers (key, question, chunk_set, answer, sources, embedding, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_query(question), chunk_set, answer, json.dumps(sources, ensure_ascii=False),
+                 blob, time.time()))
+            self._connection.executemany(
+                "INSERT INTO answer_chunks (key, chunk_id) VALUES (?, ?)",
+                [(key, chunk_id) for chunk_id in sorted(set(chunk_ids))])
+            self._connection.commit()
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """Deletes every answer that cites one of the given chunks. Returns the number removed."""
+        chunk_ids = list(set(chunk_ids))
+        removed = 0
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                keys = [row[0] for row in self._connection.execute(
+                    f"SELECT DISTINCT key FROM answer_chunks WHERE chunk_id IN ({placeholders})", batch)]
+                if not keys:
+                    continue
+                key_placeholders = ",".join("?" * len(keys))
+                removed += self._connection.execute(
+                    f"DELETE FROM answers WHERE key IN ({key_placeholders})", keys).rowcount
+                self._connection.execute(f"DELETE FROM answer_chunks WHERE key IN ({key_placeholders})", keys)
+            self._connection.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_duplicate_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "similarity_threshold": self.similarity_threshold,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,18 +1,51 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
 import sys
 import os
 import json
+import logging
+import math
+import threading
+import time
 import asyncio
 from contextlib import asynccontextmanager
+from starlette.background import BackgroundTask
 
 # Modülleri import edebilmek için yol ayarı
 sys.path.append(os.path.join(os.getcwd(), "src"))
 
-from src.chat_engine import get_rag_chain_streaming, load_retriever, format_docs
+from src.startup import STARTUP_PHASES
+
+# Ağır kütüphaneler (torch, transformers, langchain) burada yüklenmez; chat_engine onları ilk kullanımda import eder
+with STARTUP_PHASES.phase("api_imports"):
+    from src.chat_engine import get_rag_chain_streaming, load_retriever, build_context, create_query_cache, create_answer_cache, search_batch, warmup_llm
+    from src.ingest_manifest import document_chunk_id
+    from src.streaming import stream_in_thread
+    from src.telemetry import TELEMETRY, get_logger, log_event, sample_request
+    from src.admission import AdmissionController, AdmissionRejected
+
+# SSE frame birleştirme politikası: bu kadar karakter birikince veya ilk token bu kadar beklediyse gönder
+SSE_FLUSH_CHARS = int(os.environ.get("SSE_FLUSH_CHARS", "32"))
+SSE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("SSE_FLUSH_INTERVAL_SECONDS", "0.05"))
+# /search/batch tek istekte kabul edilen en fazla sorgu ve sorgu başına sonuç sayısı
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", "4096"))
+SEARCH_BATCH_MAX_K = int(os.environ.get("SEARCH_BATCH_MAX_K", "50"))
+# Açılışta (arka planda) LLM de yüklenip ısıtılsın mı; 0 ise model ilk sohbet isteğinde yüklenir
+WARMUP_LLM = os.environ.get("WARMUP_LLM", "1") == "1"
+# Aynı anda en fazla GENERATION_MAX_ACTIVE sohbet isteği üretim yapar; fazlası en fazla GENERATION_MAX_QUEUE kadar
+# sırada, en fazla GENERATION_QUEUE_TIMEOUT_SECONDS bekler. Sıra doluysa 429, bekleme dolarsa 503 (Retry-After ile)
+GENERATION_MAX_ACTIVE = int(os.environ.get("GENERATION_MAX_ACTIVE", "8"))
+GENERATION_MAX_QUEUE = int(os.environ.get("GENERATION_MAX_QUEUE", "32"))
+GENERATION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("GENERATION_QUEUE_TIMEOUT_SECONDS", "30"))
+# Stream sırasında istemci bağlantısı bu aralıkla kontrol edilir; koparsa üretim bir decode adımı içinde durur
+DISCONNECT_POLL_SECONDS = float(os.environ.get("DISCONNECT_POLL_SECONDS", "0.1"))
+
+# İstek logları: JSON satırları, LOG_LEVEL ile seviye; chunk içerikleri ve prompt sadece DEBUG'da ve
+# LOG_SAMPLE_RATE oranında örneklenen isteklerde yazılır (bkz. src/telemetry.py)
+logger = get_logger("api")
 
 # --- Veri Modelleri ---
 class QueryRequest(BaseModel):
@@ -28,19 +61,66 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceDoc]
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 3
+    source_file: Optional[str] = None  # Sadece bu PDF'in chunk'larında ara
+
+class SearchHit(BaseModel):
+    id: str
+    distance: float
+    source_file: str
+    article_number: str
+    section: str
+    content: str
+
+class BatchSearchResponse(BaseModel):
+    results: List[List[SearchHit]]
+
 # --- Global Değişkenler ---
 retriever = None
+query_cache = None
+answer_cache = None
+admission = AdmissionController(GENERATION_MAX_ACTIVE, GENERATION_MAX_QUEUE, GENERATION_QUEUE_TIMEOUT_SECONDS)
+ready = False
+startup_error = None
 
 # --- Uygulama Başlangıcı (Lifespan) ---
+def warmup():
+    """
+    Retriever, cache'ler ve LLM'i yükler; her aşamanın süresi STARTUP_PHASES'e yazılır.
+    Sunucu bu sırada istek kabul eder: "/" hemen cevap verir, /ready bitene kadar 503 döner.
+    """
+    global retriever, query_cache, answer_cache, ready, startup_error
+    try:
+        with STARTUP_PHASES.phase("retriever"):
+            loaded = load_retriever()
+            if hasattr(loaded, "vectorstore"):
+                query_cache = create_query_cache(loaded)
+        with STARTUP_PHASES.phase("answer_cache"):
+            answer_cache = create_answer_cache()
+        retriever = loaded
+        print("[OK] Retriever Hazir!")
+        if WARMUP_LLM:
+            warmup_llm()
+            print("[OK] Model Hazir!")
+        ready = True
+        print(f"[OK] API hazir ({STARTUP_PHASES.total_seconds:.1f}s)")
+    except Exception as e:
+        startup_error = repr(e)
+        print(f"[HATA] Baslangic basarisiz: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global retriever
     print("[INFO] API Baslatiliyor...")
-    # Retriever'ı bir kere yükle
-    retriever = load_retriever()
-    print("[OK] Retriever Hazir!")
+    # Yükleme arka planda; sağlık kontrolleri ve /ready beklemeden cevap verir
+    warmup_task = asyncio.create_task(asyncio.to_thread(warmup))
     yield
     print("[INFO] API Kapatiliyor...")
+    if not warmup_task.done():
+        print("[INFO] Yukleme henuz bitmemisti.")
+    if answer_cache is not None:
+        answer_cache.close()
 
 app = FastAPI(title="Enerji Mevzuatı Chatbot API", lifespan=lifespan)
 
@@ -58,72 +138,246 @@ app.add_middleware(
 async def root():
     return {"status": "active", "message": "Enerji Chatbot API Hazır"}
 
+@app.get("/ready")
+async def readiness():
+    body = {
+        "ready": ready,
+        "error": startup_error,
+        "uptime_seconds": round(time.time() - STARTUP_PHASES.started_at, 3),
+        "phases": STARTUP_PHASES.report(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Aşama süreleri, ilk token süresi ve decode hızı histogramları (Prometheus metin formatı)."""
+    return PlainTextResponse(TELEMETRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "query_cache": query_cache.stats() if query_cache is not None else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+    }
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch_endpoint(request: BatchSearchRequest):
+    """
+    Sadece retrieval: tüm sorgular tek seferde embed edilir ve tek toplu aramada çalıştırılır.
+    Çevrimdışı uyumluluk araçlarının binlerce sorgusu için /chat/stream döngüsünden çok daha ucuzdur.
+    """
+    if len(request.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"En fazla {SEARCH_BATCH_MAX_QUERIES} sorgu gönderilebilir.")
+    if not 1 <= request.k <= SEARCH_BATCH_MAX_K:
+        raise HTTPException(status_code=422, detail=f"k 1 ile {SEARCH_BATCH_MAX_K} arasında olmalı.")
+    if retriever is None or not hasattr(retriever, "vectorstore"):
+        raise HTTPException(status_code=503, detail="Vektör veritabanı yüklenmedi.")
+    
+    where = {"source_file": request.source_file} if request.source_file else None
+    # Embedding + arama bloklayıcı; event loop'u dondurmamak için thread'de çalışır
+    batches = await asyncio.to_thread(search_batch, retriever.vectorstore, request.queries, request.k, where)
+    
+    results = []
+    for docs_with_scores in batches:
+        results.append([
+            SearchHit(
+                id=document_chunk_id(doc),
+                distance=float(score),
+                source_file=doc.metadata.get('source_file', 'Bilinmiyor'),
+                article_number=str(doc.metadata.get('article_number', 'Belirsiz')),
+                section=str(doc.metadata.get('section', '-')),
+                content=doc.page_content
+            )
+            for doc, score in docs_with_scores
+        ])
+    log_event(logger, logging.INFO, "search_batch", queries=len(request.queries), k=request.k,
+              source_file=request.source_file)
+    return BatchSearchResponse(results=results)
+
+def format_sources(docs):
+    """Kaynakları JSON formatına çevir (aynı dosya + madde bir kez)."""
+    formatted_sources = []
+    seen_docs = set()
+    for doc in docs:
+        src_file = doc.metadata.get('source_file', 'Bilinmiyor')
+        article = doc.metadata.get('article_number', 'Belirsiz')
+        section = doc.metadata.get('section', '-')
+        unique_key = f"{src_file}_{article}"
+        if unique_key not in seen_docs:
+            formatted_sources.append({
+                "source_file": src_file,
+                "article_number": str(article),
+                "section": str(section),
+                "content": doc.page_content
+            })
+            seen_docs.add(unique_key)
+    return formatted_sources
+
+async def watch_disconnect(http_request: Request, cancel: threading.Event):
+    """İstemci bağlantıyı kapatınca cancel'ı set eder (üretim thread'i / scheduler bir adım içinde durur)."""
+    while not cancel.is_set():
+        if await http_request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
 @app.post("/chat/stream")
-async def chat_stream(request: QueryRequest):
-    print(f"\n[SORU] {request.query}")
+async def chat_stream(request: QueryRequest, http_request: Request):
+    received_at = time.perf_counter()
+    log_event(logger, logging.INFO, "chat_request", query=request.query)
+    if retriever is None:
+        raise HTTPException(status_code=503, detail="Sistem henüz hazır değil, /ready ile kontrol edin.")
+    # Bu isteğin chunk içerikleri ve prompt'u DEBUG log'a yazılsın mı (örnekleme)
+    verbose = sample_request(logger)
     
-    async def event_generator():
-        # 1. Kaynakları Bul
-        print("[RETRIEVAL] Veritabanı sorgulanıyor...")
-        
-        # Skorları görmek için retriever'ın altındaki vectorstore'a erişiyoruz
-        if hasattr(retriever, "vectorstore"):
-            # k değerini retriever ayarlarından al, yoksa varsayılan 4
-            k = retriever.search_kwargs.get("k", 4)
-            # (Document, score) tupple'ları döner. Chroma için score genellikle mesafedir (düşük = daha iyi)
-            docs_with_scores = retriever.vectorstore.similarity_search_with_score(request.query, k=k)
-            docs = [doc for doc, _ in docs_with_scores]
-            scores = [score for _, score in docs_with_scores]
+    # 1. Kaynakları Bul
+    # Retrieval, cevap cache'i ve bağlam stream başlamadan yapılır: sadece üretim kabul kontrolünden geçer
+    # ve reddedilen istek hata durum koduyla (429/503) dönebilir
+    retrieval = "retriever"
+    
+    # Skorları görmek için retriever'ın altındaki vectorstore'a erişiyoruz
+    if query_cache is not None:
+        # k değerini retriever ayarlarından al, yoksa varsayılan 4
+        k = retriever.search_kwargs.get("k", 4)
+        # (Document, score) tupple'ları döner. Chroma için score genellikle mesafedir (düşük = daha iyi)
+        # Tekrarlanan sorularda embedding ve arama cache'ten gelir
+        # Embedding + vektör araması bloklayıcı; event loop'u dondurmamak için thread'de çalışır
+        # Soru bir kanunun maddesini adıyla soruyorsa madde indeksinden doğrudan gelir (embedding/arama yok)
+        docs_with_scores = await asyncio.to_thread(query_cache.lookup_article, request.query)
+        if docs_with_scores is not None:
+            retrieval = "article_index"
         else:
-            docs = retriever.invoke(request.query)
-            scores = [None] * len(docs)
-        
-        # Loglama
-        print("-" * 50)
-        for i, (doc, score) in enumerate(zip(docs, scores)):
-            source = doc.metadata.get('source_file', '?')
-            article = doc.metadata.get('article_number', '?')
-            score_txt = f" (Skor/Mesafe: {score:.4f})" if score is not None else ""
-            print(f"[BELGE {i+1}] {source} ({article}){score_txt}")
-            print(f"   Icerik: {doc.page_content}")
-        print("-" * 50)
-        
-        # Kaynakları JSON formatına çevir
-        formatted_sources = []
-        seen_docs = set()
-        for doc in docs:
-            src_file = doc.metadata.get('source_file', 'Bilinmiyor')
-            article = doc.metadata.get('article_number', 'Belirsiz')
-            section = doc.metadata.get('section', '-')
-            unique_key = f"{src_file}_{article}"
-            if unique_key not in seen_docs:
-                formatted_sources.append({
-                    "source_file": src_file,
-                    "article_number": str(article),
-                    "section": str(section),
-                    "content": doc.page_content
-                })
-                seen_docs.add(unique_key)
+            retrieval = "search"
+            docs_with_scores = await asyncio.to_thread(query_cache.search_with_scores, request.query, k)
+        docs = [doc for doc, _ in docs_with_scores]
+        scores = [score for _, score in docs_with_scores]
+    else:
+        docs = await retriever.ainvoke(request.query)
+        scores = [None] * len(docs)
+    
+    # Loglama: kaynaklar her istekte kısa, içerikler sadece örneklenen isteklerde
+    log_event(logger, logging.INFO, "retrieval", source=retrieval, chunks=[
+        {"source_file": doc.metadata.get('source_file', '?'), "article": doc.metadata.get('article_number', '?'),
+         "distance": None if score is None else round(float(score), 4)}
+        for doc, score in zip(docs, scores)
+    ])
+    if verbose:
+        for i, doc in enumerate(docs):
+            log_event(logger, logging.DEBUG, "retrieved_chunk", rank=i + 1, content=doc.page_content)
+    
+    # 2. Cevap cache'i: aynı soru aynı chunk'ları getirdiyse üretim yapmadan aynı SSE protokolüyle tekrar oynat
+    chunk_ids = [document_chunk_id(doc) for doc in docs]
+    query_embedding = None
+    if answer_cache is not None:
+        if answer_cache.similarity_threshold is not None and query_cache is not None:
+            query_embedding = await asyncio.to_thread(query_cache.embed_query, request.query)
+        cached = await asyncio.to_thread(answer_cache.lookup, request.query, chunk_ids, query_embedding)
+        if cached is not None:
+            return StreamingResponse(replay_cached_answer(cached, received_at), media_type="text/event-stream")
+    
+    # Bağlam: ardışık chunk'lar birleştirilir, örtüşmeler ve düşük skorlu chunk'lar atılır, token bütçesine sığdırılır
+    # (tokenizer ilk istekte modelle birlikte yüklenir, bu yüzden thread'de)
+    context = await asyncio.to_thread(build_context, list(zip(docs, scores)))
+    log_event(logger, logging.INFO, "context", chunks=context.input_chunks, passages=len(context.passages),
+              original_tokens=context.original_tokens, tokens=context.tokens,
+              dropped_by_distance=context.dropped_by_distance, dropped_by_budget=context.dropped_by_budget)
+    formatted_sources = format_sources(context.documents)
+    
+    # 3. Kabul kontrolü: sadece üretim bir slot tutar
+    try:
+        slot = await admission.acquire()
+    except AdmissionRejected as e:
+        log_event(logger, logging.WARNING, "chat_rejected", reason=e.reason, active=admission.active,
+                  queued=admission.queue_depth)
+        detail = ("Çok fazla eşzamanlı istek var, lütfen biraz sonra tekrar deneyin." if e.status_code == 429
+                  else "Üretim sırası zaman aşımına uğradı, lütfen tekrar deneyin.")
+        raise HTTPException(status_code=e.status_code, detail=detail,
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if await http_request.is_disconnected():
+        # Sırada beklerken vazgeçen istemci için hiç üretim başlatılmaz
+        slot.release()
+        TELEMETRY.cancelled_requests.inc(stage="queued")
+        log_event(logger, logging.INFO, "chat_cancelled", stage="queued",
+                  seconds=round(time.perf_counter() - received_at, 3))
+        return Response(status_code=499)
+    
+    async def event_generator():
+        # İstemci koptuğunda (izleyici görev, stream iptali veya kapanışı) cancel set edilir ve üretim durur
+        cancel = threading.Event()
+        watcher = asyncio.create_task(watch_disconnect(http_request, cancel))
+        completed = failed = False
+        try:
+            async for frame in answer_frames(cancel):
+                yield frame
+            completed = not cancel.is_set()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            cancel.set()
+            watcher.cancel()
+            slot.release()
+            if not completed and not failed:
+                TELEMETRY.cancelled_requests.inc(stage="generating")
+                log_event(logger, logging.INFO, "chat_cancelled", stage="generating",
+                          seconds=round(time.perf_counter() - received_at, 3))
+    
+    async def answer_frames(cancel: threading.Event):
+        # 4. Generator'ı Başlat
+        # Not: get_rag_chain_streaming senkron çalışıyor (model yükleme, tokenizasyon, streamer okuma).
+        # stream_in_thread onu ayrı bir thread'de tüketir, tokenlar async queue ile gelir ve
+        # boyut/zaman politikasına göre tek SSE frame'inde birleştirilir.
+        stream_gen = get_rag_chain_streaming(request.query, context.text, verbose=verbose, cancel=cancel)
         
-        # 2. Generator'ı Başlat
-        # Not: get_rag_chain_streaming senkron çalışıyor (Thread içinde), 
-        # burada async wrapper ile tokenları alacağız.
-        context_text = format_docs(docs)
-        stream_gen = get_rag_chain_streaming(request.query, context_text)
+        answer_parts = []
+        first_token_seconds = None
+        async for text in stream_in_thread(stream_gen, flush_chars=SSE_FLUSH_CHARS, flush_interval=SSE_FLUSH_INTERVAL_SECONDS):
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - received_at
+                TELEMETRY.time_to_first_token.observe(first_token_seconds, source="generated")
+            answer_parts.append(text)
+            # Token verisi; yield istemciye yazılana kadar bekler (SSE flush süresi)
+            data = json.dumps({"token": text})
+            with TELEMETRY.span("sse_flush"):
+                yield f"data: {data}\n\n"
+        if cancel.is_set():
+            # İstemci koptu: yarım cevap cache'e yazılmaz
+            return
         
-        for token in stream_gen:
-            # Token verisi
-            data = json.dumps({"token": token})
-            yield f"data: {data}\n\n"
-            # Küçük bir gecikme ekleyerek UI akışını pürüzsüzleştirebiliriz (opsiyonel)
-            await asyncio.sleep(0.01)
+        # Tamamlanan cevabı kaynaklarıyla birlikte cache'e yaz
+        if answer_cache is not None and answer_parts:
+            await asyncio.to_thread(answer_cache.store, request.query, chunk_ids, "".join(answer_parts),
+                                    formatted_sources, query_embedding)
             
-        # 3. Bitişte Kaynakları Gönder
+        # 5. Bitişte Kaynakları Gönder
         sources_data = json.dumps({"sources": formatted_sources})
         yield f"data: {sources_data}\n\n"
         yield "event: end\ndata: [DONE]\n\n"
+        TELEMETRY.chat_requests.inc(source="generated")
+        log_event(logger, logging.INFO, "chat_done", source="generated", frames=len(answer_parts),
+                  ttft_seconds=None if first_token_seconds is None else round(first_token_seconds, 3),
+                  seconds=round(time.perf_counter() - received_at, 3))
+
+    async def release_slot():
+        # Async: Starlette senkron background görevlerini thread havuzunda çalıştırır, slot ise event loop'a ait
+        slot.release()
+
+    # Stream hiç başlamadan kapanırsa da slot bırakılsın (release idempotent)
+    return StreamingResponse(event_generator(), media_type="text/event-stream", background=BackgroundTask(release_slot))
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+async def replay_cached_answer(cached, received_at: float):
+    """Cache'teki cevabı üretimle aynı SSE protokolüyle gönderir (kabul kontrolü gerekmez)."""
+    answer = cached["answer"]
+    for start in range(0, len(answer), SSE_FLUSH_CHARS):
+        if start == 0:
+            TELEMETRY.time_to_first_token.observe(time.perf_counter() - received_at, source="answer_cache")
+        with TELEMETRY.span("sse_flush"):
+            yield f"data: {json.dumps({'token': answer[start:start + SSE_FLUSH_CHARS]})}\n\n"
+    yield f"data: {json.dumps({'sources': cached['sources']})}\n\n"
+    yield "event: end\ndata: [DONE]\n\n"
+    TELEMETRY.chat_requests.inc(source="answer_cache")
+    log_event(logger, logging.INFO, "chat_done", source="answer_cache",
+              seconds=round(time.perf_counter() - received_at, 3))
 
 if __name__ == "__main__":
     import uvicorn
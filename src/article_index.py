@@ -0,0 +1,162 @@
+"""
+Structured article lookup: (law number, article_number, section) -> ordered chunk IDs.
+
+Queries that name an article ("6446 sayılı Kanunun 14. maddesi", "MADDE 14 ... 5686
+sayılı") are answered straight from this index: no query embedding, no vector search,
+just a dict lookup and a fetch by ID. The index is built by ingest_data.py from the
+chunk metadata written by TextSplitter._flush_buffer and stored next to the collection.
+
+The law number is the last dotted component of source_file ("1.5.6446.pdf" -> "6446").
+Article numbers are compared in a canonical lower-case form ("GEÇİCİ MADDE 3" ->
+"geçici madde 3", "MADDE 6/A" -> "madde 6/a").
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.query_cache import turkish_lower
+
+ARTICLE_INDEX_FILE = "article_index.json"
+INDEX_FORMAT = 1
+
+_WHITESPACE = re.compile(r"\s+")
+_PREFIX = r"(?P<prefix>(?:ek|geçici)\s+)?"
+_NUMBER = r"(?P<number>\d+(?:\s*/\s*[a-zçğöşü])?)"
+# The ordinal is required: "3 maddede belirtilen", "Kurul 5 madde yayımladı" count articles, not name one
+_ORDINAL = r"(?:\.|['’]?\s*(?:inci|uncu|üncü|nci|ncu|ncü))"
+_JOIN = r"\s*(?:,|-|ve|ile|ila|veya)\s*"
+# "madde 14", "geçici madde 3", "madde 6/a"; "madde 9 ve 10" is a list (see parse_article_reference)
+_ARTICLE_FIRST = re.compile(_PREFIX + r"madde\s*" + _NUMBER + r"\b(?P<more>(?:" + _JOIN + r"\d+\b)*)")
+# "14. madde", "14 üncü maddesi", "14'üncü madde", "ek 2 nci madde"; "9. ve 10.", "4, 5 ve 6. maddeleri" are lists
+_NUMBER_FIRST = re.compile(r"(?P<more>(?:\d+\s*" + _ORDINAL + r"?" + _JOIN + r")*)" + _PREFIX + _NUMBER + r"\s*" + _ORDINAL
+                           + r"\s*madde")
+# "6446 sayılı", "kanun no: 6446"
+_LAW = re.compile(r"(?P<law>\d{3,5})\s*sayili|(?:kanun|yönetmelik)\s*(?:no|numarasi|numarali)\s*[:.]?\s*(?P<law_no>\d{3,5})")
+
+
+def _fold(text: str) -> str:
+    # Splitter metadata comes from str.upper(), which turns "geçici" into "GEÇICI"; fold ı into i
+    return _WHITESPACE.sub(" ", turkish_lower(text)).replace("ı", "i").strip(" .:")
+
+
+def law_number(source_file: str) -> str:
+    return os.path.splitext(os.path.basename(source_file))[0].rsplit(".", 1)[-1]
+
+
+def article_key(article_number: str) -> str:
+    return re.sub(r"\s*/\s*", "/", _fold(article_number))
+
+
+@dataclass(frozen=True)
+class ArticleReference:
+    article: str
+    law: Optional[str] = None
+
+
+def parse_article_reference(query: str) -> Optional[ArticleReference]:
+    """
+    The article a question names; None if it names no article or more than one
+    ("9. ve 10. maddeleri", "madde 3 ... madde 5"), which is left to normal retrieval.
+    """
+    folded = _fold(query)
+    matches = list(_ARTICLE_FIRST.finditer(folded)) + list(_NUMBER_FIRST.finditer(folded))
+    if not matches or any(match.group("more") for match in matches):
+        return None
+    articles = {article_key(f"{match.group('prefix') or ''}madde {match.group('number')}") for match in matches}
+    if len(articles) != 1:
+        return None
+    article = articles.pop()
+    law_match = _LAW.search(folded)
+    law = (law_match.group("law") or law_match.group("law_no")) if law_match else None
+    return ArticleReference(article=article, law=law)
+
+
+class ArticleIndex:
+    def __init__(self, entries: Dict[Tuple[str, str, str], List[str]]):
+        self.entries = entries
+        self._by_article: Dict[Tuple[str, str], List[str]] = {}
+        self._laws: Dict[str, List[str]] = defaultdict(list)
+        for (law, article, _section), chunk_ids in sorted(entries.items()):
+            self._by_article.setdefault((law, article), []).extend(chunk_ids)
+            if law not in self._laws[article]:
+                self._laws[article].append(law)
+
+    @classmethod
+    def build(cls, chunk_ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> "ArticleIndex":
+        grouped: Dict[Tuple[str, str, str], List[Tuple[int, str]]] = defaultdict(list)
+        for chunk_id, metadata in zip(chunk_ids, metadatas):
+            metadata = metadata or {}
+            if not metadata.get("source_file") or not metadata.get("article_number"):
+                continue
+            key = (law_number(metadata["source_file"]), article_key(metadata["article_number"]),
+                   str(metadata.get("section", "")))
+            grouped[key].append((int(metadata.get("chunk_index", 0)), chunk_id))
+        return cls({key: [chunk_id for _, chunk_id in sorted(chunks)] for key, chunks in grouped.items()})
+
+    def lookup(self, law: str, article: str, section: Optional[str] = None) -> List[str]:
+        """Chunk IDs of one article in chunk_index order (all sections unless one is given)."""
+        if section is not None:
+            return list(self.entries.get((law, article_key(article), section), []))
+        return list(self._by_article.get((law, article_key(article)), []))
+
+    def laws_with_article(self, article: str) -> List[str]:
+        return list(self._laws.get(article_key(article), []))
+
+    def resolve(self, query: str) -> Optional[List[str]]:
+        """
+        Chunk IDs for a question that names an article. Without a law number the article
+        must exist in exactly one law, otherwise None (left to the normal retrieval path).
+        """
+        reference = parse_article_reference(query)
+        if reference is None:
+            return None
+        law = reference.law
+        if law is None:
+            laws = self.laws_with_article(reference.article)
+            if len(laws) != 1:
+                return None
+            law = laws[0]
+        return self.lookup(law, reference.article) or None
+
+    def save(self, path: str):
+        payload = {
+            "format": INDEX_FORMAT,
+            "entries": [[law, article, section, chunk_ids]
+                        for (law, article, section), chunk_ids in sorted(self.entries.items())],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ArticleIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported article index format in {path}: {payload.get('format')}")
+        return cls({(law, article, section): chunk_ids for law, article, section, chunk_ids in payload["entries"]})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "laws": len({law for law, _ in self._by_article}),
+            "articles": len(self._by_article),
+            "chunks": sum(len(chunk_ids) for chunk_ids in self.entries.values()),
+        }
+
+
+def load_article_index(persist_dir: str) -> Optional[ArticleIndex]:
+    path = os.path.join(persist_dir, ARTICLE_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    return ArticleIndex.load(path)
+
+
+def build_article_index(collection: Dict[str, Any], persist_dir: str) -> ArticleIndex:
+    """collection: worker.get(include=["metadatas", ...]) result for the whole collection."""
+    index = ArticleIndex.build(collection["ids"], collection["metadatas"])
+    index.save(os.path.join(persist_dir, ARTICLE_INDEX_FILE))
+    return index
@@ -1,14 +1,19 @@
+import logging
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from peft import PeftModel
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from langchain_community.vectorstores import Chroma
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from transformers import TextIteratorStreamer
-from threading import Thread
+import numpy as np
+from threading import RLock, Thread
+# Not: torch, transformers, peft ve langchain burada import edilmez; ilk kullanıldıkları fonksiyonda yüklenirler.
+# Böylece API süreci (health check, /ready) ve CLI araçları modeller yüklenmeden anında açılır.
+
+from src.query_cache import QueryCache
+from src.lexical_index import load_lexical_index
+from src.article_index import load_article_index
+from src.ingest_manifest import manifest_stamp
+from src.answer_cache import AnswerCache, ANSWER_CACHE_FILE
+from src.prompts import RAG_PROMPT_TEMPLATE, split_template
+from src.context_builder import ContextBuilder, BuiltContext, DOCUMENT_SEPARATOR
+from src.startup import STARTUP_PHASES
+from src.telemetry import TELEMETRY, get_logger, log_event
 
 # --- Yapılandırma ---
 CURRENT_DIR = os.getcwd()
@@ -17,113 +22,466 @@ EMBEDDING_MODEL_NAME = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
 # Adapter config'den aldığımız temel model
 BASE_MODEL_NAME = "google/gemma-3-4b-it"
 ADAPTER_PATH = os.path.join(CURRENT_DIR, "fine_tuned_models", "gemma3-4b-lora-final")
+# Temel model + LoRA bir kez birleştirilip sürümlü safetensors olarak buraya yazılır (bkz. src/model_artifact.py);
+# sonraki açılışlarda PeftModel/merge_and_unload yerine doğrudan bellek eşlemeli olarak yüklenir
+MERGED_MODEL_DIR = os.environ.get("MERGED_MODEL_DIR", os.path.join(CURRENT_DIR, "fine_tuned_models", "merged"))
+MERGED_MODEL_ENABLED = os.environ.get("MERGED_MODEL_ENABLED", "1") == "1"
+# Çıkarım profili: "default" (bfloat16, device_map="auto") veya "cpu-int8" (GPU'suz sunucular için: üretici ve
+# embedding modelinin Linear katmanları dinamik int8, torch thread sayısı INFERENCE_THREADS; nicemlenmiş ağırlıklar
+# kalite kontrolünden sonra diske yazılır, bkz. src/cpu_profile.py)
+INFERENCE_PROFILE = os.environ.get("INFERENCE_PROFILE", "default")
+INFERENCE_THREADS = int(os.environ["INFERENCE_THREADS"]) if os.environ.get("INFERENCE_THREADS") else None
+EMBEDDING_QUANTIZED_DIR = os.path.join(CURRENT_DIR, "embedding_cache", "cpu-int8", EMBEDDING_MODEL_NAME.replace("/", "__"))
+# Sorgu embedding'i: "torch" (HuggingFaceEmbeddings) veya "onnx" (BERT + mean pooling tek bir ONNX Runtime grafiği,
+# ilk açılışta dışa aktarılıp mevcut yola göre kosinüs > 0.999 ile doğrulanır, bkz. src/onnx_encoder.py).
+# ingest_data.py --embedding-backend onnx aynı dışa aktarımı kullanır (ikisi de ENCODER_MAX_LENGTH ile).
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.path.join(CURRENT_DIR, "embedding_cache", "onnx", EMBEDDING_MODEL_NAME.replace("/", "__"))
+# Üretim modu: "thread" = her istek için ayrı model.generate thread'i,
+# "batched" = tüm eşzamanlı istekleri tek batch'te çalıştıran GenerationScheduler
+GENERATION_MODE = os.environ.get("GENERATION_MODE", "thread")
+GENERATION_MAX_BATCH_TOKENS = int(os.environ.get("GENERATION_MAX_BATCH_TOKENS", "16384"))
+GENERATION_MAX_BATCH_SIZE = int(os.environ.get("GENERATION_MAX_BATCH_SIZE", "8"))
+GENERATION_KWARGS = dict(
+    max_new_tokens=1024,      # Daha uzun cevaplar için artırıldı
+    temperature=0.3,          # Biraz daha akıcılık için artırıldı
+    do_sample=True,
+    top_p=0.95,
+    repetition_penalty=1.05   # Çok katı olmaması için düşürüldü
+)
+# Şablonun {context}'ten önceki sabit talimat bloğunun KV cache'i model yüklenirken bir kez hesaplanır,
+# her üretim bu durumdan (kopyalamadan) başlar; sadece bağlam + soru prefill edilir
+PREFIX_CACHE_ENABLED = os.environ.get("PREFIX_CACHE_ENABLED", "1") == "1"
+# Prompt bağlamı: aynı maddenin ardışık chunk'ları örtüşmesi ve tekrarlanan madde öneki çıkarılarak birleştirilir,
+# mesafesi CONTEXT_MAX_DISTANCE'ı aşan chunk'lar atılır (boş = eşik yok), kalanlar Gemma tokenizer'ı ile
+# ölçülen CONTEXT_TOKEN_BUDGET'a sığdırılır
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MAX_DISTANCE = float(os.environ["CONTEXT_MAX_DISTANCE"]) if os.environ.get("CONTEXT_MAX_DISTANCE") else None
+# Vektör arama altyapısı: "chroma" veya "numpy" (küçük korpus için süreç içi tam arama, bkz. src/numpy_store.py)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+# numpy altyapısında iki aşamalı arama: "int8", "pca" veya "pca-int8" sıkıştırılmış ilk tarama +
+# VECTOR_RESCORE_CANDIDATES aday için tam hassasiyetli yeniden skorlama. Boş = tam tarama.
+VECTOR_FIRST_STAGE = os.environ.get("VECTOR_FIRST_STAGE") or None
+VECTOR_RESCORE_CANDIDATES = int(os.environ.get("VECTOR_RESCORE_CANDIDATES", "64"))
+# Tekrarlanan sorular için sorgu embedding'i ve arama sonucu cache'i
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_CACHE_TTL_SECONDS", "3600"))
+# BM25 sözlüksel indeks (ingest_data.py üretir): "MADDE 14", "6446" gibi tam eşleşmeleri yakalar,
+# vektör sonuçlarıyla reciprocal rank fusion ile birleştirilir
+LEXICAL_SEARCH_ENABLED = os.environ.get("LEXICAL_SEARCH_ENABLED", "1") == "1"
+LEXICAL_FUSION_CANDIDATES = int(os.environ.get("LEXICAL_FUSION_CANDIDATES", "4"))
+# Soruda kanun + madde geçiyorsa ("6446 sayılı Kanunun 14. maddesi") maddenin chunk'ları doğrudan getirilir
+ARTICLE_LOOKUP_ENABLED = os.environ.get("ARTICLE_LOOKUP_ENABLED", "1") == "1"
+ARTICLE_LOOKUP_MAX_CHUNKS = int(os.environ.get("ARTICLE_LOOKUP_MAX_CHUNKS", "8"))
+# Aynı soru + aynı kaynak chunk'ları için üretilmiş cevabı tekrar kullan.
+# ANSWER_CACHE_SIMILARITY verilirse (örn. 0.95) benzer sorular da cache'ten cevaplanır.
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.environ["ANSWER_CACHE_SIMILARITY"]) if os.environ.get("ANSWER_CACHE_SIMILARITY") else None
 
 # Modeli global olarak yükleyelim ki her istekte tekrar yüklenmesin (API için)
 _global_model = None
 _global_tokenizer = None
+_model_lock = RLock()
+_generation_scheduler = None
+_prefix_cache = None
+logger = get_logger("chat_engine")
 
-def load_retriever(k: int = 3):
+def load_retriever(k: int = 3, backend: str = None):
     """
-    ChromaDB vektör veritabanını yükler ve bir retriever döndürür.
+    Vektör veritabanını yükler ve bir retriever döndürür.
     k: Getirilecek en alakalı belge sayısı.
+    backend: "chroma" (varsayılan) veya "numpy" (ingest_data.py'nin yazdığı bellek eşlemeli tam arama deposu,
+             chromadb import edilmez). Verilmezse VECTOR_BACKEND ortam değişkeni kullanılır.
     """
-    print(f"[INFO] Veritabanina baglaniliyor: {PERSIST_DIRECTORY}")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    backend = backend or VECTOR_BACKEND
+    print(f"[INFO] Veritabanina baglaniliyor: {PERSIST_DIRECTORY} ({backend})")
+    embeddings = load_embeddings()
     
-    vectorstore = Chroma(
-        persist_directory=PERSIST_DIRECTORY,
-        embedding_function=embeddings,
-        collection_name="enerji_mevzuati"
-    )
+    if backend == "numpy":
+        from src.numpy_store import NumpyVectorStore
+        vectorstore = NumpyVectorStore(PERSIST_DIRECTORY, embeddings, first_stage=VECTOR_FIRST_STAGE,
+                                       rescore_candidates=VECTOR_RESCORE_CANDIDATES)
+    elif backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+        vectorstore = Chroma(
+            persist_directory=PERSIST_DIRECTORY,
+            embedding_function=embeddings,
+            collection_name="enerji_mevzuati"
+        )
+    else:
+        raise ValueError(f"Bilinmeyen VECTOR_BACKEND: {backend}")
     
     return vectorstore.as_retriever(search_kwargs={"k": k})
 
+def load_embeddings():
+    """
+    Sorgu embedding modelini EMBEDDING_BACKEND'e göre yükler. ONNX dışa aktarımı yoksa veya
+    kullanılamıyorsa HuggingFaceEmbeddings'e (INFERENCE_PROFILE=cpu-int8 ise int8) düşülür.
+    """
+    embeddings = None
+    if EMBEDDING_BACKEND == "onnx":
+        with STARTUP_PHASES.phase("embedding_onnx"):
+            onnx_embeddings, embeddings = _load_onnx_embeddings()
+        if onnx_embeddings is not None:
+            return onnx_embeddings
+    elif EMBEDDING_BACKEND != "torch":
+        raise ValueError(f"Bilinmeyen EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    
+    if embeddings is None:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    if INFERENCE_PROFILE == "cpu-int8":
+        with STARTUP_PHASES.phase("embedding_int8"):
+            quantize_embeddings(embeddings)
+    return embeddings
+
+def _load_onnx_embeddings():
+    """
+    ONNX Runtime embedding'i; dışa aktarım yoksa HuggingFaceEmbeddings'ten bir kez dışa aktarır.
+    (onnx_embeddings, dışa aktarım için yüklenen HuggingFaceEmbeddings veya None) döndürür;
+    başarısız olursa (onnxruntime yok, kosinüs eşiği tutmadı) onnx_embeddings None'dır.
+    """
+    from src.onnx_encoder import OnnxEmbeddings, export_encoder, find_encoder
+    
+    reference = None
+    try:
+        if find_encoder(EMBEDDING_ONNX_DIR, EMBEDDING_MODEL_NAME) is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            reference = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+            client = getattr(reference, "_client", None) or reference.client  # SentenceTransformer
+            path = export_encoder(client[0].auto_model, client.tokenizer, EMBEDDING_ONNX_DIR, EMBEDDING_MODEL_NAME,
+                                  lambda texts: client.encode(list(texts)))
+            print(f"[OK] Embedding modeli ONNX'e aktarildi: {path}")
+        embeddings = OnnxEmbeddings(EMBEDDING_ONNX_DIR, EMBEDDING_MODEL_NAME, threads=INFERENCE_THREADS)
+        print("[OK] Embedding modeli ONNX Runtime ile calisiyor")
+        return embeddings, reference
+    except (ImportError, RuntimeError, ValueError) as e:
+        print(f"[HATA] ONNX embedding kullanilamiyor, torch kullaniliyor: {e}")
+        return None, reference
+
+def quantize_embeddings(embeddings):
+    """
+    HuggingFaceEmbeddings'in içindeki BERT encoder'ı dinamik int8'e çevirir (yerinde).
+    Kosinüs benzerliği float32'ye göre MIN_EMBEDDING_COSINE altındaysa float32 model kalır.
+    """
+    from src.cpu_profile import PROBE_TEXTS, configure_threads, quantize_encoder
+    
+    configure_threads(INFERENCE_THREADS)
+    client = getattr(embeddings, "_client", None) or embeddings.client  # SentenceTransformer
+    transformer = client[0]
+    float_model = transformer.auto_model
+    
+    def encode(model):
+        transformer.auto_model = model
+        try:
+            return np.asarray(client.encode(PROBE_TEXTS), dtype=np.float32)
+        finally:
+            transformer.auto_model = float_model
+    
+    try:
+        transformer.auto_model = quantize_encoder(float_model, encode, cache_dir=EMBEDDING_QUANTIZED_DIR)
+        print("[OK] Embedding modeli int8")
+    except ValueError as e:
+        print(f"[HATA] Embedding modeli int8'e cevrilmedi, float32 kullaniliyor: {e}")
+
+def search_batch(vectorstore, queries, k: int = 3, where=None):
+    """
+    Birden çok sorgu için tek embed_documents çağrısı + tek toplu vektör araması.
+    Her sorgu için [(Document, mesafe)] listesi döner (mesafe = 1 - kosinüs, düşük = daha iyi).
+    """
+    if not queries:
+        return []
+    from langchain_core.documents import Document
+    
+    embeddings = np.asarray(vectorstore.embeddings.embed_documents(list(queries)), dtype=np.float32)
+    
+    if hasattr(vectorstore, "batch_search_by_vectors"):
+        return vectorstore.batch_search_by_vectors(embeddings, k=k, filter=where)
+    
+    # Chroma: tüm sorgular koleksiyona tek query çağrısında gider
+    result = vectorstore._collection.query(
+        query_embeddings=embeddings.tolist(),
+        n_results=k,
+        where=where or None,
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        [(Document(page_content=text, metadata=metadata or {}, id=chunk_id), float(distance))
+         for chunk_id, text, metadata, distance in zip(ids, documents, metadatas, distances)]
+        for ids, documents, metadatas, distances in zip(result["ids"], result["documents"],
+                                                        result["metadatas"], result["distances"])
+    ]
+
+def create_query_cache(retriever) -> QueryCache:
+    """
+    Retriever'ın vectorstore'u üzerine sorgu embedding'i ve arama sonucu cache'i kurar.
+    ingest_data.py koleksiyonu değiştirdiğinde (manifest güncellenir) cache otomatik temizlenir.
+    Sözlüksel indeks varsa arama hibrit yapılır; madde indeksi varsa "6446 sayılı ... 14. madde" gibi
+    sorular embedding ve arama yapılmadan doğrudan cevaplanır. İndeksler de aynı anda yeniden yüklenir.
+    """
+    return QueryCache(
+        retriever.vectorstore,
+        version_fn=lambda: manifest_stamp(PERSIST_DIRECTORY),
+        max_entries=QUERY_CACHE_SIZE,
+        ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+        lexical_index_fn=(lambda: load_lexical_index(PERSIST_DIRECTORY)) if LEXICAL_SEARCH_ENABLED else None,
+        fusion_candidates=LEXICAL_FUSION_CANDIDATES,
+        article_index_fn=(lambda: load_article_index(PERSIST_DIRECTORY)) if ARTICLE_LOOKUP_ENABLED else None,
+        article_max_chunks=ARTICLE_LOOKUP_MAX_CHUNKS
+    )
+
+def create_answer_cache():
+    """
+    Kalıcı cevap cache'i (chroma_db/answer_cache.sqlite3). ingest_data.py yeniden yüklenen
+    chunk'lara atıf yapan cevapları buradan siler.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    return AnswerCache(os.path.join(PERSIST_DIRECTORY, ANSWER_CACHE_FILE), similarity_threshold=ANSWER_CACHE_SIMILARITY)
+
 def load_llm_streaming():
     """
     Streaming destekli model ve tokenizer'ı yükler.
     Geriye (model, tokenizer) döner.
+    Birleştirilmiş model artifact'ı varsa doğrudan o yüklenir; yoksa temel model + LoRA birleştirilir
+    ve (MERGED_MODEL_ENABLED ise) sonraki açılışlar için artifact olarak kaydedilir.
     """
     global _global_model, _global_tokenizer
     
     if _global_model is not None:
         return _global_model, _global_tokenizer
+    
+    # Warmup thread'i ile ilk istek aynı anda gelirse model bir kez yüklenir
+    with _model_lock:
+        if _global_model is not None:
+            return _global_model, _global_tokenizer
+        
+        with STARTUP_PHASES.phase("llm_imports"):
+            import torch
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            from src.model_artifact import artifact_version, find_artifact, write_artifact
+        
+        version = artifact_version(BASE_MODEL_NAME, ADAPTER_PATH, "bfloat16")
+        artifact_path = find_artifact(MERGED_MODEL_DIR, version) if MERGED_MODEL_ENABLED else None
+        model = None
+        # int8 dinamik nicemleme sadece CPU'da çalışır
+        device_map = "cpu" if INFERENCE_PROFILE == "cpu-int8" else "auto"
+        
+        if INFERENCE_PROFILE == "cpu-int8":
+            from src.cpu_profile import configure_threads
+            print(f"[INFO] CPU int8 profili, torch thread'leri: {configure_threads(INFERENCE_THREADS)}")
+            if artifact_path is not None:
+                model, tokenizer = _load_cached_int8(artifact_path)
+        
+        if model is None and artifact_path is not None:
+            print(f"[INFO] Birlestirilmis model yukleniyor: {artifact_path}")
+            with STARTUP_PHASES.phase("llm_load_merged"):
+                tokenizer = AutoTokenizer.from_pretrained(artifact_path)
+                model = AutoModelForCausalLM.from_pretrained(
+                    artifact_path,
+                    device_map=device_map,
+                    torch_dtype=torch.bfloat16
+                )
+        elif model is None:
+            print(f"[INFO] Tokenizer yukleniyor: {ADAPTER_PATH}")
+            with STARTUP_PHASES.phase("llm_load_base"):
+                try:
+                    tokenizer = AutoTokenizer.from_pretrained(ADAPTER_PATH)
+                except:
+                    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
+                
+                print(f"[INFO] Temel Model Yukleniyor: {BASE_MODEL_NAME}")
+                base_model = AutoModelForCausalLM.from_pretrained(
+                    BASE_MODEL_NAME,
+                    device_map=device_map,
+                    torch_dtype=torch.bfloat16,
+                    trust_remote_code=True
+                )
+            
+            print(f"[INFO] LoRA Adapter Entegre Ediliyor: {ADAPTER_PATH}")
+            with STARTUP_PHASES.phase("lora_merge"):
+                from peft import PeftModel
+                model = PeftModel.from_pretrained(base_model, ADAPTER_PATH)
+                model = model.merge_and_unload()
+            
+            if MERGED_MODEL_ENABLED:
+                print(f"[INFO] Birlestirilmis model kaydediliyor: {MERGED_MODEL_DIR} (surum {version})")
+                with STARTUP_PHASES.phase("merged_artifact_save"):
+                    try:
+                        artifact_path = write_artifact(model, tokenizer, MERGED_MODEL_DIR, version, BASE_MODEL_NAME,
+                                                       ADAPTER_PATH, "bfloat16")
+                    except OSError as e:
+                        print(f"[HATA] Birlestirilmis model kaydedilemedi: {e}")
+        
+        if INFERENCE_PROFILE == "cpu-int8" and not _is_quantized(model):
+            model = _quantize_llm(model, tokenizer, artifact_path)
+        
+        _global_model = model
+        _global_tokenizer = tokenizer
+        
+        if PREFIX_CACHE_ENABLED:
+            with STARTUP_PHASES.phase("prefix_cache"):
+                get_prefix_cache()
+    
+    return model, tokenizer
 
-    print(f"[INFO] Tokenizer yukleniyor: {ADAPTER_PATH}")
-    try:
-        tokenizer = AutoTokenizer.from_pretrained(ADAPTER_PATH)
-    except:
-        tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
-
-    print(f"[INFO] Temel Model Yukleniyor: {BASE_MODEL_NAME}")
-    base_model = AutoModelForCausalLM.from_pretrained(
-        BASE_MODEL_NAME,
-        device_map="auto",
-        torch_dtype=torch.bfloat16,
-        trust_remote_code=True
-    )
+def _is_quantized(model) -> bool:
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+    return any(isinstance(module, DynamicQuantizedLinear) for module in model.modules())
+
+def _load_cached_int8(artifact_path):
+    """Birleştirilmiş artifact'ın yanındaki nicemlenmiş ağırlıkları yükler; yoksa (None, None)."""
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+    from src.cpu_profile import empty_skeleton, load_quantized
     
-    print(f"[INFO] LoRA Adapter Entegre Ediliyor: {ADAPTER_PATH}")
-    model = PeftModel.from_pretrained(base_model, ADAPTER_PATH)
-    model = model.merge_and_unload()
+    config = AutoConfig.from_pretrained(artifact_path)
+    with STARTUP_PHASES.phase("llm_load_int8"):
+        model = load_quantized(lambda: empty_skeleton(lambda: AutoModelForCausalLM.from_config(config)),
+                               os.path.join(artifact_path, "cpu-int8"))
+    if model is None:
+        return None, None
+    print(f"[INFO] Nicemlenmis (int8) model yuklendi: {artifact_path}")
+    return model, AutoTokenizer.from_pretrained(artifact_path)
+
+def _quantize_llm(model, tokenizer, artifact_path):
+    """Modeli int8'e çevirir, float32'ye göre KL sapmasını kontrol eder ve (artifact varsa) diske yazar."""
+    from src.cpu_profile import quantize_generator
     
-    _global_model = model
-    _global_tokenizer = tokenizer
+    probe = RAG_PROMPT_TEMPLATE.format(
+        context="MADDE 14 - (1) Lisans sahibi tüzel kişiler, lisanslarında belirtilen faaliyetler dışında faaliyette bulunamaz.",
+        question="Lisans sahibi şirketler hangi faaliyetleri yapabilir?"
+    )
+    cache_dir = os.path.join(artifact_path, "cpu-int8") if artifact_path else None
+    with STARTUP_PHASES.phase("llm_quantize_int8"):
+        try:
+            return quantize_generator(model, tokenizer, probe, cache_dir=cache_dir)
+        except ValueError as e:
+            print(f"[HATA] Model int8'e cevrilmedi, float32 kullaniliyor: {e}")
+            return model.float()
+
+def warmup_llm():
+    """
+    Modeli yükler ve tek tokenlık bir üretimle ısıtır (ilk isteğin ödeyeceği bellek ayırma / kernel
+    hazırlığını açılışa taşır). API lifespan'inde arka planda çağrılır.
+    """
+    import torch
     
-    return model, tokenizer
+    model, tokenizer = load_llm_streaming()
+    with STARTUP_PHASES.phase("llm_warmup"):
+        inputs = tokenizer("Merhaba", return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            model.generate(**inputs, max_new_tokens=1, do_sample=False)
+
+def get_prefix_cache(template: str = RAG_PROMPT_TEMPLATE):
+    """
+    Şablonun sabit önekinin (system prompt) KV cache'i. Önek metni değişmedikçe aynı nesne döner,
+    değişirse bir kez yeniden hesaplanır. PREFIX_CACHE_ENABLED=0 ise None döner.
+    """
+    global _prefix_cache
+    if not PREFIX_CACHE_ENABLED:
+        return None
+    model, tokenizer = load_llm_streaming()
+    prefix_text, _ = split_template(template)
+    from src.prefix_cache import build_prefix_cache
+    
+    previous = _prefix_cache
+    _prefix_cache = build_prefix_cache(model, tokenizer, prefix_text, current=_prefix_cache)
+    if _prefix_cache is not previous:
+        print(f"[OK] Prompt onek KV cache'i hazir ({len(_prefix_cache)} token)")
+    return _prefix_cache
+
+def get_generation_scheduler():
+    """
+    Global modeli paylaşan tek GenerationScheduler'ı (ilk çağrıda) oluşturur.
+    """
+    global _generation_scheduler
+    if _generation_scheduler is None:
+        model, tokenizer = load_llm_streaming()
+        from src.generation_scheduler import GenerationScheduler
+        _generation_scheduler = GenerationScheduler(
+            model,
+            tokenizer,
+            max_batch_tokens=GENERATION_MAX_BATCH_TOKENS,
+            max_batch_size=GENERATION_MAX_BATCH_SIZE
+        )
+    return _generation_scheduler
 
 def format_docs(docs):
     # Belgeler arasına net bir ayraç koyarak modelin karışmamasını sağlayalım
-    return "\n\n--- YENİ BELGE ---\n\n".join(doc.page_content for doc in docs)
+    return DOCUMENT_SEPARATOR.join(doc.page_content for doc in docs)
+
+def build_context(docs_with_scores) -> BuiltContext:
+    """
+    (Document, mesafe) listesinden prompt bağlamını kurar (bkz. src/context_builder.py).
+    Tokenlar LLM'in kendi tokenizer'ı ile sayılır; sonuç kullanılan chunk'ları ve kazanılan token sayısını içerir.
+    """
+    _, tokenizer = load_llm_streaming()
+    builder = ContextBuilder(
+        lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"]),
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        max_distance=CONTEXT_MAX_DISTANCE
+    )
+    with TELEMETRY.span("context_build"):
+        return builder.build(docs_with_scores)
 
-def get_rag_chain_streaming(question: str, context: str):
+def get_rag_chain_streaming(question: str, context: str, verbose: bool = False, cancel=None):
     """
     Generator fonksiyonu: Verilen bağlam ve soruya göre cevabı parça parça üretir.
+    verbose: prompt DEBUG log'a yazılır (API örneklenen isteklerde verir, bkz. src/telemetry.py).
+    cancel: threading.Event; set edilince üretim bir decode adımı içinde durur (API istemci koptuğunda set eder),
+    o ana kadar üretilen tokenlar rag_cancelled_tokens_total'a yazılır.
+    Prompt tokenizasyonu, prefill ve decode hızı TELEMETRY'ye yazılır.
     """
     model, tokenizer = load_llm_streaming()
     
     # Not: Retrieval işlemi dışarıda (API katmanında) yapılıp buraya sadece metin (context) gelecek.
     
     # 2. Prompt Hazırla
-    template = """<start_of_turn>user
-Sen Türkiye Enerji Mevzuatı konusunda uzman, yardımsever bir asistansın. 
-Aşağıda farklı kaynaklardan alınmış 'Mevzuat Bağlamı' parçaları verilmiştir.
-Bu parçalardaki bilgileri BİRLEŞTİREREK ve SENTEZLEYEREK soruyu detaylıca cevapla.
-Eğer bir cümle yarım kalmışsa (kesilmişse), o cümleyi ihmal et.
-Sadece verilen bağlamdaki bilgileri kullan, dışarıdan bilgi ekleme.
-Eğer cevap bağlamda hiç yoksa "Verilen mevzuat metinlerinde bu sorunun cevabı bulunmamaktadır." de.
-
-Mevzuat Bağlamı:
-{context}
-
-Soru:
-{question}<end_of_turn>
-<start_of_turn>model
-"""
-    prompt_text = template.format(context=context, question=question)
-    
-    # --- DETAYLI LOGLAMA ---
-    print("\n" + "="*50)
-    print(f"[PROMPT] LLM'e Giden Metin ({len(prompt_text)} karakter):")
-    print("-" * 20)
-    print(prompt_text.replace(context, f"[...BAĞLAM ({len(context)} karakter)...]")) # Bağlamı kısaltarak göster
-    print("="*50 + "\n")
-    # -----------------------
-
-    inputs = tokenizer(prompt_text, return_tensors="pt").to(model.device)
-    
-    # 3. Streamer Oluştur
-    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    prompt_text = RAG_PROMPT_TEMPLATE.format(context=context, question=question)
+    if verbose:
+        # Bağlamı kısaltarak göster
+        log_event(logger, logging.DEBUG, "prompt", characters=len(prompt_text),
+                  prompt=prompt_text.replace(context, f"[...BAĞLAM ({len(context)} karakter)...]"))
+
+    if GENERATION_MODE == "batched":
+        # Eşzamanlı isteklerle aynı batch'te üretilir; tokenlar bu isteğin kendi kuyruğundan gelir
+        with TELEMETRY.span("prompt_tokenization"):
+            prompt_ids = tokenizer(prompt_text)["input_ids"]
+        timer = TELEMETRY.generation()
+        options = dict(GENERATION_KWARGS, prefix=get_prefix_cache())
+        if cancel is not None:
+            # Scheduler iptal edilen isteği sıradayken atlar, batch'teyse bir sonraki adımda çıkarır
+            options["cancelled"] = cancel
+        request = get_generation_scheduler().submit(prompt_ids, **options)
+        for new_text in request:
+            # Metin parçaları token sayısıyla eşleşmez; sadece zaman işaretlenir, sayı sonda request'ten alınır
+            timer.add_tokens(0)
+            yield new_text
+        timer.finish(len(request.generated_ids))
+        if request.cancelled.is_set():
+            TELEMETRY.cancelled_tokens.inc(len(request.generated_ids))
+        return
+
+    with TELEMETRY.span("prompt_tokenization"):
+        inputs = tokenizer(prompt_text, return_tensors="pt").to(model.device)
+    
+    # 3. Streamer Oluştur (yeni tokenları sayar: prefill süresi ve decode hızı)
+    timer = TELEMETRY.generation()
+    streamer = _timed_streamer(tokenizer, timer)
     
     # 4. Üretimi Ayrı Thread'de Başlat
     generation_kwargs = dict(
         **inputs, 
         streamer=streamer, 
-        max_new_tokens=1024,      # Daha uzun cevaplar için artırıldı
-        temperature=0.3,          # Biraz daha akıcılık için artırıldı
-        do_sample=True,
-        top_p=0.95,
-        repetition_penalty=1.05   # Çok katı olmaması için düşürüldü
+        **GENERATION_KWARGS
     )
+    prefix_cache = get_prefix_cache()
+    if prefix_cache is not None and prefix_cache.matches(inputs["input_ids"][0].tolist()):
+        # Önek zaten cache'te: generate sadece kalan tokenları prefill eder
+        generation_kwargs["past_key_values"] = prefix_cache.fork()
+    if cancel is not None:
+        generation_kwargs["stopping_criteria"] = _cancel_criteria(cancel)
     
     thread = Thread(target=model.generate, kwargs=generation_kwargs)
     thread.start()
@@ -131,7 +489,32 @@ Soru:
     # 5. Token'ları Yakala ve Gönder
     for new_text in streamer:
         yield new_text
+    timer.finish()
+    if cancel is not None and cancel.is_set():
+        TELEMETRY.cancelled_tokens.inc(timer.tokens)
+
+def _timed_streamer(tokenizer, timer):
+    """TextIteratorStreamer; prompt dışındaki her put çağrısında timer'a token ekler."""
+    from transformers import TextIteratorStreamer
+    
+    class TimedStreamer(TextIteratorStreamer):
+        def put(self, value):
+            if not self.next_tokens_are_prompt:
+                timer.add_tokens(value.numel())
+            super().put(value)
+    
+    return TimedStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
 
+def _cancel_criteria(cancel):
+    """generate döngüsünü cancel set edildiği adımda bitiren StoppingCriteriaList."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), cancel.is_set(), dtype=torch.bool, device=input_ids.device)
+    
+    return StoppingCriteriaList([CancelCriteria()])
 
 if __name__ == "__main__":
     # Dosya doğrudan çalıştırılırsa test modu başlar
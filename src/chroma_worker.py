@@ -1,54 +1,120 @@
 import sys
-import json
-import chromadb
 import os
+import chromadb
+
+# The worker is started as "python src/chroma_worker.py", so make the protocol module importable.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from worker_protocol import read_frame, write_frame, decode_embeddings, encode_embeddings
+
+# stdout carries binary frames only; every log line goes to stderr.
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+def _batches(size: int, max_batch_size: int):
+    for start in range(0, size, max_batch_size):
+        yield start, min(start + max_batch_size, size)
 
-# Increase field limit for large JSONs
-json_limit = 100 * 1024 * 1024 # 100MB
-sys.set_int_max_str_digits(0) # Python 3.11+ safety limit removal if needed
+def handle(client, collection, header, body):
+    op = header.get("op")
+
+    if op in ("add", "upsert"):
+        ids = header.get("ids", [])
+        documents = header.get("documents", [])
+        metadatas = header.get("metadatas", [])
+        embeddings = decode_embeddings(body, header.get("count", 0), header.get("dim", 0))
+        if not ids:
+            return {"written": 0}, b""
+
+        write = collection.add if op == "add" else collection.upsert
+        # Chroma rejects single calls larger than its internal batch limit
+        max_batch_size = client.get_max_batch_size() if hasattr(client, "get_max_batch_size") else len(ids)
+        for start, end in _batches(len(ids), max_batch_size):
+            write(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end]
+            )
+        return {"written": len(ids)}, b""
+
+    if op == "delete":
+        ids = header.get("ids")
+        where = header.get("where")
+        if not ids and not where:
+            return {"deleted": 0}, b""
+        before = collection.count()
+        collection.delete(ids=ids or None, where=where or None)
+        return {"deleted": before - collection.count()}, b""
+
+    if op == "query":
+        embeddings = decode_embeddings(body, header.get("count", 0), header.get("dim", 0))
+        result = collection.query(
+            query_embeddings=embeddings,
+            n_results=header.get("n_results", 3),
+            where=header.get("where") or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return {"result": {
+            "ids": result["ids"],
+            "documents": result["documents"],
+            "metadatas": result["metadatas"],
+            "distances": [[float(d) for d in row] for row in result["distances"]],
+        }}, b""
+
+    if op == "get":
+        include = header.get("include") or ["documents", "metadatas"]
+        result = collection.get(ids=header.get("ids") or None, where=header.get("where") or None, include=include)
+        response = {"result": {key: result[key] for key in ["ids"] + [k for k in include if k != "embeddings"]}}
+        response_body = b""
+        if "embeddings" in include:
+            response_body, count, dim = encode_embeddings(result["embeddings"])
+            response.update({"count": count, "dim": dim})
+        return response, response_body
+
+    if op == "count":
+        return {"count": collection.count()}, b""
+
+    raise ValueError(f"Unknown operation: {op}")
 
 def main():
-    print(f"Worker using ChromaDB version: {chromadb.__version__}", file=sys.stdout)
+    persist_directory = sys.argv[1] if len(sys.argv) > 1 else "chroma_db"
+    collection_name = sys.argv[2] if len(sys.argv) > 2 else "enerji_mevzuati"
+
+    # Keep the real stdout for frames; stray prints (ours or chromadb's) go to stderr instead
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    sys.stdout = sys.stderr
+
+    log(f"Worker using ChromaDB version: {chromadb.__version__}")
     try:
-        # Read JSON payload from stdin
-        input_data = sys.stdin.read()
-        if not input_data:
-            print("Error: No input data received", file=sys.stderr)
-            sys.exit(1)
-            
-        data = json.loads(input_data)
-        
-        persist_directory = data.get("persist_directory", "chroma_db")
-        collection_name = data.get("collection_name", "enerji_mevzuati")
-        documents = data.get("documents", [])
-        embeddings = data.get("embeddings", [])
-        metadatas = data.get("metadatas", [])
-        ids = data.get("ids", [])
-        
-        if not documents:
-            print("Warning: No documents to add", file=sys.stderr)
-            sys.exit(0)
-
-        # Initialize ChromaDB
+        # Initialize ChromaDB once for the lifetime of the worker.
         # This process ONLY imports chromadb, no torch.
         client = chromadb.PersistentClient(path=persist_directory)
         collection = client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"} 
+            metadata={"hnsw:space": "cosine"}
         )
-        
-        collection.add(
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
-        )
-        
-        print(f"Successfully added {len(documents)} documents via worker process.")
-        
     except Exception as e:
-        print(f"CRITICAL ERROR in chroma_worker: {e}", file=sys.stderr)
+        log(f"CRITICAL ERROR in chroma_worker: {e}")
         sys.exit(1)
 
+    while True:
+        frame = read_frame(stdin)
+        if frame is None:
+            break
+        header, body = frame
+
+        if header.get("op") == "close":
+            write_frame(stdout, {"status": "ok"})
+            break
+
+        try:
+            response, response_body = handle(client, collection, header, body)
+            response["status"] = "ok"
+        except Exception as e:
+            log(f"ERROR in chroma_worker ({header.get('op')}): {e}")
+            response, response_body = {"status": "error", "error": str(e)}, b""
+        write_frame(stdout, response, response_body)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,177 @@
+"""
+Token-budgeted assembly of the retrieved chunks into the prompt context.
+
+TextSplitter cuts every article into chunks that overlap by ~50 tokens and prefixes
+each one with "{article}: ". Joining the retrieved chunks as they are repeats both
+inside the prompt. ContextBuilder instead:
+
+  - drops chunks whose distance is above max_distance (None scores, e.g. from the
+    article index, are always kept),
+  - merges consecutive chunk_index pieces of the same article into one passage,
+    removing the overlapping span and the repeated article prefix,
+  - packs the passages, best ranked first, into token_budget tokens,
+  - reports prompt tokens before and after.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DOCUMENT_SEPARATOR = "\n\n--- YENİ BELGE ---\n\n"
+# Shorter common spans between neighbours are treated as coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 16
+MAX_OVERLAP_CHARS = 2000
+
+
+def strip_article_prefix(text: str, article: Optional[str]) -> str:
+    prefix = f"{article}: " if article else None
+    if prefix and text.startswith(prefix):
+        return text[len(prefix):]
+    return text
+
+
+def merge_overlapping(left: str, right: str, min_overlap: int = MIN_OVERLAP_CHARS) -> str:
+    """
+    Joins two neighbouring chunks, keeping the longest suffix of left that is also a
+    prefix of right only once.
+    """
+    tail = left[-MAX_OVERLAP_CHARS:]
+    if len(right) >= min_overlap:
+        head = right[:min_overlap]
+        position = tail.find(head)
+        while position != -1:
+            # The earliest position is the longest candidate overlap
+            if right.startswith(tail[position:]):
+                return left + right[len(tail) - position:]
+            position = tail.find(head, position + 1)
+    # TextSplitter strips whitespace at the cut, so a chunk may start with the punctuation ending the previous one
+    if right[:1] in ".,;:!?":
+        return left + right
+    return f"{left} {right}"
+
+
+@dataclass
+class ContextPassage:
+    text: str
+    documents: List[Any]
+    score: Optional[float] = None
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    passages: List[ContextPassage] = field(default_factory=list)
+    input_chunks: int = 0
+    dropped_by_distance: int = 0
+    dropped_by_budget: int = 0
+    original_tokens: int = 0
+    tokens: int = 0
+
+    @property
+    def documents(self) -> List[Any]:
+        return [doc for passage in self.passages for doc in passage.documents]
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def _article_key(doc) -> Tuple[Any, Any]:
+    return doc.metadata.get("source_file"), doc.metadata.get("article_number")
+
+
+class ContextBuilder:
+    def __init__(self, count_tokens: Callable[[str], int], token_budget: Optional[int] = None,
+                 max_distance: Optional[float] = None, separator: str = DOCUMENT_SEPARATOR):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.max_distance = max_distance
+        self.separator = separator
+
+    def build(self, docs_with_scores: Sequence[Tuple[Any, Optional[float]]]) -> BuiltContext:
+        """docs_with_scores: retrieved (Document, distance or None) pairs, best first."""
+        original_text = self.separator.join(doc.page_content for doc, _ in docs_with_scores)
+        result = BuiltContext(text="", input_chunks=len(docs_with_scores),
+                              original_tokens=self.count_tokens(original_text) if original_text else 0)
+
+        kept = []
+        for doc, score in docs_with_scores:
+            if score is not None and self.max_distance is not None and score > self.max_distance:
+                result.dropped_by_distance += 1
+            else:
+                kept.append((doc, score))
+
+        passages = self._merge(kept)
+        texts = []
+        used = 0
+        separator_tokens = self.count_tokens(self.separator)
+        for passage in passages:
+            cost = self.count_tokens(passage.text) + (separator_tokens if texts else 0)
+            if self.token_budget is not None and used + cost > self.token_budget:
+                if texts:
+                    result.dropped_by_budget += len(passage.documents)
+                    continue
+                # Not even the best passage fits: keep as much of it as the budget allows
+                passage.text = self._truncate(passage.text, self.token_budget)
+                cost = self.count_tokens(passage.text)
+            texts.append(passage.text)
+            result.passages.append(passage)
+            used += cost
+
+        result.text = self.separator.join(texts)
+        result.tokens = self.count_tokens(result.text) if result.text else 0
+        return result
+
+    def _merge(self, docs_with_scores) -> List[ContextPassage]:
+        """Groups chunks by article (in rank order) and merges runs of consecutive chunk_index."""
+        groups: Dict[Tuple[Any, Any], List[Tuple[Any, Optional[float]]]] = {}
+        for doc, score in docs_with_scores:
+            groups.setdefault(_article_key(doc), []).append((doc, score))
+
+        passages = []
+        for (_, article), members in groups.items():
+            members.sort(key=lambda member: member[0].metadata.get("chunk_index", -1))
+            run: List[Tuple[Any, Optional[float]]] = []
+            for doc, score in members:
+                index = doc.metadata.get("chunk_index")
+                if run:
+                    previous = run[-1][0]
+                    if previous.page_content == doc.page_content:
+                        continue
+                    previous_index = previous.metadata.get("chunk_index")
+                    if index is None or previous_index is None or index != previous_index + 1:
+                        passages.append(self._passage(run, article))
+                        run = []
+                run.append((doc, score))
+            if run:
+                passages.append(self._passage(run, article))
+
+        # A passage takes the retrieval rank of its best ranked chunk
+        order = {id(doc): rank for rank, (doc, _) in enumerate(docs_with_scores)}
+        passages.sort(key=lambda passage: min(order[id(doc)] for doc in passage.documents))
+        return passages
+
+    @staticmethod
+    def _passage(run, article) -> ContextPassage:
+        body = strip_article_prefix(run[0][0].page_content, article)
+        for doc, _ in run[1:]:
+            body = merge_overlapping(body, strip_article_prefix(doc.page_content, article))
+        has_prefix = bool(article) and run[0][0].page_content.startswith(f"{article}: ")
+        scores = [score for _, score in run if score is not None]
+        return ContextPassage(
+            text=f"{article}: {body}" if has_prefix else body,
+            documents=[doc for doc, _ in run],
+            score=min(scores) if scores else None
+        )
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Longest word-boundary prefix of text within budget tokens (binary search)."""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        cut = text[:low]
+        if low < len(text) and " " in cut:
+            cut = cut[:cut.rindex(" ")]
+        return cut
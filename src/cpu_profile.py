@@ -0,0 +1,227 @@
+"""
+CPU inference profile: dynamic int8 quantization of the Linear layers of the
+generator and the embedding encoder, torch thread settings, and an on-disk cache
+of the quantized weights.
+
+Dynamic quantization keeps the Linear weights as int8 and quantizes activations
+on the fly, so the matmuls run through the fbgemm/onednn int8 kernels and the
+weights take a quarter of the float32 memory. Embeddings and norms stay float32,
+and so does lm_head by default, because it picks the next token.
+
+A quantized model is checked once against its float32 source before it is cached:
+mean KL divergence of the next-token distributions for the generator (top-1
+agreement is reported too), cosine similarity for the encoder. The float32 outputs
+are computed first and the model is then quantized in place, so the check never
+holds two full copies of the weights.
+Later starts build the module skeleton without initializing weights, swap in
+empty int8 Linear layers and load the cached state_dict. This skips both the float32
+load and the quantization pass.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import nn
+
+PROFILES = ("default", "cpu-int8")
+QUANTIZED_WEIGHTS_FILE = "cpu-int8.pt"
+QUANTIZED_META_FILE = "cpu-int8.json"
+DEFAULT_SKIP_MODULES = ("lm_head",)
+# nats, mean over the probe positions (T=1). Top-1 agreement alone is noisy: prompt
+# positions often have near-tied candidates, which any rounding flips.
+MAX_MEAN_KL = 0.02
+MIN_EMBEDDING_COSINE = 0.99
+# Fixed probe set for the quality checks
+PROBE_TEXTS = [
+    "Elektrik piyasasında lisans alma yükümlülüğünden muaf faaliyetler nelerdir?",
+    "MADDE 14 - (1) Lisans sahibi tüzel kişiler, lisanslarında belirtilen faaliyetler dışında faaliyette bulunamaz.",
+    "Arama ruhsatı süresi, ruhsat tarihinden itibaren dört yıldır.",
+    "Kurul, bu Kanunda belirtilen yükümlülüklere aykırı davranan gerçek ve tüzel kişilere idari para cezası uygular.",
+]
+
+
+def configure_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Sets torch's thread pools (defaults: every core for intra-op, 1 for inter-op, which
+    suits one request-serving model per process). Returns the effective values.
+    """
+    torch.set_num_threads(intra_op or os.cpu_count() or 1)
+    try:
+        torch.set_num_interop_threads(inter_op or 1)
+    except RuntimeError:
+        pass  # can only be set once, before the first parallel op
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def _quantizable(model: nn.Module, skip: Iterable[str]) -> Dict[str, nn.Linear]:
+    skip = tuple(skip)
+    return {name: module for name, module in model.named_modules()
+            if type(module) is nn.Linear and not any(name == s or name.startswith(f"{s}.") for s in skip)}
+
+
+def quantize_linear_int8(model: nn.Module, skip: Iterable[str] = DEFAULT_SKIP_MODULES,
+                         inplace: bool = False) -> nn.Module:
+    """Dynamic int8 quantization of every float32 nn.Linear except the skipped modules."""
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+    spec = {name: default_dynamic_qconfig for name in _quantizable(model, skip)}
+    return quantize_dynamic(model.float(), spec, dtype=torch.qint8, inplace=inplace)
+
+
+def _replace_submodule(model: nn.Module, name: str, module: nn.Module):
+    parent_name, _, child = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child, module)
+
+
+def _swap_in_empty_int8_linears(model: nn.Module, skip: Iterable[str]):
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+    for name, module in _quantizable(model, skip).items():
+        _replace_submodule(model, name, DynamicQuantizedLinear(module.in_features, module.out_features,
+                                                               bias_=module.bias is not None, dtype=torch.qint8))
+
+
+def _quantize_checked(model: nn.Module, skip: Iterable[str], check: Callable[[nn.Module], None]) -> nn.Module:
+    """
+    Quantizes model in place and runs check(model), which raises ValueError to reject it.
+    Only the float32 Linear layers are kept alongside the int8 ones (a copy of the whole
+    model would double the peak memory); a rejected model gets them back before the raise.
+    """
+    originals = _quantizable(model, skip)
+    quantize_linear_int8(model, skip, inplace=True)
+    try:
+        check(model)
+    except ValueError:
+        for name, module in originals.items():
+            _replace_submodule(model, name, module)
+        raise
+    return model
+
+
+def _cache_stamp() -> Dict[str, str]:
+    # Packed int8 weights are tied to the torch build and the quantized kernel backend
+    return {"torch": torch.__version__, "engine": torch.backends.quantized.engine}
+
+
+def save_quantized(model: nn.Module, cache_dir: str, metrics: Dict[str, Any]):
+    os.makedirs(cache_dir, exist_ok=True)
+    weights_path = os.path.join(cache_dir, QUANTIZED_WEIGHTS_FILE)
+    torch.save(model.state_dict(), f"{weights_path}.tmp")
+    os.replace(f"{weights_path}.tmp", weights_path)
+    meta_path = os.path.join(cache_dir, QUANTIZED_META_FILE)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({**_cache_stamp(), "metrics": metrics}, f, indent=2)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def load_quantized(build_skeleton: Callable[[], nn.Module], cache_dir: Optional[str],
+                   skip: Iterable[str] = DEFAULT_SKIP_MODULES) -> Optional[nn.Module]:
+    """
+    Rebuilds a cached quantized model, or returns None if there is no valid cache.
+    build_skeleton: returns the float32 architecture (weights need not be initialized).
+    """
+    if not cache_dir:
+        return None
+    try:
+        with open(os.path.join(cache_dir, QUANTIZED_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if {key: meta.get(key) for key in _cache_stamp()} != _cache_stamp():
+        return None
+
+    model = build_skeleton()
+    _swap_in_empty_int8_linears(model, skip)
+    state = torch.load(os.path.join(cache_dir, QUANTIZED_WEIGHTS_FILE), map_location="cpu", weights_only=True)
+    model.load_state_dict(state)
+    return model.eval()
+
+
+def empty_skeleton(factory: Callable[[], nn.Module]) -> nn.Module:
+    """Runs a transformers model constructor without initializing the weights."""
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # transformers < 5
+        from transformers.modeling_utils import no_init_weights
+    with no_init_weights():
+        return factory()
+
+
+def next_token_log_probs(model: nn.Module, input_ids: torch.Tensor) -> torch.Tensor:
+    """Teacher-forced next-token log-probabilities of a causal LM on input_ids."""
+    with torch.no_grad():
+        return torch.log_softmax(model(input_ids=input_ids).logits.float(), dim=-1)
+
+
+def logit_divergence(expected: torch.Tensor, candidate: nn.Module, input_ids: torch.Tensor) -> Dict[str, float]:
+    """
+    Compares candidate with reference log-probabilities (next_token_log_probs) on input_ids: mean
+    and max KL(reference || candidate) and the share of positions with the same top-1 token.
+    """
+    predicted = next_token_log_probs(candidate, input_ids)
+    kl = (expected.exp() * (expected - predicted)).sum(-1)
+    return {
+        "mean_kl": float(kl.mean()),
+        "max_kl": float(kl.max()),
+        "top1_agreement": float((expected.argmax(-1) == predicted.argmax(-1)).float().mean()),
+    }
+
+
+def embedding_cosine(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Lowest cosine similarity between corresponding rows."""
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    return float(np.min(np.sum(reference * candidate, axis=1)))
+
+
+def quantize_generator(model: nn.Module, tokenizer, probe_text: str, cache_dir: Optional[str] = None,
+                       max_kl: float = MAX_MEAN_KL) -> nn.Module:
+    """
+    Quantizes a (merged) causal LM in place, compares it with its float32 logits on
+    probe_text and caches the result. Raises ValueError, with the float32 model restored,
+    if the mean KL divergence is above max_kl.
+    """
+    model = model.float().eval()
+    input_ids = torch.tensor([tokenizer(probe_text)["input_ids"]], dtype=torch.long)
+    expected = next_token_log_probs(model, input_ids)
+    metrics = {}
+
+    def check(quantized):
+        metrics.update(logit_divergence(expected, quantized, input_ids))
+        if metrics["mean_kl"] > max_kl:
+            raise ValueError(f"int8 generator mean KL {metrics['mean_kl']:.4f} > {max_kl} "
+                             f"(top-1 agreement {metrics['top1_agreement']:.1%})")
+
+    quantized = _quantize_checked(model, DEFAULT_SKIP_MODULES, check)
+    if cache_dir:
+        save_quantized(quantized, cache_dir, metrics)
+    return quantized
+
+
+def quantize_encoder(model: nn.Module, encode: Callable[[nn.Module], np.ndarray], cache_dir: Optional[str] = None,
+                     min_cosine: float = MIN_EMBEDDING_COSINE) -> nn.Module:
+    """
+    Quantized embedding encoder, from cache_dir when available. Otherwise model is
+    quantized in place: encode(model) embeds a fixed probe set, the lowest cosine to the
+    float32 vectors must reach min_cosine (ValueError otherwise, with the float32 model
+    restored), and the result is cached.
+    """
+    cached = load_quantized(lambda: empty_skeleton(lambda: model.__class__(model.config)), cache_dir, skip=())
+    if cached is not None:
+        return cached
+    model = model.float().eval()
+    reference = encode(model)
+    metrics = {}
+
+    def check(quantized):
+        metrics["min_cosine"] = embedding_cosine(reference, encode(quantized))
+        if metrics["min_cosine"] < min_cosine:
+            raise ValueError(f"int8 encoder cosine {metrics['min_cosine']:.4f} < {min_cosine}")
+
+    quantized = _quantize_checked(model, (), check)
+    if cache_dir:
+        save_quantized(quantized, cache_dir, metrics)
+    return quantized
@@ -0,0 +1,41 @@
+"""
+Length-bucketed, token-budget batching for the BERT encoder.
+
+A padded batch costs roughly batch_size * longest_sequence tokens. Sorting texts by
+token length and filling each batch up to a token budget (instead of a fixed count)
+keeps short article chunks from paying for the longest chunk in their batch.
+"""
+from typing import List, Sequence
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int = 8192, max_batch_size: int = 64) -> List[List[int]]:
+    """
+    Groups text indices into batches so that len(batch) * max(length in batch) <= token_budget.
+
+    Indices are visited longest first, so the most expensive batch runs first (an
+    OOM shows up immediately, not at the end of a long ingest). Callers scatter the
+    results back by index, which restores the original order.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_max = 0
+    for index in order:
+        length = max(int(lengths[index]), 1)
+        # Sorted descending: the first element of a batch is its longest member
+        batch_max = current_max or length
+        if current and ((len(current) + 1) * batch_max > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, batch_max = [], length
+        current.append(index)
+        current_max = batch_max
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padded_tokens(lengths: Sequence[int], batches: List[List[int]]) -> int:
+    """Total tokens processed (including padding) for a given batch plan."""
+    return sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
@@ -0,0 +1,198 @@
+"""
+On-disk embedding cache: (model name, chunk text) -> float32 vector.
+
+Layout of cache_dir/<model>/:
+    vectors.<generation>.f32  append-only float32 rows of `dim` values, read through np.memmap
+    index.npz                 compact index: 16 byte keys, row numbers, last-use ticks, generation
+
+Bounded by max_entries. When the bound is exceeded the least recently used
+entries are evicted by compacting the vectors into the next generation file, so
+the hot path (lookups and appends) never rewrites existing rows. The index names
+the generation it belongs to, so a crash mid-compaction never mixes up rows.
+"""
+import hashlib
+import os
+import threading
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, dim: int,
+                 max_entries: int = 200_000, evict_fraction: float = 0.2):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.evict_fraction = evict_fraction
+
+        self.directory = os.path.join(cache_dir, model_name.replace("/", "__"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "index.npz")
+        self.generation = 0
+
+        self._rows: Dict[bytes, int] = {}
+        self._last_used: Dict[int, int] = {}
+        self._tick = 0
+        self._mmap = None
+        self._mapped_rows = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load_index()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, f"vectors.{self.generation}.f32")
+
+    # --- keys & storage ---
+    def key(self, text: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=KEY_BYTES)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def _file_rows(self) -> int:
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path) as data:
+                if int(data["dim"]) != self.dim:
+                    print(f"[WARN] Embedding cache dim mismatch, ignoring {self.index_path}")
+                    return
+                keys, rows, ticks = data["keys"], data["rows"], data["ticks"]
+                self.generation = int(data["generation"])
+        except Exception as e:
+            print(f"[WARN] Embedding cache index unreadable, starting empty: {e}")
+            return
+
+        file_rows = self._file_rows()
+        for key, row, tick in zip(keys, rows, ticks):
+            # Rows appended after the last index flush are orphans and simply ignored
+            if row < file_rows:
+                self._rows[bytes(key)] = int(row)
+                self._last_used[int(row)] = int(tick)
+        self._tick = int(ticks.max()) if len(ticks) else 0
+
+    def _vectors(self) -> np.ndarray:
+        file_rows = self._file_rows()
+        if self._mmap is None or self._mapped_rows != file_rows:
+            self._mmap = None
+            if file_rows:
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(file_rows, self.dim))
+            self._mapped_rows = file_rows
+        return self._mmap
+
+    # --- public API ---
+    def get_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (vectors, found). vectors has one row per text; rows of texts
+        that were not cached are zero and marked False in `found`.
+        """
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        found = np.zeros(len(texts), dtype=bool)
+        with self._lock:
+            positions, rows = [], []
+            for i, text in enumerate(texts):
+                row = self._rows.get(self.key(text))
+                if row is not None:
+                    positions.append(i)
+                    rows.append(row)
+                    self._tick += 1
+                    self._last_used[row] = self._tick
+            if rows:
+                result[positions] = self._vectors()[rows]
+                found[positions] = True
+                self._dirty = True
+            self.hits += len(rows)
+            self.misses += len(texts) - len(rows)
+        return result, found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            new_keys, new_rows = [], []
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            start_row = self._file_rows()
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(new_rows).tobytes())
+            for offset, key in enumerate(new_keys):
+                self._tick += 1
+                self._rows[key] = start_row + offset
+                self._last_used[start_row + offset] = self._tick
+            self._dirty = True
+
+            if len(self._rows) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """Keeps the most recently used entries and compacts vectors.f32."""
+        keep = int(self.max_entries * (1.0 - self.evict_fraction))
+        by_recency = sorted(self._rows.items(), key=lambda item: self._last_used[item[1]], reverse=True)
+        kept = by_recency[:keep]
+        self.evictions += len(by_recency) - len(kept)
+
+        old_vectors = self._vectors()
+        old_path = self.vectors_path
+        old_rows = np.array([row for _, row in kept], dtype=np.int64)
+
+        self.generation += 1
+        with open(self.vectors_path, "wb") as f:
+            # Copy in slices to keep memory bounded on large caches
+            for start in range(0, len(old_rows), 4096):
+                f.write(np.ascontiguousarray(old_vectors[old_rows[start:start + 4096]]).tobytes())
+        del old_vectors
+        self._mmap = None
+
+        self._rows = {key: new_row for new_row, (key, _) in enumerate(kept)}
+        self._last_used = {new_row: self._last_used[old_row] for new_row, (_, old_row) in enumerate(kept)}
+        self._flush_index()
+        os.remove(old_path)
+
+    def _flush_index(self):
+        keys = np.frombuffer(b"".join(self._rows.keys()), dtype=np.uint8).reshape(-1, KEY_BYTES)
+        rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        ticks = np.array([self._last_used[row] for row in rows], dtype=np.int64)
+        tmp_path = self.index_path + ".tmp.npz"
+        np.savez(tmp_path, keys=keys, rows=rows, ticks=ticks,
+                 dim=np.int64(self.dim), generation=np.int64(self.generation))
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._flush_index()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._rows),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
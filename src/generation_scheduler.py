@@ -0,0 +1,318 @@
+"""
+Dynamic batched generation for concurrent chat requests.
+
+Instead of one model.generate thread per request (all contending for the same
+model), a single scheduler thread owns the model and runs every active request in
+one batch:
+
+  - waiting prompts are admitted between decode steps while the token budget
+    (sum of prompt_len + max_new_tokens over the batch) allows,
+  - newly admitted prompts are prefilled together and their KV cache is merged
+    into the running batch (left padded, masked out); prompts that start with a
+    precomputed prefix (see prefix_cache.PrefixCache) only prefill the rest,
+  - each decode step feeds one token per active sequence,
+  - finished sequences (EOS / max_new_tokens / cancelled) drop out immediately,
+  - every request reads its own text deltas from its own queue.
+"""
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Iterator, List, Optional
+
+import torch
+from transformers import DynamicCache
+
+_END = object()
+
+
+@dataclass
+class GenerationRequest:
+    prompt_ids: List[int]
+    max_new_tokens: int = 1024
+    temperature: float = 0.3
+    do_sample: bool = True
+    top_p: float = 0.95
+    repetition_penalty: float = 1.05
+    prefix: Optional[Any] = None  # PrefixCache whose KV state the prompt starts from
+    generated_ids: List[int] = field(default_factory=list)
+    emitted_text: str = ""
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    _output: "queue.Queue" = field(default_factory=queue.Queue)
+
+    @property
+    def token_cost(self) -> int:
+        return len(self.prompt_ids) + self.max_new_tokens
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self) -> Iterator[str]:
+        """Blocking iterator over decoded text deltas (same contract as TextIteratorStreamer)."""
+        while True:
+            item = self._output.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def _kv_layers(cache) -> List[tuple]:
+    # transformers >= 4.56 keeps per-layer objects, older versions key/value lists
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _build_cache(layers: List[tuple]) -> DynamicCache:
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    pad_shape = list(tensor.shape)
+    pad_shape[dim] = missing
+    return torch.cat([tensor.new_zeros(pad_shape), tensor], dim=dim)
+
+
+class GenerationScheduler:
+    def __init__(self, model, tokenizer, max_batch_tokens: int = 16384, max_batch_size: int = 8):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.eos_token_ids = self._eos_ids()
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        # Running batch state (only touched by the scheduler thread)
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._next_logits: Optional[torch.Tensor] = None
+
+        self.steps = 0
+        self.generated_tokens = 0
+
+        self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    def _eos_ids(self) -> set:
+        eos = getattr(self.model.generation_config, "eos_token_id", None)
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        if eos is None:
+            return set()
+        return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+    # --- public API ---
+    def submit(self, prompt_ids: List[int], **generation_kwargs) -> GenerationRequest:
+        request = GenerationRequest(prompt_ids=list(prompt_ids), **generation_kwargs)
+        if request.token_cost > self.max_batch_tokens:
+            raise ValueError(f"Request needs {request.token_cost} tokens, budget is {self.max_batch_tokens}")
+        with self._condition:
+            self._waiting.append(request)
+            self._condition.notify()
+        return request
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def shutdown(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    # --- scheduler thread ---
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped and not self._waiting and not self._active:
+                    self._condition.wait()
+                if self._stopped:
+                    break
+                joining = self._admit()
+
+            try:
+                with torch.no_grad():
+                    if joining:
+                        self._prefill(joining)
+                    if self._active:
+                        self._step()
+            except BaseException as e:
+                print(f"[HATA] Generation scheduler: {e}")
+                for request in self._active + joining:
+                    request._output.put(e)
+                    request._output.put(_END)
+                self._reset()
+
+        for request in self._active + list(self._waiting):
+            request._output.put(_END)
+
+    def _admit(self) -> List[GenerationRequest]:
+        """Moves waiting requests into the batch while the token budget allows (FIFO)."""
+        used = sum(request.token_cost for request in self._active)
+        joining = []
+        while self._waiting and len(self._active) + len(joining) < self.max_batch_size:
+            request = self._waiting[0]
+            if request.cancelled.is_set():
+                self._waiting.popleft()
+                request._output.put(_END)
+                continue
+            if used + request.token_cost > self.max_batch_tokens:
+                break
+            self._waiting.popleft()
+            joining.append(request)
+            used += request.token_cost
+        return joining
+
+    def _prefill(self, joining: List[GenerationRequest]):
+        # Requests sharing a prefix cache are prefilled together from its KV state
+        groups = {}
+        for request in joining:
+            prefix = request.prefix if request.prefix is not None and request.prefix.matches(request.prompt_ids) else None
+            groups.setdefault(id(prefix), (prefix, []))[1].append(request)
+        for prefix, requests in groups.values():
+            self._prefill_group(requests, prefix)
+
+    def _prefill_group(self, joining: List[GenerationRequest], prefix=None):
+        device = self.model.device
+        skip = len(prefix) if prefix is not None else 0
+        length = max(len(request.prompt_ids) - skip for request in joining)
+        input_ids = torch.full((len(joining), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(joining), length), dtype=torch.long)
+        for row, request in enumerate(joining):
+            ids = request.prompt_ids[skip:]
+            input_ids[row, length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, length - len(ids):] = 1
+        input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+
+        if prefix is None:
+            cache = DynamicCache()
+        else:
+            # [prefix | padding | suffix]: the padding sits between the shared prefix and each suffix
+            attention_mask = torch.cat([attention_mask.new_ones((len(joining), skip)), attention_mask], dim=1)
+            cache = _build_cache([(keys.expand(len(joining), -1, -1, -1), values.expand(len(joining), -1, -1, -1))
+                                  for keys, values in _kv_layers(prefix.cache)])
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, skip:]
+
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=cache, use_cache=True)
+        logits = outputs.logits[:, -1, :].float()
+        self._merge(joining, outputs.past_key_values, attention_mask, logits)
+
+    def _merge(self, joining, cache, attention_mask: torch.Tensor, logits: torch.Tensor):
+        if not self._active:
+            self._active = list(joining)
+            self._cache, self._attention_mask, self._next_logits = cache, attention_mask, logits
+            return
+
+        length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+        merged_layers = []
+        for (old_keys, old_values), (new_keys, new_values) in zip(_kv_layers(self._cache), _kv_layers(cache)):
+            merged_layers.append((
+                torch.cat([_left_pad(old_keys, length, 2), _left_pad(new_keys, length, 2)], dim=0),
+                torch.cat([_left_pad(old_values, length, 2), _left_pad(new_values, length, 2)], dim=0),
+            ))
+        self._cache = _build_cache(merged_layers)
+        self._attention_mask = torch.cat([_left_pad(self._attention_mask, length, 1),
+                                          _left_pad(attention_mask, length, 1)], dim=0)
+        self._next_logits = torch.cat([self._next_logits, logits], dim=0)
+        self._active.extend(joining)
+
+    def _sample(self, request: GenerationRequest, logits: torch.Tensor) -> int:
+        if request.repetition_penalty != 1.0 and request.generated_ids + request.prompt_ids:
+            seen = torch.tensor(sorted(set(request.prompt_ids + request.generated_ids)), device=logits.device)
+            scores = logits[seen]
+            logits[seen] = torch.where(scores < 0, scores * request.repetition_penalty,
+                                       scores / request.repetition_penalty)
+        if not request.do_sample or request.temperature <= 0:
+            return int(torch.argmax(logits))
+
+        probs = torch.softmax(logits / request.temperature, dim=-1)
+        if request.top_p < 1.0:
+            sorted_probs, sorted_idx = torch.sort(probs, descending=True)
+            cumulative = torch.cumsum(sorted_probs, dim=-1)
+            # keep the smallest prefix whose mass reaches top_p (always at least one token)
+            sorted_probs[(cumulative - sorted_probs) > request.top_p] = 0
+            probs = torch.zeros_like(probs).scatter_(0, sorted_idx, sorted_probs)
+        return int(torch.multinomial(probs, 1))
+
+    def _emit(self, request: GenerationRequest, final: bool = False):
+        text = self.tokenizer.decode(request.generated_ids, skip_special_tokens=True)
+        # Hold back incomplete multi-byte characters until the next token completes them
+        if not final and text.endswith("�"):
+            return
+        delta = text[len(request.emitted_text):]
+        if delta:
+            request.emitted_text = text
+            request._output.put(delta)
+
+    def _step(self):
+        next_tokens = []
+        keep = []
+        for row, request in enumerate(self._active):
+            if request.cancelled.is_set():
+                request._output.put(_END)
+                continue
+            token = self._sample(request, self._next_logits[row])
+            finished = token in self.eos_token_ids
+            if not finished:
+                request.generated_ids.append(token)
+                self.generated_tokens += 1
+            finished = finished or len(request.generated_ids) >= request.max_new_tokens
+            self._emit(request, final=finished)
+            if finished:
+                request._output.put(_END)
+            else:
+                keep.append(row)
+                next_tokens.append(token)
+
+        if len(keep) < len(self._active):
+            if not keep:
+                self._reset()
+                return
+            self._select(keep)
+
+        device = self._attention_mask.device
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(keep), 1))], dim=1)
+        position_ids = (self._attention_mask.sum(-1, keepdim=True) - 1)
+        input_ids = torch.tensor(next_tokens, dtype=torch.long, device=device).unsqueeze(-1)
+
+        outputs = self.model(input_ids=input_ids, attention_mask=self._attention_mask, position_ids=position_ids,
+                             past_key_values=self._cache, use_cache=True)
+        self._cache = outputs.past_key_values
+        self._next_logits = outputs.logits[:, -1, :].float()
+        self.steps += 1
+
+    def _select(self, rows: List[int]):
+        index = torch.tensor(rows, dtype=torch.long, device=self._attention_mask.device)
+        self._active = [self._active[row] for row in rows]
+        self._cache = _build_cache([(keys.index_select(0, index), values.index_select(0, index))
+                                    for keys, values in _kv_layers(self._cache)])
+        self._attention_mask = self._attention_mask.index_select(0, index)
+        self._next_logits = self._next_logits.index_select(0, index)
+        # Drop leading columns that are padding for every remaining row
+        first_used = int(self._attention_mask.any(dim=0).int().argmax())
+        if first_used > 0:
+            self._attention_mask = self._attention_mask[:, first_used:]
+            self._cache = _build_cache([(keys[:, :, first_used:], values[:, :, first_used:])
+                                        for keys, values in _kv_layers(self._cache)])
+
+    def _reset(self):
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        self._next_logits = None
@@ -0,0 +1,134 @@
+"""
+Ingestion manifest: remembers which PDFs (by content hash) are already in the
+collection and which chunk IDs each one produced, so re-runs of ingest_data.py
+only touch new, changed or removed documents.
+"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(metadata: Dict[str, Any], text: str) -> str:
+    """
+    Stable chunk ID: the same chunk of the same article always maps to the same ID,
+    so re-ingesting it is an upsert instead of a duplicate.
+    """
+    key = "|".join([
+        str(metadata.get("source_file", "")),
+        str(metadata.get("article_number", "")),
+        str(metadata.get("chunk_index", "")),
+        text_hash(text),
+    ])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def document_chunk_id(doc) -> str:
+    """Chunk ID of a retrieved LangChain Document (IDs are deterministic, see make_chunk_id)."""
+    return getattr(doc, "id", None) or make_chunk_id(doc.metadata, doc.page_content)
+
+
+@dataclass
+class IngestPlan:
+    new: List[str] = field(default_factory=list)        # file paths never ingested
+    changed: List[str] = field(default_factory=list)    # file paths whose content hash changed
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)    # file names in the manifest but not on disk
+    hashes: Dict[str, str] = field(default_factory=dict)  # file path -> sha256
+
+    @property
+    def to_process(self) -> List[str]:
+        return self.new + self.changed
+
+    def summary(self) -> str:
+        return (f"{len(self.new)} new, {len(self.changed)} changed, "
+                f"{len(self.unchanged)} unchanged, {len(self.removed)} removed")
+
+
+class IngestManifest:
+    def __init__(self, persist_directory: str = "chroma_db"):
+        self.path = os.path.join(persist_directory, MANIFEST_FILE)
+        self.version = 0
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.version = data.get("version", 0)
+        self.files = data.get("files", {})
+
+    def save(self):
+        """Atomic write, a crash never leaves a half written manifest behind."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.version += 1
+        data = {"version": self.version, "updated_at": time.time(), "files": self.files}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def plan(self, file_paths: List[str], force: bool = False) -> IngestPlan:
+        plan = IngestPlan()
+        seen = set()
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            seen.add(file_name)
+            sha = file_sha256(file_path)
+            plan.hashes[file_path] = sha
+
+            entry = self.files.get(file_name)
+            if entry is None:
+                plan.new.append(file_path)
+            elif force or entry.get("sha256") != sha:
+                plan.changed.append(file_path)
+            else:
+                plan.unchanged.append(file_path)
+
+        plan.removed = [name for name in self.files if name not in seen]
+        return plan
+
+    def chunk_ids(self, file_name: str) -> List[str]:
+        entry = self.files.get(file_name)
+        return list(entry.get("chunk_ids", [])) if entry else []
+
+    def record(self, file_name: str, sha256: str, chunk_ids: List[str]):
+        self.files[file_name] = {
+            "sha256": sha256,
+            "chunk_ids": list(chunk_ids),
+            "ingested_at": time.time(),
+        }
+
+    def forget(self, file_name: str):
+        self.files.pop(file_name, None)
+
+
+
+def manifest_stamp(persist_directory: str) -> Optional[Tuple[int, int]]:
+    """
+    Cheap "has the collection changed?" token for readers (a stat call, no JSON parsing).
+    Every ingestion run that modifies the collection rewrites the manifest.
+    """
+    try:
+        stat = os.stat(os.path.join(persist_directory, MANIFEST_FILE))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,295 @@
+"""
+Pipelined ingestion engine.
+
+The serial loop in ingest_data.py runs extract -> split -> embed -> write for one
+PDF at a time. Here the stages overlap:
+
+  1. extract + split : process pool, one TextSplitter (tokenizer) per worker process,
+                       pages come from the extraction cache when the PDF is unchanged
+  2. embed           : single consumer in the main process, batches span file boundaries
+  3. write           : writer thread, ChromaDB writes are batched across files
+
+Stages are connected with bounded queues, so a slow stage applies back-pressure
+instead of buffering the whole corpus in memory.
+"""
+import os
+import sys
+import queue
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+_SENTINEL = object()
+
+# Worker process state (one splitter per process, created by the initializer)
+_worker_splitter = None
+_worker_extraction_cache_dir = None
+
+
+def _init_worker(project_root: str, extraction_cache_dir: Optional[str] = None):
+    global _worker_splitter, _worker_extraction_cache_dir
+    os.environ.setdefault('KMP_DUPLICATE_LIB_OK', 'TRUE')
+    # Each worker is single threaded; parallelism comes from the pool itself.
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    if project_root not in sys.path:
+        sys.path.append(project_root)
+
+    from src.text_splitter import TextSplitter
+    _worker_splitter = TextSplitter()
+    _worker_extraction_cache_dir = extraction_cache_dir
+
+
+def _extract_and_split(file_path: str) -> Dict[str, Any]:
+    """Runs in a worker process: extracts and splits a single PDF."""
+    from src.pdf_extractor import PDFExtractor
+
+    file_name = os.path.basename(file_path)
+
+    start = time.perf_counter()
+    extractor = PDFExtractor(file_path, cache_dir=_worker_extraction_cache_dir)
+    pages = list(extractor.iter_pages())
+    extracted = time.perf_counter()
+
+    base_metadata = {
+        "source_file": file_name,
+        "document_title": file_name.replace(".pdf", "")
+    }
+    chunks = list(_worker_splitter.iter_chunks(pages, base_metadata))
+    split = time.perf_counter()
+
+    return {
+        "file_name": file_name,
+        "chunks": chunks,
+        "extract_seconds": extracted - start,
+        "split_seconds": split - extracted,
+        "extraction_cached": extractor.from_cache,
+    }
+
+
+@dataclass
+class StageStats:
+    name: str
+    unit: str = "chunks"
+    items: int = 0
+    busy_seconds: float = 0.0
+
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.busy_seconds += seconds
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def report(self, wall_seconds: float) -> str:
+        utilization = 100.0 * self.busy_seconds / wall_seconds if wall_seconds > 0 else 0.0
+        return (f"  {self.name:<8} {self.items:>7} {self.unit:<6} "
+                f"busy {self.busy_seconds:8.2f}s  "
+                f"{self.throughput:9.1f} {self.unit}/s  "
+                f"(busy/wall {utilization:5.1f}%)")
+
+
+class PipelinedIngestor:
+    """
+    Runs ingestion as a three stage pipeline on top of an existing RAGPipeline.
+    """
+    def __init__(self, pipeline, workers: Optional[int] = None, embed_batch_size: int = 256,
+                 write_batch_size: int = 512, queue_size: int = 4, extraction_cache_dir: Optional[str] = None):
+        self.pipeline = pipeline
+        self.workers = workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.extraction_cache_dir = extraction_cache_dir
+
+        self.stats = {
+            "extract": StageStats("extract", unit="files"),
+            "split": StageStats("split"),
+            "embed": StageStats("embed"),
+            "write": StageStats("write"),
+        }
+        self.failed_files: List[str] = []
+        self._stop = threading.Event()
+
+    def run(self, files: List[str], on_file_written: Optional[Callable[[str, List[str]], None]] = None) -> int:
+        """
+        Ingests the given PDF files and returns the number of chunks written.
+        on_file_written(file_name, chunk_ids) is called from the writer thread once
+        every chunk of a file has been written.
+        """
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        write_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        errors: List[BaseException] = []
+
+        wall_start = time.perf_counter()
+
+        producer = threading.Thread(target=self._produce, args=(files, chunk_queue, errors),
+                                    name="ingest-producer", daemon=True)
+        writer = threading.Thread(target=self._write, args=(write_queue, errors, on_file_written),
+                                  name="ingest-writer", daemon=True)
+        producer.start()
+        writer.start()
+
+        try:
+            total_chunks = self._embed(chunk_queue, write_queue, errors)
+        finally:
+            write_queue.put(_SENTINEL)
+            writer.join()
+            # Unblock the producer if we stopped consuming early
+            self._stop.set()
+            while producer.is_alive():
+                try:
+                    chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+        if errors:
+            raise RuntimeError(f"Pipelined ingestion failed: {errors[0]}") from errors[0]
+
+        self.print_report(time.perf_counter() - wall_start)
+        return total_chunks
+
+    # --- Stage 1: extract + split (process pool) ---
+    def _produce(self, files: List[str], chunk_queue: "queue.Queue", errors: List[BaseException]):
+        # spawn: the parent process already holds torch/BERT, forking it is unsafe.
+        context = multiprocessing.get_context("spawn")
+        max_in_flight = self.workers * 2
+        pending_files = list(files)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                     initializer=_init_worker,
+                                     initargs=(os.getcwd(), self.extraction_cache_dir)) as executor:
+                in_flight: Dict[Any, str] = {}
+                while (pending_files or in_flight) and not self._stop.is_set():
+                    while pending_files and len(in_flight) < max_in_flight:
+                        file_path = pending_files.pop(0)
+                        in_flight[executor.submit(_extract_and_split, file_path)] = file_path
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = in_flight.pop(future)
+                        file_name = os.path.basename(file_path)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            print(f"  Error processing {file_name}: {e}", flush=True)
+                            self.failed_files.append(file_name)
+                            continue
+
+                        self.stats["extract"].add(1, result["extract_seconds"])
+                        self.stats["split"].add(len(result["chunks"]), result["split_seconds"])
+                        cached = " (extraction cache)" if result["extraction_cached"] else ""
+                        print(f"  [extract+split] {file_name}: {len(result['chunks'])} chunks{cached}", flush=True)
+                        # Blocks when the embedding stage falls behind (back-pressure)
+                        chunk_queue.put(result)
+                for future in in_flight:
+                    future.cancel()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            chunk_queue.put(_SENTINEL)
+
+    # --- Stage 2: embed (main process, model loaded once) ---
+    def _embed(self, chunk_queue: "queue.Queue", write_queue: "queue.Queue", errors: List[BaseException]) -> int:
+        # Items are ("chunk", chunk) or ("done", file_result). A "done" marker follows the
+        # last chunk of its file, so it reaches the writer only after all of them.
+        pending: Deque[Tuple[str, Any]] = deque()
+        pending_chunks = 0
+        write_buffer: List[Dict[str, Any]] = []
+        buffered_chunks = 0
+        total_chunks = 0
+
+        while True:
+            item = chunk_queue.get()
+            finished = item is _SENTINEL
+            if not finished:
+                pending.extend(("chunk", chunk) for chunk in item["chunks"])
+                pending.append(("done", item))
+                pending_chunks += len(item["chunks"])
+
+            while pending and (pending_chunks >= self.embed_batch_size or finished):
+                batch: List[Tuple[str, Any]] = []
+                batch_chunks = 0
+                while pending and (batch_chunks < self.embed_batch_size or pending[0][0] == "done"):
+                    kind, payload = pending.popleft()
+                    batch.append((kind, payload))
+                    if kind == "chunk":
+                        batch_chunks += 1
+                pending_chunks -= batch_chunks
+
+                texts = [payload["text"] for kind, payload in batch if kind == "chunk"]
+                embeddings = iter([])
+                if texts:
+                    start = time.perf_counter()
+                    embeddings = iter(self.pipeline.compute_embeddings(texts))
+                    self.stats["embed"].add(len(texts), time.perf_counter() - start)
+
+                for kind, payload in batch:
+                    if kind == "chunk":
+                        write_buffer.append({"chunk": payload, "embedding": next(embeddings)})
+                        buffered_chunks += 1
+                    else:
+                        write_buffer.append({"file_done": payload["file_name"]})
+
+                if buffered_chunks >= self.write_batch_size:
+                    total_chunks += buffered_chunks
+                    write_queue.put(write_buffer)
+                    write_buffer, buffered_chunks = [], 0
+
+            if finished or errors:
+                break
+
+        if write_buffer:
+            total_chunks += buffered_chunks
+            write_queue.put(write_buffer)
+
+        return total_chunks
+
+    # --- Stage 3: write (batched across files) ---
+    def _write(self, write_queue: "queue.Queue", errors: List[BaseException], on_file_written: Optional[Callable[[str, List[str]], None]]):
+        file_ids: Dict[str, List[str]] = {}
+        while True:
+            batch = write_queue.get()
+            if batch is _SENTINEL:
+                return
+            if errors:
+                continue  # drain the queue so the embed stage never blocks
+
+            try:
+                entries = [entry for entry in batch if "chunk" in entry]
+                if entries:
+                    chunks = [entry["chunk"] for entry in entries]
+                    ids = self.pipeline.make_ids(chunks)
+                    start = time.perf_counter()
+                    self.pipeline.write_documents(
+                        [chunk["text"] for chunk in chunks],
+                        [entry["embedding"] for entry in entries],
+                        [chunk["metadata"] for chunk in chunks],
+                        ids,
+                    )
+                    self.stats["write"].add(len(entries), time.perf_counter() - start)
+                    for chunk, chunk_id in zip(chunks, ids):
+                        file_ids.setdefault(chunk["metadata"]["source_file"], []).append(chunk_id)
+
+                for entry in batch:
+                    if "file_done" in entry:
+                        ids_of_file = file_ids.pop(entry["file_done"], [])
+                        if on_file_written is not None:
+                            on_file_written(entry["file_done"], ids_of_file)
+            except BaseException as e:
+                errors.append(e)
+
+    def print_report(self, wall_seconds: float):
+        print("-" * 60)
+        print(f"Pipeline stage throughput (wall {wall_seconds:.2f}s, {self.workers} workers):")
+        for stage in self.stats.values():
+            print(stage.report(wall_seconds))
+        if self.failed_files:
+            print(f"  Failed files: {', '.join(self.failed_files)}")
+        print("-" * 60)
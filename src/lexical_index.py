@@ -0,0 +1,200 @@
+"""
+BM25 lexical index over the ingested chunks, fused with the dense hits.
+
+Dense retrieval handles exact legal tokens ("MADDE 14", law numbers such as "6446",
+defined terms) poorly; this index catches them. It is built by ingest_data.py from
+the whole collection and stored next to it as one .npz file:
+
+  terms        sorted vocabulary
+  offsets      CSR row pointers, postings of terms[t] are [offsets[t], offsets[t + 1])
+  doc_ids      int32 chunk row of every posting
+  term_freqs   uint16 term frequency of every posting
+  doc_lengths  int32 token count of every chunk
+  chunk_ids    chunk ID of every row (see make_chunk_id)
+
+At load time the BM25 term-frequency part is precomputed per posting, so a query is
+one vectorized scatter-add per query term plus an argpartition.
+"""
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.query_cache import turkish_lower
+
+LEXICAL_INDEX_FILE = "lexical_index.npz"
+INDEX_FORMAT = 1
+
+_TOKEN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+acaba ama ancak bazı bu bunlar bunu bunun da daha de diye en gibi hangi hangisi her için ile ise
+kaç kadar ki kim mi mı mu mü nasıl ne neden nedir nelerdir nerede niçin o olan olarak olup şu tüm
+ve veya ya yani
+""".split())
+
+# Inflectional suffixes (plural, possessive, case, copula), longest first
+_SUFFIXES = sorted(set("""
+ların lerin ları leri lar ler ının inin unun ünün nın nin nun nün ın in un ün
+ından inden undan ünden ndan nden dan den tan ten nda nde da de ta te
+ına ine una üne na ne ya ye yı yi yu yü sı si su sü ı i u ü a e
+dır dir dur dür tır tir tur tür yla yle la le
+""".split()), key=len, reverse=True)
+MIN_STEM_LENGTH = 4
+MAX_STRIPPED_SUFFIXES = 3
+
+
+@lru_cache(maxsize=1 << 16)
+def stem(token: str) -> str:
+    """Light Turkish suffix stripping. Numbers and short words are kept as they are."""
+    if token.isdigit() or len(token) <= MIN_STEM_LENGTH:
+        return token
+    for _ in range(MAX_STRIPPED_SUFFIXES):
+        for suffix in _SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+                token = token[:-len(suffix)]
+                break
+        else:
+            break
+    return token
+
+
+def tokenize(text: str, stemming: bool = True) -> List[str]:
+    tokens = [token for token in _TOKEN.findall(turkish_lower(text)) if token not in STOPWORDS]
+    if stemming:
+        tokens = [stem(token) for token in tokens]
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray, term_freqs: np.ndarray,
+                 doc_lengths: np.ndarray, chunk_ids: np.ndarray, stemming: bool = True,
+                 k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.chunk_ids = chunk_ids
+        self.stemming = stemming
+        self.k1 = k1
+        self.b = b
+
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms.tolist())}
+        self._chunk_ids = chunk_ids.tolist()
+        doc_count = len(doc_lengths)
+        document_frequency = np.diff(offsets)
+        self.idf = np.log1p((doc_count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+        average_length = float(doc_lengths.mean()) if doc_count else 1.0
+        norms = k1 * (1.0 - b + b * doc_lengths.astype(np.float32) / max(average_length, 1e-9))
+        tf = term_freqs.astype(np.float32)
+        self.weights = (tf * (k1 + 1.0) / (tf + norms[doc_ids])).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, chunk_ids: Sequence[str], texts: Sequence[str], stemming: bool = True,
+              k1: float = 1.2, b: float = 0.75) -> "LexicalIndex":
+        vocabulary: Dict[str, int] = {}
+        posting_terms: List[int] = []
+        posting_docs: List[int] = []
+        posting_freqs: List[int] = []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text, stemming)
+            doc_lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                posting_terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                posting_docs.append(row)
+                posting_freqs.append(min(count, np.iinfo(np.uint16).max))
+
+        # Renumber terms in sorted order and group postings by term (CSR)
+        unsorted_terms = list(vocabulary)
+        order = sorted(range(len(unsorted_terms)), key=unsorted_terms.__getitem__)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        term_of_posting = rank[np.asarray(posting_terms, dtype=np.int64)] if posting_terms else np.zeros(0, np.int64)
+        by_term = np.argsort(term_of_posting, kind="stable")
+
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of_posting, minlength=len(order)), out=offsets[1:])
+        return cls(
+            terms=np.asarray([unsorted_terms[i] for i in order], dtype=str),
+            offsets=offsets,
+            doc_ids=np.asarray(posting_docs, dtype=np.int32)[by_term],
+            term_freqs=np.asarray(posting_freqs, dtype=np.uint16)[by_term],
+            doc_lengths=doc_lengths,
+            chunk_ids=np.asarray(list(chunk_ids), dtype=str),
+            stemming=stemming, k1=k1, b=b,
+        )
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, BM25 score) pairs, best first. Chunks without a matching term are not returned."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query, self.stemming) if token in self.vocabulary}
+        if not term_ids or k <= 0:
+            return []
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # doc_ids are unique within one posting list, so fancy-index add is safe
+            scores[self.doc_ids[start:end]] += self.idf[term_id] * self.weights[start:end]
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self._chunk_ids[row], float(scores[row])) for row in candidates]
+
+    def save(self, path: str):
+        config = {"format": INDEX_FORMAT, "stemming": self.stemming, "k1": self.k1, "b": self.b}
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, terms=self.terms, offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, doc_lengths=self.doc_lengths, chunk_ids=self.chunk_ids,
+                 config=np.asarray(json.dumps(config)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            if config.get("format") != INDEX_FORMAT:
+                raise ValueError(f"Unsupported lexical index format in {path}: {config.get('format')}")
+            return cls(data["terms"], data["offsets"], data["doc_ids"], data["term_freqs"], data["doc_lengths"],
+                       data["chunk_ids"], stemming=config["stemming"], k1=config["k1"], b=config["b"])
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": len(self.doc_lengths), "terms": len(self.terms), "postings": len(self.doc_ids)}
+
+
+def load_lexical_index(persist_dir: str) -> Optional[LexicalIndex]:
+    path = os.path.join(persist_dir, LEXICAL_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    return LexicalIndex.load(path)
+
+
+def build_lexical_index(collection: Dict[str, Any], persist_dir: str, stemming: bool = True) -> LexicalIndex:
+    """collection: worker.get(include=["documents", ...]) result for the whole collection."""
+    index = LexicalIndex.build(collection["ids"], [text or "" for text in collection["documents"]],
+                               stemming=stemming)
+    index.save(os.path.join(persist_dir, LEXICAL_INDEX_FILE))
+    return index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Merges ranked ID lists: score(id) = sum over lists of 1 / (k + rank), rank starting at 1.
+    Ties keep the order in which IDs were first seen.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
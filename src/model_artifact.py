@@ -0,0 +1,99 @@
+"""
+Versioned, pre-merged model artifact for fast cold starts.
+
+Loading the base model, applying the LoRA adapter with PeftModel.from_pretrained
+and running merge_and_unload() on every process start takes minutes. Instead the
+merged weights are written once with save_pretrained (safetensors) to
+
+    <artifact_root>/<version>/
+
+and later starts load that directory directly; safetensors files are memory mapped,
+so weights are paged in from the OS page cache instead of being copied and merged.
+
+The version is a hash of the base model name, the dtype and the adapter files
+(name, size, mtime), so changing the adapter produces a new artifact. artifact.json
+is written last and marks a complete artifact; older versions are removed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional
+
+ARTIFACT_FORMAT = 1
+ARTIFACT_META_FILE = "artifact.json"
+
+
+def adapter_fingerprint(adapter_path: str) -> str:
+    digest = hashlib.sha256()
+    if os.path.isdir(adapter_path):
+        for name in sorted(os.listdir(adapter_path)):
+            path = os.path.join(adapter_path, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def artifact_version(base_model_name: str, adapter_path: str, dtype: str) -> str:
+    key = json.dumps({
+        "format": ARTIFACT_FORMAT,
+        "base_model": base_model_name,
+        "dtype": dtype,
+        "adapter": adapter_fingerprint(adapter_path),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def read_artifact(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, ARTIFACT_META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_artifact(artifact_root: str, version: str) -> Optional[str]:
+    """Path of a complete artifact for version, or None."""
+    path = os.path.join(artifact_root, version)
+    meta = read_artifact(path)
+    if meta is None or meta.get("version") != version:
+        return None
+    return path
+
+
+def write_artifact(model, tokenizer, artifact_root: str, version: str, base_model_name: str,
+                   adapter_path: str, dtype: str, max_shard_size: str = "2GB") -> str:
+    """
+    Saves an already merged model + tokenizer as <artifact_root>/<version>.
+    Written to a temporary directory and renamed, so a crash never leaves a half artifact.
+    """
+    os.makedirs(artifact_root, exist_ok=True)
+    path = os.path.join(artifact_root, version)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    model.save_pretrained(tmp_path, safe_serialization=True, max_shard_size=max_shard_size)
+    tokenizer.save_pretrained(tmp_path)
+    with open(os.path.join(tmp_path, ARTIFACT_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": ARTIFACT_FORMAT,
+            "version": version,
+            "base_model": base_model_name,
+            "adapter_path": adapter_path,
+            "dtype": dtype,
+            "created_at": time.time(),
+        }, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    remove_old_artifacts(artifact_root, keep=version)
+    return path
+
+
+def remove_old_artifacts(artifact_root: str, keep: str):
+    for name in os.listdir(artifact_root):
+        path = os.path.join(artifact_root, name)
+        if name != keep and os.path.isdir(path) and (read_artifact(path) is not None or name.endswith(".tmp")):
+            shutil.rmtree(path, ignore_errors=True)
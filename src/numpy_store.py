@@ -0,0 +1,346 @@
+"""
+In-process exact-search vector store on a memory-mapped NumPy matrix.
+
+For a corpus of a few thousand chunks an exact scan beats a separate HNSW database:
+one matmul + argpartition per query (or per batch of queries), deterministic results,
+no chromadb import in the serving process.
+
+On-disk layout (inside the Chroma persist directory, written by ingest_data.py):
+  numpy_store.json          ids, documents, metadatas, dim and the current vectors file
+  numpy_store.<stamp>.f32   row-normalized float32 matrix, one row per id
+  numpy_store.<stamp>.<mode>.npz
+                            compressed first-stage index per mode (see vector_compression)
+
+With first_stage set, a search scans the compressed index for rescore_candidates rows
+and rescores only those with exact cosine on the full vectors.
+
+A rebuild writes a new vectors file first and then atomically replaces the JSON, so a
+running reader (which re-checks the JSON stamp on every search) never sees a half
+written store.
+
+Scores follow the Chroma collection ("hnsw:space": "cosine"): distance = 1 - cosine.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.vector_compression import DEFAULT_PCA_DIM, MODES, FirstStageIndex, load_first_stage
+
+NUMPY_STORE_FILE = "numpy_store.json"
+STORE_FORMAT = 1
+# Fields whose value masks are built when the store is loaded; other fields are masked on first use
+PRECOMPUTED_FILTER_FIELDS = ("source_file",)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores of every row (unordered)."""
+    if k < scores.shape[1]:
+        return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+
+
+def write_numpy_store(persist_dir: str, ids: Sequence[str], documents: Sequence[str],
+                      metadatas: Sequence[Optional[Dict[str, Any]]], embeddings,
+                      first_stage_modes: Sequence[str] = MODES, pca_dim: int = DEFAULT_PCA_DIM) -> str:
+    """Writes a new store generation (rows sorted by id) and returns the header path."""
+    order = sorted(range(len(ids)), key=lambda row: ids[row])
+    vectors = _normalize_rows(embeddings)[order] if len(ids) else np.zeros((0, 0), dtype=np.float32)
+    dim = int(vectors.shape[1]) if len(ids) else 0
+
+    generation = f"numpy_store.{time.time_ns()}"
+    vectors_file = f"{generation}.f32"
+    vectors.tofile(os.path.join(persist_dir, vectors_file))
+    first_stage = {}
+    if len(ids):
+        for mode in first_stage_modes:
+            first_stage[mode] = f"{generation}.{mode}.npz"
+            FirstStageIndex.fit(vectors, mode, pca_dim).save(os.path.join(persist_dir, first_stage[mode]))
+    header = {
+        "format": STORE_FORMAT,
+        "dim": dim,
+        "count": len(ids),
+        "vectors_file": vectors_file,
+        "first_stage": first_stage,
+        "ids": [ids[row] for row in order],
+        "documents": [documents[row] or "" for row in order],
+        "metadatas": [metadatas[row] or {} for row in order],
+    }
+    path = os.path.join(persist_dir, NUMPY_STORE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+    # Older generations may still be mapped by a running API process (Windows refuses the delete)
+    for old in glob.glob(os.path.join(persist_dir, "numpy_store.*.f32")) + \
+            glob.glob(os.path.join(persist_dir, "numpy_store.*.*.npz")):
+        if not os.path.basename(old).startswith(generation + "."):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    LangChain VectorStore over numpy_store.json, drop-in for the Chroma store in
+    load_retriever / QueryCache (similarity_search*_with_relevance_scores, get, as_retriever).
+
+    first_stage: None (exact scan) or one of vector_compression.MODES for two-stage search
+    with rescore_candidates exact rescored rows per query.
+    """
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, first_stage: Optional[str] = None,
+                 rescore_candidates: int = 64):
+        if first_stage is not None and first_stage not in MODES:
+            raise ValueError(f"Unknown first stage mode: {first_stage} (expected one of {MODES})")
+        self.persist_directory = persist_directory
+        self.path = os.path.join(persist_directory, NUMPY_STORE_FILE)
+        self.first_stage_mode = first_stage
+        self.rescore_candidates = rescore_candidates
+        self._embedding_function = embedding_function
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._masks: Dict[Tuple[str, Any], np.ndarray] = {}
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    # --- loading ---
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        stamp = self._file_stamp()
+        if stamp is None:
+            raise FileNotFoundError(f"{self.path} not found, run ingest_data.py first")
+        with open(self.path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported numpy store format in {self.path}: {header.get('format')}")
+
+        count, dim = header["count"], header["dim"]
+        if count:
+            vectors = np.memmap(os.path.join(self.persist_directory, header["vectors_file"]), dtype=np.float32,
+                                mode="r", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        first_stage = None
+        if self.first_stage_mode is not None:
+            first_stage_file = header.get("first_stage", {}).get(self.first_stage_mode)
+            first_stage = load_first_stage(os.path.join(self.persist_directory, first_stage_file)
+                                           if first_stage_file else None)
+            if first_stage is None and count:
+                print(f"[WARN] {self.first_stage_mode} first stage index missing in {self.path}, using exact search")
+        metadatas = header["metadatas"]
+        masks = {}
+        for field in PRECOMPUTED_FILTER_FIELDS:
+            for value in {metadata.get(field) for metadata in metadatas}:
+                masks[(field, value)] = np.fromiter((metadata.get(field) == value for metadata in metadatas),
+                                                    dtype=bool, count=len(metadatas))
+        # Everything is built first and assigned together, so a concurrent search sees at most a brief mix
+        self.ids, self.documents, self.metadatas, self.vectors, self.first_stage, self._rows, self._masks = (
+            header["ids"], header["documents"], metadatas, vectors, first_stage,
+            {chunk_id: row for row, chunk_id in enumerate(header["ids"])}, masks)
+        self._stamp = stamp
+
+    def _refresh(self):
+        """Picks up a store rebuilt by ingest_data.py (one stat call per search)."""
+        if self._file_stamp() != self._stamp:
+            with self._lock:
+                if self._file_stamp() != self._stamp:
+                    self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- filters ---
+    def _field_mask(self, field: str, value: Any) -> np.ndarray:
+        key = (field, value)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((metadata.get(field) == value for metadata in self.metadatas),
+                               dtype=bool, count=len(self.metadatas))
+            self._masks[key] = mask
+        return mask
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Boolean row mask for a Chroma style where filter ($eq, $ne, $in, $nin, $and, $or)."""
+        if not where:
+            return None
+        masks = []
+        for field, condition in where.items():
+            if field in ("$and", "$or"):
+                parts = [self._mask(part) for part in condition]
+                parts = [part if part is not None else np.ones(len(self), dtype=bool) for part in parts]
+                masks.append(np.logical_and.reduce(parts) if field == "$and" else np.logical_or.reduce(parts))
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if operator == "$eq":
+                    masks.append(self._field_mask(field, value))
+                elif operator == "$ne":
+                    masks.append(~self._field_mask(field, value))
+                elif operator in ("$in", "$nin"):
+                    mask = np.logical_or.reduce([self._field_mask(field, v) for v in value]) \
+                        if value else np.zeros(len(self), dtype=bool)
+                    masks.append(mask if operator == "$in" else ~mask)
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+        return np.logical_and.reduce(masks)
+
+    # --- search ---
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self.documents[row], metadata=dict(self.metadatas[row]), id=self.ids[row])
+
+    def batch_search_by_vectors(self, embeddings, k: int = 4, filter: Optional[Dict[str, Any]] = None
+                                ) -> List[List[Tuple[Document, float]]]:
+        """
+        Top-k (Document, distance) for every query row. Exact search is one (queries x chunks)
+        matmul; with a first stage the compressed scan picks the candidates that get rescored.
+        """
+        self._refresh()
+        queries = _normalize_rows(embeddings)
+        vectors, first_stage = self.vectors, self.first_stage
+        mask = self._mask(filter)
+        available = len(vectors) if mask is None else int(mask.sum())
+        k = min(k, available)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        candidates = max(k, self.rescore_candidates)
+        if first_stage is not None and candidates < available:
+            approximate = first_stage.scores(queries)
+            if mask is not None:
+                approximate[:, ~mask] = -np.inf
+            candidate_rows = _top_k(approximate, candidates)
+            # Exact cosine on the full rows of the candidates only (memmap reads just these rows)
+            scores = np.einsum("qcd,qd->qc", vectors[candidate_rows], queries)
+        else:
+            candidate_rows = None
+            scores = queries @ vectors.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+
+        results = []
+        for query_row, columns in enumerate(_top_k(scores, k)):
+            column_scores = scores[query_row, columns]
+            rows = candidate_rows[query_row, columns] if candidate_rows is not None else columns
+            # Deterministic order: best score first, ties by row (rows are sorted by id)
+            order = np.lexsort((rows, -column_scores))
+            results.append([(self._document(int(rows[i])), float(1.0 - column_scores[i])) for i in order])
+        return results
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4,
+                                                           filter: Optional[Dict[str, Any]] = None,
+                                                           **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Same contract as the Chroma wrapper: the "score" is the collection distance (lower = better)
+        return self.batch_search_by_vectors(np.asarray(embedding, dtype=np.float32)[None, :], k, filter)[0]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    # --- Chroma compatible reads ---
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"), **kwargs: Any) -> Dict[str, Any]:
+        self._refresh()
+        if ids is not None:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        else:
+            rows = list(range(len(self)))
+        mask = self._mask(where)
+        if mask is not None:
+            rows = [row for row in rows if mask[row]]
+        result: Dict[str, Any] = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[rows])
+        return result
+
+    # --- writes (ingest_data.py normally rebuilds the whole store) ---
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            raise ValueError("NumpyVectorStore.add_texts needs explicit ids (see make_chunk_id)")
+        metadatas = metadatas or [{} for _ in texts]
+        embeddings = np.asarray(self._embedding_function.embed_documents(texts), dtype=np.float32)
+
+        self._refresh()
+        with self._lock:
+            rows = dict(self._rows)
+            all_ids, all_documents, all_metadatas = list(self.ids), list(self.documents), list(self.metadatas)
+            vectors = np.array(self.vectors) if len(self) else np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            new_vectors = []
+            for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, embeddings):
+                if chunk_id in rows:
+                    all_documents[rows[chunk_id]], all_metadatas[rows[chunk_id]] = text, metadata
+                    vectors[rows[chunk_id]] = vector
+                    continue
+                rows[chunk_id] = len(all_ids)
+                all_ids.append(chunk_id)
+                all_documents.append(text)
+                all_metadatas.append(metadata)
+                new_vectors.append(vector)
+            if new_vectors:
+                vectors = np.vstack([vectors, np.asarray(new_vectors, dtype=np.float32)])
+            write_numpy_store(self.persist_directory, all_ids, all_documents, all_metadatas, vectors)
+            self._load()
+        return list(ids)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory: str = "chroma_db",
+                   **kwargs: Any) -> "NumpyVectorStore":
+        os.makedirs(persist_directory, exist_ok=True)
+        if not os.path.exists(os.path.join(persist_directory, NUMPY_STORE_FILE)):
+            write_numpy_store(persist_directory, [], [], [], np.zeros((0, 0), dtype=np.float32))
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def export_numpy_store(collection: Dict[str, Any], persist_dir: str, pca_dim: int = DEFAULT_PCA_DIM) -> str:
+    """collection: worker.get(include=["documents", "metadatas", "embeddings"]) for the whole collection."""
+    return write_numpy_store(persist_dir, collection["ids"], collection["documents"], collection["metadatas"],
+                             collection["embeddings"] if len(collection["ids"]) else np.zeros((0, 0), np.float32),
+                             pca_dim=pca_dim)
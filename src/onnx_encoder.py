@@ -0,0 +1,204 @@
+"""
+ONNX Runtime backend for the sentence embedding encoder (BERT + mean pooling).
+
+The encoder and the mean pooling over the attention mask are exported once as a
+single ONNX graph
+
+    <onnx_dir>/encoder.onnx    inputs input_ids, attention_mask -> sentence_embedding
+    <onnx_dir>/encoder.json    model name, hidden size, max length, parity
+
+and served by an ONNX Runtime session with all graph optimizations enabled
+(constant folding, LayerNorm/GELU fusions). The model is exported with eager
+attention: SDPA decomposes into a graph that runs slower under ONNX Runtime than
+the plain MatMul/Softmax form. Pooling inside the graph means a request returns
+one vector per text instead of the full hidden states.
+
+The export is checked against the path it replaces: the probe texts are embedded
+by both, and the lowest cosine must reach MIN_PARITY_COSINE. Otherwise nothing is
+written and the caller keeps the torch encoder. encoder.json is written last and
+marks a complete export.
+
+The query path (src/chat_engine.py) and ingestion (src/rag_pipeline.py) share one
+export directory, so both export and look it up with ENCODER_MAX_LENGTH: an export
+made with another sequence limit is not found and is replaced.
+
+Serving runs onnxruntime, numpy and the tokenizer only; no torch model is loaded.
+The export itself uses torch.onnx (dynamo exporter, needs onnxscript).
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.embedding_batcher import plan_batches
+
+ONNX_MODEL_FILE = "encoder.onnx"
+ONNX_META_FILE = "encoder.json"
+ONNX_FORMAT = 1
+ONNX_OPSET = 18
+MIN_PARITY_COSINE = 0.999
+ENCODER_MAX_LENGTH = 512
+
+
+def read_encoder_meta(onnx_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(onnx_dir, ONNX_META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_encoder(onnx_dir: str, model_name: str, max_length: int = ENCODER_MAX_LENGTH) -> Optional[str]:
+    """Path of a complete export of model_name for sequences up to max_length, or None."""
+    meta = read_encoder_meta(onnx_dir)
+    if (meta is None or meta.get("format") != ONNX_FORMAT or meta.get("model_name") != model_name
+            or meta.get("max_length") != max_length):
+        return None
+    path = os.path.join(onnx_dir, ONNX_MODEL_FILE)
+    return path if os.path.isfile(path) else None
+
+
+def _mean_pooled(model):
+    import torch
+
+    class MeanPooledEncoder(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask):
+            hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            return (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+
+    return MeanPooledEncoder(model).eval()
+
+
+def export_encoder(model, tokenizer, onnx_dir: str, model_name: str, reference: Callable[[List[str]], np.ndarray],
+                   max_length: int = ENCODER_MAX_LENGTH, probe_texts: Optional[Sequence[str]] = None,
+                   min_cosine: float = MIN_PARITY_COSINE) -> str:
+    """
+    Exports model (a transformers encoder) with mean pooling to <onnx_dir>/encoder.onnx.
+    reference(texts) embeds texts with the current path; ValueError if the exported graph
+    differs (lowest cosine below min_cosine). Returns the path of the .onnx file.
+    """
+    import torch
+
+    from src.cpu_profile import PROBE_TEXTS, embedding_cosine
+
+    probe_texts = list(probe_texts or PROBE_TEXTS)
+    tmp_dir = f"{onnx_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # The example batch must contain padding: an all-ones mask lets the model skip building
+    # the attention mask, and that branch would be baked into the graph
+    example = tokenizer(probe_texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    batch, sequence = torch.export.Dim("batch"), torch.export.Dim("sequence", max=max_length)
+    attention = model.config._attn_implementation
+    model.set_attn_implementation("eager")
+    try:
+        torch.onnx.export(
+            _mean_pooled(model.float()),
+            (example["input_ids"], example["attention_mask"]),
+            os.path.join(tmp_dir, ONNX_MODEL_FILE),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["sentence_embedding"],
+            dynamic_shapes={"input_ids": {0: batch, 1: sequence}, "attention_mask": {0: batch, 1: sequence}},
+            opset_version=ONNX_OPSET,
+            dynamo=True,
+            external_data=False,
+        )
+    finally:
+        model.set_attn_implementation(attention)
+
+    encoder = OnnxEncoder(os.path.join(tmp_dir, ONNX_MODEL_FILE))
+    cosine = embedding_cosine(np.asarray(reference(probe_texts), dtype=np.float32),
+                              encoder.embed(tokenizer, probe_texts, max_length=max_length))
+    if cosine < min_cosine:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise ValueError(f"ONNX encoder cosine {cosine:.6f} < {min_cosine}")
+
+    with open(os.path.join(tmp_dir, ONNX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": ONNX_FORMAT,
+            "model_name": model_name,
+            "hidden_size": int(model.config.hidden_size),
+            "max_length": max_length,
+            "opset": ONNX_OPSET,
+            "torch": torch.__version__,
+            "parity_min_cosine": cosine,
+            "created_at": time.time(),
+        }, f, indent=2)
+    shutil.rmtree(onnx_dir, ignore_errors=True)
+    os.replace(tmp_dir, onnx_dir)
+    return os.path.join(onnx_dir, ONNX_MODEL_FILE)
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime session over an exported encoder; returns float32 mean pooled vectors.
+    threads: intra-op threads (None = onnxruntime default, one per physical core).
+    """
+
+    def __init__(self, path: str, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Batch and sequence length change with every call; a memory pattern is planned per shape
+        options.enable_mem_pattern = False
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        outputs = self.session.run(None, {
+            "input_ids": np.asarray(input_ids, dtype=np.int64),
+            "attention_mask": np.asarray(attention_mask, dtype=np.int64),
+        })
+        return outputs[0].astype(np.float32, copy=False)
+
+    def embed(self, tokenizer, texts: Sequence[str], max_length: int = ENCODER_MAX_LENGTH, token_budget: int = 8192,
+              max_batch_size: int = 64) -> np.ndarray:
+        """Tokenizes texts and runs them in length-bucketed batches (see embedding_batcher)."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        encodings = tokenizer(texts, truncation=True, max_length=max_length)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        embeddings: Optional[np.ndarray] = None
+        for batch in plan_batches(lengths, token_budget=token_budget, max_batch_size=max_batch_size):
+            features = {key: [encodings[key][i] for i in batch] for key in ("input_ids", "attention_mask")}
+            inputs = tokenizer.pad(features, padding=True, return_tensors="np")
+            vectors = self(inputs["input_ids"], inputs["attention_mask"])
+            if embeddings is None:
+                embeddings = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[batch] = vectors
+        return embeddings
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain Embeddings over an exported encoder, a drop-in for HuggingFaceEmbeddings at query time."""
+
+    def __init__(self, onnx_dir: str, model_name: str, threads: Optional[int] = None, tokenizer=None):
+        path = find_encoder(onnx_dir, model_name)
+        if path is None:
+            raise FileNotFoundError(f"No ONNX export of {model_name} in {onnx_dir}")
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.tokenizer = tokenizer
+        self.max_length = read_encoder_meta(onnx_dir)["max_length"]
+        self.encoder = OnnxEncoder(path, threads=threads)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encoder.embed(self.tokenizer, texts, max_length=self.max_length).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
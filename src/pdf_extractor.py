@@ -1,20 +1,217 @@
-import fitz  # type: ignore
+"""
+PDF text extraction, page by page.
+
+PDFExtractor.iter_pages() yields the text of one page at a time, so the splitter
+(TextSplitter.iter_chunks) can consume a document as a stream instead of one
+concatenated string. Extraction can fan out across worker processes by page range
+(extract_page_range tasks on a caller-owned process pool).
+
+Repeated page headers and footers (the same line, digits ignored, in the first or
+last EDGE_LINES lines of at least HEADER_MIN_SHARE of the pages, e.g. gazette
+titles and page numbers) are removed once, at extraction time. Article headings
+are never removed. Finding them needs every page, so extraction is two passes
+with bounded memory: the first extracts each page once, spills its raw text to a
+temporary file and counts edge lines; the second reads the spill back and yields
+the cleaned pages one at a time.
+
+With a cache_dir the cleaned pages are stored as <cache_dir>/<sha256 of the PDF>.jsonl
+(a header line, then one JSON string per page) and streamed from there on every
+later run: unchanged PDFs are not opened again, by ingest_data.py or the check
+scripts. EXTRACTION_FORMAT is part of the header; bumping it invalidates the cache.
+"""
+import json
 import os
+import re
+import tempfile
+from collections import Counter, deque
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import fitz  # type: ignore
+
+EXTRACTION_FORMAT = 1
+EXTRACTION_CACHE_DIR = "extraction_cache"
+EDGE_LINES = 2
+HEADER_MIN_SHARE = 0.6
+HEADER_MIN_PAGES = 4
+PAGES_PER_TASK = 16
+# Page-range tasks submitted ahead of the one being consumed (bounds pages held in memory)
+TASKS_IN_FLIGHT = 8
+
+_DIGITS = re.compile(r"\d+")
+# Matched against edge-line signatures, where digits are already "#"
+_ARTICLE_HEADING = re.compile(r"^\s*(?:EK\s+|GEÇİCİ\s+)?MADDE\s+[\d#]", re.IGNORECASE)
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Raw text of pages [start, stop); a process pool task."""
+    with fitz.open(file_path) as doc:
+        return [doc[index].get_text() for index in range(start, min(stop, doc.page_count))]
+
+
+def _edge_indices(lines: Sequence[str], edge_lines: int) -> List[int]:
+    filled = [index for index, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:edge_lines] + filled[-edge_lines:]))
+
+
+class EdgeLineCounter:
+    """Counts edge lines (digits ignored) page by page; repeated() is the set to strip."""
+
+    def __init__(self, edge_lines: int = EDGE_LINES):
+        self.edge_lines = edge_lines
+        self.pages = 0
+        self.page_counts: Counter = Counter()   # pages a line appears on
+        self.occurrences: Counter = Counter()   # edge lines it would remove
+
+    def add(self, page: str):
+        lines = page.split("\n")
+        signatures = [_DIGITS.sub("#", lines[index].strip()) for index in _edge_indices(lines, self.edge_lines)]
+        self.pages += 1
+        self.page_counts.update(set(signatures))
+        self.occurrences.update(signatures)
+
+    def repeated(self, min_share: float = HEADER_MIN_SHARE, min_pages: int = HEADER_MIN_PAGES) -> Set[str]:
+        if self.pages < min_pages:
+            return set()
+        return {line for line, count in self.page_counts.items()
+                if count >= min_share * self.pages and not _ARTICLE_HEADING.match(line)}
+
+    def removed_lines(self, repeated: Set[str]) -> int:
+        return sum(self.occurrences[line] for line in repeated)
+
+
+def strip_edge_lines(page: str, repeated: Set[str], edge_lines: int = EDGE_LINES) -> str:
+    if not repeated:
+        return page
+    lines = page.split("\n")
+    drop = {index for index in _edge_indices(lines, edge_lines) if _DIGITS.sub("#", lines[index].strip()) in repeated}
+    if not drop:
+        return page
+    return "\n".join(line for index, line in enumerate(lines) if index not in drop)
+
+
+def strip_repeated_lines(pages: Sequence[str], edge_lines: int = EDGE_LINES, min_share: float = HEADER_MIN_SHARE,
+                         min_pages: int = HEADER_MIN_PAGES) -> Tuple[List[str], int]:
+    """Removes header / footer lines repeated across pages; returns (pages, removed line count)."""
+    counter = EdgeLineCounter(edge_lines)
+    for page in pages:
+        counter.add(page)
+    repeated = counter.repeated(min_share, min_pages)
+    return [strip_edge_lines(page, repeated, edge_lines) for page in pages], counter.removed_lines(repeated)
+
 
 class PDFExtractor:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, cache_dir: Optional[str] = None, sha256: Optional[str] = None):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         self.file_path = file_path
         self.file_name = os.path.basename(file_path)
+        self.cache_dir = cache_dir
+        self._sha256 = sha256
+        self.removed_lines = 0
+        self.from_cache = False
+
+    @property
+    def cache_path(self) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        if self._sha256 is None:
+            from src.ingest_manifest import file_sha256
+            self._sha256 = file_sha256(self.file_path)
+        return os.path.join(self.cache_dir, f"{self._sha256}.jsonl")
+
+    def page_count(self) -> int:
+        with fitz.open(self.file_path) as doc:
+            return doc.page_count
+
+    def extract_pages(self, pool=None, pages_per_task: int = PAGES_PER_TASK) -> List[str]:
+        """
+        Extracts and cleans every page (ignores the cache, writes it when configured).
+        pool: optional concurrent.futures executor; pages are then extracted in
+        pages_per_task ranges in parallel.
+        """
+        return list(self._extract(pool, pages_per_task))
+
+    def iter_pages(self, pool=None) -> Iterator[str]:
+        """Cleaned page texts, streamed from the cache when it has this PDF (see the module docstring)."""
+        cached = self._open_cache()
+        if cached is None:
+            yield from self._extract(pool)
+            return
+        self.from_cache = True
+        with cached:
+            for line in cached:
+                yield json.loads(line)
 
     def extract_text(self) -> str:
         """Extracts full text from the PDF."""
+        return "\n".join(self.iter_pages())
+
+    def _open_cache(self):
+        path = self.cache_path
+        if path is None or not os.path.exists(path):
+            return None
+        f = open(path, "r", encoding="utf-8")
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != EXTRACTION_FORMAT:
+            f.close()
+            return None
+        self.removed_lines = header.get("removed_lines", 0)
+        return f
+
+    def _raw_pages(self, pool, pages_per_task: int) -> Iterator[str]:
+        count = self.page_count()
+        if pool is None or count <= pages_per_task:
+            with fitz.open(self.file_path) as doc:
+                for page in doc:
+                    yield page.get_text()
+            return
+        starts = iter(range(0, count, pages_per_task))
+        pending = deque(pool.submit(extract_page_range, self.file_path, start, start + pages_per_task)
+                        for _, start in zip(range(TASKS_IN_FLIGHT), starts))
+        while pending:
+            pages = pending.popleft().result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(pool.submit(extract_page_range, self.file_path, start, start + pages_per_task))
+            yield from pages
+
+    def _extract(self, pool=None, pages_per_task: int = PAGES_PER_TASK) -> Iterator[str]:
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as spill:
+            # Pass 1: raw pages to the spill file, edge lines counted
+            counter = EdgeLineCounter()
+            try:
+                for page in self._raw_pages(pool, pages_per_task):
+                    counter.add(page)
+                    spill.write(json.dumps(page, ensure_ascii=False) + "\n")
+            except Exception as e:
+                raise RuntimeError(f"Error reading PDF {self.file_path}: {e}")
+            repeated = counter.repeated()
+            self.removed_lines = counter.removed_lines(repeated)
+
+            # Pass 2: cleaned pages, written to the cache as they are yielded
+            spill.seek(0)
+            pages = (strip_edge_lines(json.loads(line), repeated) for line in spill)
+            if self.cache_dir is None:
+                yield from pages
+            else:
+                yield from self._write_cache(pages, counter.pages)
+
+    def _write_cache(self, pages: Iterable[str], page_count: int) -> Iterator[str]:
+        """Yields pages while writing them; the cache file only appears once every page is written."""
+        path = self.cache_path
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
         try:
-            doc = fitz.open(self.file_path)
-            text = []
-            for page in doc:
-                text.append(page.get_text())
-            return "\n".join(text)
-        except Exception as e:
-            raise RuntimeError(f"Error reading PDF {self.file_path}: {e}")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"format": EXTRACTION_FORMAT, "file_name": self.file_name, "pages": page_count,
+                                    "removed_lines": self.removed_lines}) + "\n")
+                for page in pages:
+                    f.write(json.dumps(page, ensure_ascii=False) + "\n")
+                    yield page
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,63 @@
+"""
+KV cache of the static prompt prefix (the instruction block before {context}).
+
+The prefix is prefilled once when the model is loaded; every generation starts
+from a fork of that state and only prefills its own context + question. Forks are
+copy-on-write: they share the prefix tensors, and DynamicCache.update replaces
+(torch.cat) instead of writing in place, so the shared prefix is never modified.
+"""
+import copy
+import hashlib
+from typing import List, Optional
+
+import torch
+from transformers import DynamicCache
+
+
+def prefix_key(prefix_text: str) -> str:
+    return hashlib.sha256(prefix_text.encode("utf-8")).hexdigest()
+
+
+class PrefixCache:
+    def __init__(self, model, tokenizer, prefix_text: str):
+        self.key = prefix_key(prefix_text)
+        self.prefix_text = prefix_text
+        self.tokenizer = tokenizer
+        self.ids: List[int] = list(tokenizer(prefix_text)["input_ids"])
+        if not self.ids:
+            raise ValueError("Prefix tokenizes to no tokens")
+
+        input_ids = torch.tensor([self.ids], dtype=torch.long, device=model.device)
+        with torch.no_grad():
+            outputs = model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                            past_key_values=DynamicCache(), use_cache=True)
+        self.cache = outputs.past_key_values
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def matches(self, prompt_ids: List[int]) -> bool:
+        """
+        True if prompt_ids start with the cached prefix and add at least one token.
+        Prompts are tokenized as a whole, so a token merged across the prefix
+        boundary simply falls back to a full prefill.
+        """
+        return len(prompt_ids) > len(self.ids) and list(prompt_ids[:len(self.ids)]) == self.ids
+
+    def fork(self):
+        """Cache for one generation, sharing the prefix tensors."""
+        forked = copy.copy(self.cache)
+        # transformers >= 4.56 keeps per-layer objects, older versions key/value lists
+        if hasattr(self.cache, "layers"):
+            forked.layers = [copy.copy(layer) for layer in self.cache.layers]
+        else:
+            forked.key_cache = list(self.cache.key_cache)
+            forked.value_cache = list(self.cache.value_cache)
+        return forked
+
+
+def build_prefix_cache(model, tokenizer, prefix_text: str, current: Optional[PrefixCache] = None) -> PrefixCache:
+    """Returns current if it was built for the same prefix text, else prefills a new one."""
+    if current is not None and current.key == prefix_key(prefix_text):
+        return current
+    return PrefixCache(model, tokenizer, prefix_text)
@@ -0,0 +1,31 @@
+"""
+Prompt templates of the chat engine.
+
+Everything before {context} is identical for every request, so its KV cache is
+computed once (see prefix_cache.PrefixCache).
+"""
+from typing import Tuple
+
+RAG_PROMPT_TEMPLATE = """<start_of_turn>user
+Sen Türkiye Enerji Mevzuatı konusunda uzman, yardımsever bir asistansın. 
+Aşağıda farklı kaynaklardan alınmış 'Mevzuat Bağlamı' parçaları verilmiştir.
+Bu parçalardaki bilgileri BİRLEŞTİREREK ve SENTEZLEYEREK soruyu detaylıca cevapla.
+Eğer bir cümle yarım kalmışsa (kesilmişse), o cümleyi ihmal et.
+Sadece verilen bağlamdaki bilgileri kullan, dışarıdan bilgi ekleme.
+Eğer cevap bağlamda hiç yoksa "Verilen mevzuat metinlerinde bu sorunun cevabı bulunmamaktadır." de.
+
+Mevzuat Bağlamı:
+{context}
+
+Soru:
+{question}<end_of_turn>
+<start_of_turn>model
+"""
+
+
+def split_template(template: str = RAG_PROMPT_TEMPLATE) -> Tuple[str, str]:
+    """(static prefix, rest of the template) split at the {context} placeholder."""
+    prefix, separator, rest = template.partition("{context}")
+    if not separator:
+        raise ValueError("Template has no {context} placeholder")
+    return prefix, separator + rest
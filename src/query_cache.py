@@ -0,0 +1,244 @@
+"""
+Query-side caches for the /chat/stream retrieval path.
+
+Two bounded LRU + TTL layers:
+  query text                -> query embedding     (skips the BERT forward pass)
+  (query embedding hash, k) -> scored chunks       (skips the vector search)
+
+With a lexical index the dense hits are fused with BM25 hits (reciprocal rank fusion)
+and the result key also includes the normalized query text. Questions that name an
+article of a law are served from the article index without embedding or search.
+
+Both layers are dropped automatically when the collection changes, detected through
+the ingestion manifest stamp written by ingest_data.py; the lexical and article indexes
+are reloaded at the same time.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from src.ingest_manifest import document_chunk_id
+from src.telemetry import TELEMETRY
+
+_MISSING = object()
+_WHITESPACE = re.compile(r"\s+")
+
+
+def turkish_lower(text: str) -> str:
+    # str.lower() maps "I" to "i" and "İ" to "i̇"; Turkish needs I -> ı and İ -> i
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def embedding_text(query: str) -> str:
+    """The text that is embedded and keys the embedding cache: whitespace collapsed, case and punctuation
+    kept (the encoder is cased, so "MADDE 14" and "madde 14" embed differently)."""
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def normalize_query(query: str) -> str:
+    query = _WHITESPACE.sub(" ", query).strip()
+    return turkish_lower(query).rstrip(" ?!.")
+
+
+def embedding_key(embedding) -> bytes:
+    return hashlib.blake2b(np.asarray(embedding, dtype=np.float32).tobytes(), digest_size=16).digest()
+
+
+class LRUTTLCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                stored_at, value = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QueryCache:
+    """
+    Wraps a LangChain vector store: embeds the query and runs the scored vector search,
+    serving both steps from cache for repeated questions.
+
+    lexical_index_fn: optional loader returning a LexicalIndex (or None). When an index
+    is available, the top k * fusion_candidates dense and BM25 hits are merged by
+    reciprocal rank fusion.
+
+    article_index_fn: optional loader returning an ArticleIndex (or None), see lookup_article.
+    """
+    def __init__(self, vectorstore, version_fn: Callable[[], Any], max_entries: int = 1024,
+                 ttl_seconds: Optional[float] = 3600.0, lexical_index_fn: Optional[Callable[[], Any]] = None,
+                 fusion_candidates: int = 4, rrf_k: int = 60,
+                 article_index_fn: Optional[Callable[[], Any]] = None, article_max_chunks: int = 8):
+        self.vectorstore = vectorstore
+        self.embedding_function = vectorstore.embeddings
+        self.version_fn = version_fn
+        self.embeddings = LRUTTLCache(max_entries, ttl_seconds)
+        self.results = LRUTTLCache(max_entries, ttl_seconds)
+        self.invalidations = 0
+        self._version = version_fn()
+
+        self.lexical_index_fn = lexical_index_fn
+        self.fusion_candidates = fusion_candidates
+        self.rrf_k = rrf_k
+        self.lexical_index = lexical_index_fn() if lexical_index_fn is not None else None
+        self.article_index_fn = article_index_fn
+        self.article_max_chunks = article_max_chunks
+        self.article_index = article_index_fn() if article_index_fn is not None else None
+        self.article_lookups = 0
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self.embeddings.clear()
+            self.results.clear()
+            if self.lexical_index_fn is not None:
+                self.lexical_index = self.lexical_index_fn()
+            if self.article_index_fn is not None:
+                self.article_index = self.article_index_fn()
+            self.invalidations += 1
+
+    def embed_query(self, query: str) -> List[float]:
+        # Embeds exactly the key, so a cached embedding is the one this text would get
+        key = embedding_text(query)
+        embedding = self.embeddings.get(key)
+        if embedding is None:
+            with TELEMETRY.span("query_embedding"):
+                embedding = self.embedding_function.embed_query(key)
+            self.embeddings.put(key, embedding)
+        return embedding
+
+    def lookup_article(self, query: str) -> Optional[List[Tuple[Any, Optional[float]]]]:
+        """
+        (Document, None) pairs of the article the question names, in chunk_index order,
+        or None when the question names no (unambiguous) article. No embedding, no search.
+        """
+        self._check_version()
+        article_index = self.article_index
+        if article_index is None:
+            return None
+        chunk_ids = article_index.resolve(query)
+        if not chunk_ids:
+            return None
+        chunk_ids = chunk_ids[:self.article_max_chunks]
+
+        result_key = ("article", tuple(chunk_ids))
+        docs_with_scores = self.results.get(result_key)
+        if docs_with_scores is None:
+            from langchain_core.documents import Document
+
+            result = self.vectorstore.get(ids=chunk_ids, include=["documents", "metadatas"])
+            by_id = {chunk_id: Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+                     for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+            docs_with_scores = [(by_id[chunk_id], None) for chunk_id in chunk_ids if chunk_id in by_id]
+            if not docs_with_scores:
+                return None
+            self.results.put(result_key, docs_with_scores)
+        self.article_lookups += 1
+        return list(docs_with_scores)
+
+    def search_with_scores(self, query: str, k: int) -> List[Tuple[Any, float]]:
+        """
+        Same result as vectorstore.similarity_search_with_score(query, k): (Document, distance) pairs.
+        """
+        self._check_version()
+        embedding = self.embed_query(query)
+        lexical_index = self.lexical_index
+
+        if lexical_index is None:
+            result_key = (embedding_key(embedding), k)
+        else:
+            result_key = (embedding_key(embedding), normalize_query(query), k)
+        docs_with_scores = self.results.get(result_key)
+        if docs_with_scores is None:
+            with TELEMETRY.span("vector_search"):
+                if lexical_index is None:
+                    docs_with_scores = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+                else:
+                    docs_with_scores = self._hybrid_search(query, embedding, k, lexical_index)
+            self.results.put(result_key, docs_with_scores)
+        return list(docs_with_scores)
+
+    def _hybrid_search(self, query: str, embedding, k: int, lexical_index) -> List[Tuple[Any, float]]:
+        from src.lexical_index import reciprocal_rank_fusion  # lexical_index imports this module
+
+        candidates = k * self.fusion_candidates
+        dense = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=candidates)
+        by_id = {document_chunk_id(doc): (doc, score) for doc, score in dense}
+        lexical_ids = [chunk_id for chunk_id, _ in lexical_index.search(query, candidates)]
+        fused = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([list(by_id), lexical_ids], k=self.rrf_k)[:k]]
+
+        missing = [chunk_id for chunk_id in fused if chunk_id not in by_id]
+        if missing:
+            by_id.update(self._fetch_with_distances(missing, embedding))
+        return [by_id[chunk_id] for chunk_id in fused if chunk_id in by_id]
+
+    def _fetch_with_distances(self, ids: List[str], embedding) -> Dict[str, Tuple[Any, float]]:
+        """Loads lexical-only hits and scores them with the same cosine distance the collection uses."""
+        from langchain_core.documents import Document
+
+        result = self.vectorstore.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        fetched = {}
+        for chunk_id, text, metadata, vector in zip(result["ids"], result["documents"], result["metadatas"],
+                                                    result["embeddings"]):
+            vector = np.asarray(vector, dtype=np.float32)
+            distance = 1.0 - float(vector @ query) / (float(np.linalg.norm(vector)) or 1.0)
+            fetched[chunk_id] = (Document(page_content=text, metadata=metadata or {}, id=chunk_id), distance)
+        return fetched
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "retrieval_results": self.results.stats(),
+            "lexical_index": self.lexical_index.stats() if self.lexical_index is not None else None,
+            "article_index": self.article_index.stats() if self.article_index is not None else None,
+            "article_lookups": self.article_lookups,
+            "invalidations": self.invalidations,
+        }
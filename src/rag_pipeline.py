@@ -1,133 +1,296 @@
 # import chromadb  <-- REMOVED TO AVOID DLL CONFLICT
 # from chromadb.config import Settings <-- REMOVED
-from typing import List, Dict, Any
-import uuid
+import os
+from typing import List, Dict, Any, Optional
 from transformers import AutoModel, AutoTokenizer
 import torch
-import subprocess
-import json
-import sys
-import os
+import numpy as np
+
+from src.worker_protocol import ChromaWorkerClient
+from src.ingest_manifest import make_chunk_id
+from src.embedding_cache import EmbeddingCache
+from src.embedding_batcher import plan_batches
 
 class RAGPipeline:
-    def __init__(self, persist_directory: str = "chroma_db"):
+    def __init__(self, persist_directory: str = "chroma_db", embedding_cache_dir: Optional[str] = "embedding_cache",
+                 embedding_cache_max_entries: int = 200_000, embedding_token_budget: int = 8192,
+                 embedding_max_batch_size: int = 64, inference_profile: str = "default",
+                 embedding_backend: str = "torch",
+                 model_name: str = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"):
         # We DO NOT initialize ChromaDB here anymore to avoid DLL conflicts with PyTorch.
-        # We will delegate DB operations to a separate subprocess (src/chroma_worker.py).
+        # We will delegate DB operations to a separate, long-lived subprocess (src/chroma_worker.py).
         self.persist_directory = persist_directory
         self.collection_name = "enerji_mevzuati"
+        self._worker: Optional[ChromaWorkerClient] = None
+        
+        # Batches are filled up to this many (padded) tokens instead of a fixed count
+        self.embedding_token_budget = embedding_token_budget
+        self.embedding_max_batch_size = embedding_max_batch_size
         
-        self.model_name = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr"
+        self.model_name = model_name
+        if inference_profile not in ("default", "cpu-int8"):
+            raise ValueError(f"Unknown inference profile: {inference_profile}")
+        if embedding_backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown embedding backend: {embedding_backend}")
+        
+        # "onnx": BERT + mean pooling as one ONNX Runtime graph (see src/onnx_encoder.py);
+        # once exported, the torch model is not loaded at all
+        self.model = None
+        self._onnx = None
+        self.embedding_dim = 0
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModel.from_pretrained(self.model_name)
+            if embedding_backend == "onnx":
+                self._load_onnx_encoder(embedding_cache_dir)
+            if self._onnx is None and self.model is None:
+                self.model = AutoModel.from_pretrained(self.model_name)
         except Exception as e:
             print(f"Error loading model {self.model_name}: {e}")
             raise e
+        self.embedding_backend = "onnx" if self._onnx is not None else "torch"
+        
+        # "cpu-int8": Linear layers of the torch encoder dynamically quantized (see src/cpu_profile.py)
+        self.inference_profile = inference_profile
+        cache_model_key = self.model_name
+        if self._onnx is not None:
+            # Vectors of each backend/profile differ slightly, keep them in their own cache namespace
+            cache_model_key = f"{self.model_name}#onnx"
+        elif inference_profile == "cpu-int8":
+            self._quantize_encoder(embedding_cache_dir)
+            cache_model_key = f"{self.model_name}#cpu-int8"
+        if self.model is not None:
+            self.embedding_dim = self.model.config.hidden_size
+        
+        # Unchanged chunk texts reuse their vectors instead of another BERT forward pass
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if embedding_cache_dir:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_dir,
+                cache_model_key,
+                self.embedding_dim,
+                max_entries=embedding_cache_max_entries
+            )
+
+    def _load_onnx_encoder(self, embedding_cache_dir: Optional[str]):
+        """
+        Opens the ONNX export of the encoder, exporting it first (with a parity check
+        against the torch path) if there is none. On failure the torch encoder is used.
+        """
+        from src.onnx_encoder import OnnxEncoder, export_encoder, find_encoder, read_encoder_meta
+        
+        onnx_dir = os.path.join(embedding_cache_dir or "embedding_cache", "onnx", self.model_name.replace("/", "__"))
+        path = find_encoder(onnx_dir, self.model_name)
+        if path is None:
+            self.model = AutoModel.from_pretrained(self.model_name)
+            self.embedding_dim = self.model.config.hidden_size
+            try:
+                path = export_encoder(self.model, self.tokenizer, onnx_dir, self.model_name, self._encode)
+                print(f"Exported ONNX encoder to {path}")
+            except (ImportError, RuntimeError, ValueError) as e:  # onnxruntime/onnxscript missing, export or parity failed
+                print(f"ONNX encoder not available, using torch: {e}")
+                return
+        self._onnx = OnnxEncoder(path)
+        self.embedding_dim = read_encoder_meta(onnx_dir)["hidden_size"]
+        self.model = None
+
+    def _quantize_encoder(self, embedding_cache_dir: Optional[str]):
+        from src.cpu_profile import PROBE_TEXTS, configure_threads, quantize_encoder
+        
+        configure_threads()
+        probe = self.tokenizer(PROBE_TEXTS, padding=True, truncation=True, max_length=512, return_tensors="pt")
+        cache_dir = None
+        if embedding_cache_dir:
+            cache_dir = os.path.join(embedding_cache_dir, "cpu-int8", self.model_name.replace("/", "__"))
+        try:
+            self.model = quantize_encoder(self.model, lambda model: self._forward(probe, model), cache_dir=cache_dir)
+        except ValueError as e:
+            print(f"int8 encoder rejected, using float32: {e}")
+
+    @property
+    def worker(self) -> ChromaWorkerClient:
+        """
+        The persistent ChromaDB worker, started on first use.
+        """
+        if self._worker is None:
+            self._worker = ChromaWorkerClient(self.persist_directory, self.collection_name)
+            self._worker.start()
+        return self._worker
+
+    def close(self):
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+        if self._worker is not None:
+            self._worker.close()
+            self._worker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-    def compute_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def compute_embeddings(self, texts: List[str]) -> np.ndarray:
         """
         Computes embeddings for a list of texts using the initialized BERT model.
+        Texts already in the embedding cache are served from disk; only the misses
+        go through the model.
         """
-        # print(f"DEBUG: Computing embeddings for batch of size {len(texts)}")
+        if self.embedding_cache is None:
+            return self._encode(texts)
+        
+        embeddings, found = self.embedding_cache.get_many(texts)
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            missing_texts = [texts[i] for i in missing]
+            computed = self._encode(missing_texts)
+            embeddings[missing] = computed
+            self.embedding_cache.put_many(missing_texts, computed)
+        return embeddings
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Runs the BERT forward pass with mean pooling.
+        Texts are tokenized once up front, grouped into length-sorted batches under a
+        token budget (see embedding_batcher.plan_batches) and scattered back into
+        their original order.
+        """
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        if not texts:
+            return embeddings
+        
         try:
-            inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt", max_length=512)
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            
-            # Mean pooling
-            # attention_mask shape: (batch_size, seq_len)
-            # last_hidden_state shape: (batch_size, seq_len, hidden_size)
+            encodings = self.tokenizer(texts, truncation=True, max_length=512)
+            lengths = [len(ids) for ids in encodings['input_ids']]
+            batches = plan_batches(lengths, token_budget=self.embedding_token_budget, max_batch_size=self.embedding_max_batch_size)
             
-            attention_mask = inputs['attention_mask']
-            token_embeddings = outputs.last_hidden_state
+            for batch_number, batch in enumerate(batches):
+                if len(batches) > 1:
+                    print(f"    Processing batch {batch_number + 1}/{len(batches)} "
+                          f"({len(batch)} texts, {max(lengths[i] for i in batch)} tokens)...", flush=True)
+                features = {key: [values[i] for i in batch] for key, values in encodings.items()}
+                inputs = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+                embeddings[batch] = self._forward(inputs)
             
-            input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-            
-            sum_embeddings = torch.sum(token_embeddings * input_mask_expanded, 1)
-            sum_mask = torch.clamp(input_mask_expanded.sum(1), min=1e-9)
-            
-            embeddings = sum_embeddings / sum_mask
-            return embeddings.tolist()
+            return embeddings
         except Exception as e:
             print(f"CRITICAL ERROR in compute_embeddings: {e}")
             raise e
 
-    def add_documents(self, chunks: List[Dict[str, Any]]):
+    def _forward(self, inputs, model=None) -> np.ndarray:
         """
-        Adds processed chunks to ChromaDB via a subprocess worker.
+        One padded batch through the model (self.model by default), mean pooled over the attention mask.
+        """
+        if model is None and self._onnx is not None:
+            return self._onnx(inputs['input_ids'].numpy(), inputs['attention_mask'].numpy())
+        
+        with torch.no_grad():
+            outputs = (model or self.model)(**inputs)
+        
+        # Mean pooling
+        # attention_mask shape: (batch_size, seq_len)
+        # last_hidden_state shape: (batch_size, seq_len, hidden_size)
+        
+        attention_mask = inputs['attention_mask']
+        token_embeddings = outputs.last_hidden_state
+        
+        input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
+        
+        sum_embeddings = torch.sum(token_embeddings * input_mask_expanded, 1)
+        sum_mask = torch.clamp(input_mask_expanded.sum(1), min=1e-9)
+        
+        embeddings = sum_embeddings / sum_mask
+        # float32 matrix, sent to the worker as a raw buffer (no float -> text conversion)
+        return embeddings.numpy().astype(np.float32, copy=False)
+
+    def add_documents(self, chunks: List[Dict[str, Any]]) -> List[str]:
+        """
+        Upserts processed chunks into ChromaDB via the worker process.
         chunks: List of dicts containing 'text' and 'metadata'
+        Returns the (deterministic) chunk IDs that were written.
         """
         if not chunks:
-            return
+            return []
 
         texts = [chunk['text'] for chunk in chunks]
         metadatas = [chunk['metadata'] for chunk in chunks]
-        ids = [str(uuid.uuid4()) for _ in chunks]
-        
-        # Compute embeddings in batches to avoid OOM
-        batch_size = 16
-        embeddings = []
+        ids = self.make_ids(chunks)
         
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i+batch_size]
-            print(f"    Processing batch {i} to {i+batch_size}...", flush=True)
-            batch_embeddings = self.compute_embeddings(batch_texts)
-            embeddings.extend(batch_embeddings)
-            
-        print(f"    All batches computed. Delegating insertion of {len(texts)} docs to worker process...", flush=True)
-        
-        # Prepare payload for worker
-        payload = {
-            "persist_directory": self.persist_directory,
-            "collection_name": self.collection_name,
-            "documents": texts,
-            "embeddings": embeddings,
-            "metadatas": metadatas,
-            "ids": ids
-        }
-        
-        # Serialize to JSON
-        try:
-            json_payload = json.dumps(payload)
-        except TypeError as e:
-            print(f"Serialization Error: {e}")
-            return
+        embeddings = self.embed_texts(texts)
+        self.write_documents(texts, embeddings, metadatas, ids)
+        return ids
+
+    def make_ids(self, chunks: List[Dict[str, Any]]) -> List[str]:
+        # Derived from source_file, article_number, chunk_index and the text hash,
+        # so re-ingesting an unchanged chunk overwrites it instead of duplicating it.
+        return [make_chunk_id(chunk['metadata'], chunk['text']) for chunk in chunks]
 
-        # Run worker script
-        worker_script = os.path.join("src", "chroma_worker.py")
-        python_exe = sys.executable # Use same python interpreter
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Computes embeddings for all texts; batching (token budget, length
+        bucketing) happens inside compute_embeddings.
+        """
+        embeddings = self.compute_embeddings(texts)
+        print("    All batches computed.", flush=True)
+        return embeddings
+
+    def write_documents(self, texts: List[str], embeddings, metadatas: List[Dict[str, Any]], ids: List[str]):
+        """
+        Writes already embedded documents to ChromaDB via the persistent worker process.
+        embeddings: float32 matrix (or sequence of vectors), sent as a raw buffer.
+        """
+        # Identical chunks (same article, index and text) map to the same ID; Chroma rejects
+        # duplicate IDs within one call, so keep the first occurrence only.
+        unique_positions = list({chunk_id: i for i, chunk_id in reversed(list(enumerate(ids)))}.values())
+        if len(unique_positions) < len(ids):
+            unique_positions.sort()
+            print(f"    Skipping {len(ids) - len(unique_positions)} duplicate chunks.", flush=True)
+            texts = [texts[i] for i in unique_positions]
+            metadatas = [metadatas[i] for i in unique_positions]
+            ids = [ids[i] for i in unique_positions]
+            embeddings = np.asarray(embeddings, dtype=np.float32)[unique_positions]
         
+        print(f"    Delegating upsert of {len(texts)} docs to worker process...", flush=True)
         try:
-            process = subprocess.run(
-                [python_exe, worker_script],
-                input=json_payload,
-                text=True,
-                capture_output=True
-            )
-            
-            if process.returncode != 0:
-                print(f"Worker process failed with code {process.returncode}", flush=True)
-                print(f"Worker Stderr: {process.stderr}", flush=True)
-                print(f"Worker Stdout: {process.stdout}", flush=True)
-                raise RuntimeError("ChromaDB worker process failed.")
-            else:
-                print(f"Worker Output: {process.stdout.strip()}", flush=True)
-                
+            written = self.worker.upsert(ids, embeddings, texts, metadatas)
+            print(f"    Worker upserted {written} documents.", flush=True)
         except Exception as e:
             print(f"Error invoking worker process: {e}", flush=True)
             raise e
 
-    def query(self, query_text: str, n_results: int = 3) -> List[Dict[str, Any]]:
+    def delete_documents(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> int:
         """
-        Queries the database for relevant documents.
-        Since we cannot import chromadb here, we might need to delegate query to worker too,
-        OR verify if read-only access crashes.
-        For now, let's delegate query to worker as well to be safe.
+        Deletes chunks by ID and/or metadata filter, e.g. where={"source_file": "1.5.6446.pdf"}.
         """
-        # For simplicity, query logic is not implemented in worker yet. 
-        # The prompt asks for ingest mostly. 
-        # If query is needed, we need to add "mode": "query" to worker payload.
-        # But for now, let's just return empty or implement basic worker query support if needed.
-        print("Querying not yet refactored for subprocess worker.")
-        return []
+        if not ids and not where:
+            return 0
+        deleted = self.worker.delete(ids=ids, where=where)
+        print(f"    Worker deleted {deleted} documents.", flush=True)
+        return deleted
+
+    def query(self, query_text: str, n_results: int = 3, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the n_results closest chunks for one query, see query_batch.
+        """
+        return self.query_batch([query_text], n_results=n_results, where=where)[0]
+
+    def query_batch(self, query_texts: List[str], n_results: int = 3, where: Optional[Dict[str, Any]] = None,
+                    batch_size: int = 1024) -> List[List[Dict[str, Any]]]:
+        """
+        Embeds all queries in one compute_embeddings call and searches them in batched
+        worker requests (batch_size queries per frame).
+        Returns one list per query of {"id", "text", "metadata", "distance"} dicts, closest first.
+        """
+        if not query_texts:
+            return []
+        embeddings = self.compute_embeddings(query_texts)
+        
+        results: List[List[Dict[str, Any]]] = []
+        for start in range(0, len(query_texts), batch_size):
+            response = self.worker.query(embeddings[start:start + batch_size], n_results=n_results, where=where)
+            for ids, documents, metadatas, distances in zip(response["ids"], response["documents"],
+                                                            response["metadatas"], response["distances"]):
+                results.append([
+                    {"id": chunk_id, "text": text, "metadata": metadata or {}, "distance": distance}
+                    for chunk_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+                ])
+        return results
@@ -0,0 +1,45 @@
+"""
+Wall-clock timing of the startup phases (imports, model load, warmup, ...).
+
+Phases are recorded in the process-wide STARTUP_PHASES and reported by the API's
+/ready endpoint, so a slow cold start shows which step to look at.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+class StartupPhases:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: List[Dict[str, object]] = []
+        self.started_at = time.time()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        error: Optional[str] = None
+        try:
+            yield
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._phases.append({"phase": name, "seconds": round(seconds, 3), "error": error})
+            status = "[HATA]" if error else "[INFO]"
+            print(f"{status} Baslangic asamasi '{name}': {seconds:.2f}s")
+
+    def report(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return list(self._phases)
+
+    @property
+    def total_seconds(self) -> float:
+        with self._lock:
+            return round(sum(phase["seconds"] for phase in self._phases), 3)
+
+
+STARTUP_PHASES = StartupPhases()
@@ -0,0 +1,77 @@
+"""
+Async helpers for the SSE streaming path.
+
+Blocking work (model loading, tokenization, reading TextIteratorStreamer) runs in a
+worker thread. Tokens cross to the event loop through an asyncio.Queue and are
+coalesced into frames by a size / time flush policy, so the loop never blocks and
+the frame rate is not tied to the decode rate.
+"""
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Iterable, Optional
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def stream_in_thread(iterable: Iterable[str], flush_chars: int = 32,
+                           flush_interval: float = 0.05) -> AsyncIterator[str]:
+    """
+    Iterates a blocking iterable in a daemon thread and yields coalesced text.
+
+    A frame is flushed when the buffer reaches flush_chars characters, when the
+    oldest buffered token is flush_interval seconds old, or at the end of the stream.
+    Exceptions raised by the iterable are re-raised here.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue" = asyncio.Queue()
+
+    def pump():
+        try:
+            for item in iterable:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, _Failure(e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    threading.Thread(target=pump, name="stream-pump", daemon=True).start()
+
+    buffer = []
+    buffered_chars = 0
+    first_buffered_at: Optional[float] = None
+
+    while True:
+        timeout = None
+        if first_buffered_at is not None:
+            timeout = max(0.0, flush_interval - (time.monotonic() - first_buffered_at))
+
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout) if timeout is not None else await queue.get()
+        except asyncio.TimeoutError:
+            item = None  # time based flush
+
+        if item is _DONE or isinstance(item, _Failure):
+            if buffer:
+                yield "".join(buffer)
+            if isinstance(item, _Failure):
+                raise item.error
+            return
+
+        if item is not None:
+            if not item:
+                continue
+            buffer.append(item)
+            buffered_chars += len(item)
+            if first_buffered_at is None:
+                first_buffered_at = time.monotonic()
+
+        expired = first_buffered_at is not None and time.monotonic() - first_buffered_at >= flush_interval
+        if buffer and (buffered_chars >= flush_chars or expired):
+            yield "".join(buffer)
+            buffer, buffered_chars, first_buffered_at = [], 0, None
@@ -0,0 +1,242 @@
+"""
+Per-stage timing of the chat path, exported in the Prometheus text format, and the
+leveled structured request log.
+
+Spans and observations go into fixed-bucket histograms in the process-wide TELEMETRY
+(lock + bisect per observation, no allocation), served by the API's /metrics:
+
+  rag_stage_duration_seconds{stage=...}   admission_wait, query_embedding, vector_search,
+                                          context_build, prompt_tokenization, prefill, sse_flush
+  rag_time_to_first_token_seconds{source=...}
+                                          request received -> first token frame sent
+  rag_decode_tokens_per_second            per request, tokens after the first one
+  rag_chat_requests_total{source=...}     generated / answer_cache
+  rag_generated_tokens_total
+  rag_generation_active / rag_generation_queue_depth
+                                          requests holding / waiting for a generation slot
+  rag_admission_rejected_total{reason=...}
+                                          queue_full (429) / queue_timeout (503)
+  rag_cancelled_requests_total{stage=...} client gone while queued / generating
+  rag_cancelled_tokens_total              tokens generated for those requests before the stop
+
+Request logs are one JSON object per line on the "rag" logger (LOG_LEVEL, default
+INFO). Dumps of chunk contents and of the prompt are DEBUG events and, even at DEBUG,
+written only for a LOG_SAMPLE_RATE fraction of the requests (see sample_request).
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0, 75.0, 100.0, 200.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[_Labels, List] = {}  # labels -> [bucket counts (+Inf last), sum]
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self) -> Dict[_Labels, Tuple[List[int], float]]:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[_Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value!r}" for key, value in values)
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[_Labels, float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value!r}" for key, value in values)
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}"
+
+
+class Telemetry:
+    def __init__(self):
+        self.stage_seconds = Histogram("rag_stage_duration_seconds", "Duration of one chat pipeline stage.")
+        self.time_to_first_token = Histogram("rag_time_to_first_token_seconds",
+                                             "Request received to first token frame sent.")
+        self.decode_rate = Histogram("rag_decode_tokens_per_second", "Decode throughput of one request.",
+                                     RATE_BUCKETS)
+        self.chat_requests = Counter("rag_chat_requests_total", "Answered chat requests by answer source.")
+        self.generated_tokens = Counter("rag_generated_tokens_total", "Tokens generated for chat requests.")
+        self.generation_active = Gauge("rag_generation_active", "Chat requests holding a generation slot.")
+        self.generation_queue_depth = Gauge("rag_generation_queue_depth", "Chat requests waiting for a generation slot.")
+        self.admission_rejected = Counter("rag_admission_rejected_total", "Chat requests rejected by admission control.")
+        self.cancelled_requests = Counter("rag_cancelled_requests_total",
+                                          "Chat requests whose client disconnected, by stage.")
+        self.cancelled_tokens = Counter("rag_cancelled_tokens_total",
+                                        "Tokens generated for requests whose client disconnected.")
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Times the block into rag_stage_duration_seconds{stage=...} (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+    def generation(self) -> "GenerationTimer":
+        return GenerationTimer(self)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.time_to_first_token, self.decode_rate, self.chat_requests,
+                       self.generated_tokens, self.generation_active, self.generation_queue_depth,
+                       self.admission_rejected, self.cancelled_requests, self.cancelled_tokens):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class GenerationTimer:
+    """
+    Prefill (generation start -> first new token) and decode rate of one request.
+    add_tokens is called by whichever thread produces the tokens, finish once at the end.
+    """
+
+    def __init__(self, telemetry: Telemetry):
+        self.telemetry = telemetry
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def add_tokens(self, count: int = 1):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            self.telemetry.stage_seconds.observe(now - self.started_at, stage="prefill")
+        self.last_token_at = now
+        self.tokens += count
+
+    def finish(self, tokens: Optional[int] = None):
+        if tokens is not None:
+            self.tokens = tokens
+        self.telemetry.generated_tokens.inc(self.tokens)
+        if self.first_token_at is not None and self.tokens > 1 and self.last_token_at > self.first_token_at:
+            self.telemetry.decode_rate.observe((self.tokens - 1) / (self.last_token_at - self.first_token_at))
+
+
+TELEMETRY = Telemetry()
+
+
+# --- structured logging ---
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Child of the "rag" logger, which writes JSON lines to stdout at LOG_LEVEL."""
+    root = logging.getLogger("rag")
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root.getChild(name)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields):
+    # Level check first: a disabled event costs no formatting
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def sample_request(logger: logging.Logger) -> bool:
+    """True when this request's DEBUG dumps should be written (DEBUG enabled and sampled)."""
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE
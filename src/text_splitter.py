@@ -1,31 +1,111 @@
+"""
+Splits extracted legislation text into article chunks of at most max_tokens
+encoder tokens, with ~overlap tokens shared between neighbouring chunks.
+
+The default "offsets" engine tokenizes each article buffer once, with the offset
+mapping of a fast tokenizer, and picks every cut by token index: within the window
+of max_tokens tokens it takes the latest boundary of the best level of the
+separator hierarchy (sentence end, ";", ",", word, token), ignoring boundaries in
+the first half of the window so a chunk is never cut short. The next chunk starts
+overlap tokens before the cut, moved forward to a word start. Chunks are slices of
+the article text, so the overlap repeats verbatim (see context_builder.merge_overlapping).
+
+The "recursive" engine is LangChain's RecursiveCharacterTextSplitter with the
+tokenizer as length function, which re-tokenizes every candidate piece at every
+separator level; it is kept for comparison (benchmarks/bench_splitter.py).
+"""
 import re
-from typing import List, Dict, Any
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from typing import List, Dict, Any, Iterable, Iterator, Sequence, Tuple
 from transformers import AutoTokenizer
 
+# Boundary levels before a token, best first (the separator hierarchy)
+SENTENCE, SEMICOLON, COMMA, WORD, TOKEN = range(5)
+
+
+def boundary_levels(text: str, offsets: Sequence[Tuple[int, int]]) -> List[int]:
+    """Level of the boundary in front of every token (index 0 has none and is TOKEN)."""
+    levels = [TOKEN] * len(offsets)
+    for i in range(1, len(offsets)):
+        previous_end = offsets[i - 1][1]
+        last = text[previous_end - 1] if previous_end > 0 else ""
+        space = offsets[i][0] > previous_end
+        if space and last in ".?!":
+            levels[i] = SENTENCE
+        elif last == ";":
+            levels[i] = SEMICOLON
+        elif last == ",":
+            levels[i] = COMMA
+        elif space:
+            levels[i] = WORD
+    return levels
+
+
+def plan_chunks(levels: Sequence[int], max_tokens: int, overlap: int) -> List[Tuple[int, int]]:
+    """[start, end) token spans of the chunks, see the module docstring."""
+    count = len(levels)
+    spans = []
+    start = 0
+    min_tokens = max(overlap + 1, max_tokens // 2)
+    while count - start > max_tokens:
+        limit = start + max_tokens
+        cut, best = limit, TOKEN + 1
+        # Walking backwards, the first boundary seen of a level is its latest one
+        for index in range(limit, start + min_tokens - 1, -1):
+            if levels[index] < best:
+                cut, best = index, levels[index]
+                if best == SENTENCE:
+                    break
+        spans.append((start, cut))
+
+        next_start = cut
+        for index in range(max(cut - overlap, start + 1), cut):
+            if levels[index] <= WORD:
+                next_start = index
+                break
+        start = next_start
+    if count > start:
+        spans.append((start, count))
+    return spans
+
+
 class TextSplitter:
-    def __init__(self, model_name: str = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr", max_tokens: int = 500, overlap: int = 50):
+    def __init__(self, model_name: str = "emrecan/bert-base-turkish-cased-mean-nli-stsb-tr", max_tokens: int = 500, overlap: int = 50,
+                 engine: str = "offsets"):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.max_tokens = max_tokens
         self.overlap = overlap
-        
-        # LangChain'in splitter'ını BERT tokenizer uzunluğuna göre yapılandırıyoruz
-        self.splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
-            tokenizer=self.tokenizer,
-            chunk_size=self.max_tokens,
-            chunk_overlap=self.overlap,
-            separators=["\n\n", "\n", ". ", "? ", "! ", ";", ",", " ", ""], # Öncelik sırası
-            strip_whitespace=True
-        )
+        self.engine = engine
+
+        if engine == "offsets":
+            # Offset mapping sadece hızlı (Rust) tokenizer'larda var
+            if not self.tokenizer.is_fast:
+                raise ValueError(f"engine='offsets' needs a fast tokenizer, {model_name} has none")
+        elif engine == "recursive":
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            # LangChain'in splitter'ını BERT tokenizer uzunluğuna göre yapılandırıyoruz
+            self.splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+                tokenizer=self.tokenizer,
+                chunk_size=self.max_tokens,
+                chunk_overlap=self.overlap,
+                separators=["\n\n", "\n", ". ", "? ", "! ", ";", ",", " ", ""], # Öncelik sırası
+                strip_whitespace=True
+            )
+        else:
+            raise ValueError(f"Unknown splitter engine: {engine}")
 
     def split_text(self, text: str, source_metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
-        Splits text into chunks based on Articles (Madde) and token limits using LangChain.
+        Splits text into chunks based on Articles (Madde) and token limits.
+        """
+        return list(self.iter_chunks([text], source_metadata))
+
+    def iter_chunks(self, pages: Iterable[str], source_metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Same chunks as split_text("\n".join(pages)), yielded article by article while the
+        pages (e.g. PDFExtractor.iter_pages()) are consumed.
         """
         # Normalize newlines
-        text = text.replace('\r\n', '\n')
-        
-        lines = text.split('\n')
+        lines = (line for page in pages for line in page.replace('\r\n', '\n').split('\n'))
         
         chunks = []
         current_section = "Genel"
@@ -55,6 +135,8 @@ class TextSplitter:
                 if current_buffer:
                     self._flush_buffer(chunks, current_buffer, current_article, current_section, source_metadata)
                     current_buffer = []
+                    yield from chunks
+                    chunks = []
                 
                 # Start new
                 current_article = article_match.group(1).upper()
@@ -67,14 +149,28 @@ class TextSplitter:
         # Flush remaining
         if current_buffer:
             self._flush_buffer(chunks, current_buffer, current_article, current_section, source_metadata)
-            
-        return chunks
+            yield from chunks
+
+    def split_article(self, text: str) -> List[str]:
+        """Chunk texts of one article buffer (without the article prefix)."""
+        if self.engine == "recursive":
+            return self.splitter.split_text(text)
+
+        # Tek tokenizasyon; uzun maddelerde modelin max_length uyarısı anlamsız (kesim burada yapılıyor)
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                 verbose=False)["offset_mapping"]
+        if len(offsets) <= self.max_tokens:
+            text = text.strip()
+            return [text] if text else []
+
+        spans = plan_chunks(boundary_levels(text, offsets), self.max_tokens, self.overlap)
+        return [text[offsets[start][0]:offsets[end - 1][1]].strip() for start, end in spans]
 
     def _flush_buffer(self, chunks: List[Dict[str, Any]], buffer: List[str], article: str, section: str, metadata: Dict[str, Any]):
         full_text = " ".join(buffer)
         
-        # LangChain ile akıllı bölme
-        text_chunks = self.splitter.split_text(full_text)
+        # Token sınırına göre bölme (cümle sonu, ";", "," önceliğiyle)
+        text_chunks = self.split_article(full_text)
         
         for i, chunk_text in enumerate(text_chunks):
             chunk_metadata = metadata.copy()
@@ -0,0 +1,104 @@
+"""
+Compressed first-stage indexes for two-stage retrieval in NumpyVectorStore.
+
+The first stage scans a small in-memory copy of the corpus to pick a wide candidate
+set; the final k are then rescored with exact cosine on the full float32 rows (read
+from the memory-mapped matrix, so only candidate rows are touched).
+
+Modes (all fitted on the row-normalized vectors when the store is written):
+  int8      per-dimension symmetric scalar quantization, 1 byte per dim (4x smaller)
+  pca       PCA-reduced float32 vectors (768 -> pca_dim)
+  pca-int8  PCA-reduced vectors, int8 quantized
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+MODES = ("int8", "pca", "pca-int8")
+DEFAULT_PCA_DIM = 128
+# Rows converted from int8 to float32 per matmul, bounds the temporary buffer
+SCAN_BLOCK_ROWS = 8192
+PCA_FIT_SAMPLE = 20000
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    scale = np.abs(vectors).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def _fit_pca(vectors: np.ndarray, dim: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    sample = vectors
+    if len(vectors) > PCA_FIT_SAMPLE:
+        sample = vectors[np.random.default_rng(seed).choice(len(vectors), PCA_FIT_SAMPLE, replace=False)]
+    mean = sample.mean(axis=0)
+    _, _, components = np.linalg.svd(sample - mean, full_matrices=False)
+    return mean.astype(np.float32), components[:dim].astype(np.float32)
+
+
+class FirstStageIndex:
+    def __init__(self, mode: str, arrays: Dict[str, np.ndarray]):
+        if mode not in MODES:
+            raise ValueError(f"Unknown first stage mode: {mode} (expected one of {MODES})")
+        self.mode = mode
+        self.arrays = arrays
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, mode: str, pca_dim: int = DEFAULT_PCA_DIM) -> "FirstStageIndex":
+        """vectors: row-normalized float32 (N, dim)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if mode == "int8":
+            codes, scale = _quantize(vectors)
+            return cls(mode, {"codes": codes, "scale": scale})
+
+        mean, components = _fit_pca(vectors, min(pca_dim, vectors.shape[1], max(len(vectors), 1)))
+        reduced = (vectors - mean) @ components.T
+        if mode == "pca":
+            return cls(mode, {"mean": mean, "components": components, "codes": reduced.astype(np.float32)})
+        codes, scale = _quantize(reduced)
+        return cls(mode, {"mean": mean, "components": components, "codes": codes, "scale": scale})
+
+    def __len__(self) -> int:
+        return len(self.arrays["codes"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate cosine scores (n_queries, N) for row-normalized queries."""
+        codes = self.arrays["codes"]
+        if self.mode == "int8":
+            projected, offset = queries, 0.0
+        else:
+            # x ~ mean + components.T @ z, so q.x ~ q.mean + (components @ q).z
+            projected = queries @ self.arrays["components"].T
+            offset = (queries @ self.arrays["mean"])[:, None]
+        if "scale" in self.arrays:
+            projected = projected * self.arrays["scale"]
+
+        if codes.dtype == np.float32:
+            return projected @ codes.T + offset
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = projected @ block.T
+        return scores + offset
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, mode=np.asarray(self.mode), **self.arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FirstStageIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data["mode"]), {name: data[name] for name in data.files if name != "mode"})
+
+
+def load_first_stage(path: Optional[str]) -> Optional[FirstStageIndex]:
+    if not path or not os.path.exists(path):
+        return None
+    return FirstStageIndex.load(path)
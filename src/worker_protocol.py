@@ -0,0 +1,183 @@
+"""
+Length-prefixed binary protocol between RAGPipeline and the persistent chroma_worker process.
+
+Frame layout (little endian):
+    uint32 header_length | uint32 body_length | header (UTF-8 JSON) | body (raw bytes)
+
+The header carries the operation and small fields (ids, documents, metadatas, where...).
+Embeddings never go through JSON: they travel in the body as a contiguous float32
+buffer of shape (header["count"], header["dim"]).
+
+This module must stay free of torch and chromadb imports: it is loaded on both sides
+of the DLL-conflict workaround.
+"""
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_FRAME_HEADER = struct.Struct("<II")
+
+
+def write_frame(stream: BinaryIO, header: Dict[str, Any], body: bytes = b""):
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    stream.write(_FRAME_HEADER.pack(len(header_bytes), len(body)))
+    stream.write(header_bytes)
+    if body:
+        stream.write(body)
+    stream.flush()
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        part = stream.read(size - len(data))
+        if not part:
+            raise EOFError(f"Stream closed after {len(data)} of {size} bytes")
+        data.extend(part)
+    return bytes(data)
+
+
+def read_frame(stream: BinaryIO) -> Optional[Tuple[Dict[str, Any], bytes]]:
+    """Reads one frame. Returns None on a clean EOF between frames."""
+    prefix = stream.read(_FRAME_HEADER.size)
+    if not prefix:
+        return None
+    if len(prefix) < _FRAME_HEADER.size:
+        prefix += _read_exact(stream, _FRAME_HEADER.size - len(prefix))
+
+    header_length, body_length = _FRAME_HEADER.unpack(prefix)
+    header = json.loads(_read_exact(stream, header_length).decode("utf-8"))
+    body = _read_exact(stream, body_length) if body_length else b""
+    return header, body
+
+
+def encode_embeddings(embeddings) -> Tuple[bytes, int, int]:
+    """Returns (raw float32 bytes, count, dim)."""
+    array = np.ascontiguousarray(np.asarray(embeddings, dtype="<f4"))
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    if array.size == 0:
+        return b"", 0, 0
+    return array.tobytes(), array.shape[0], array.shape[1]
+
+
+def decode_embeddings(body: bytes, count: int, dim: int) -> np.ndarray:
+    if not count:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.frombuffer(body, dtype="<f4").reshape(count, dim)
+
+
+class ChromaWorkerClient:
+    """
+    Talks to a single long-lived src/chroma_worker.py process.
+
+    The worker imports chromadb and opens the PersistentClient once; every
+    operation afterwards is one request frame and one response frame.
+    """
+    def __init__(self, persist_directory: str, collection_name: str):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_worker.py")
+        self._process = subprocess.Popen(
+            [sys.executable, worker_script, self.persist_directory, self.collection_name],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,  # worker logs go straight to our stderr
+            bufsize=0,
+        )
+
+    def request(self, header: Dict[str, Any], body: bytes = b"") -> Tuple[Dict[str, Any], bytes]:
+        with self._lock:
+            self.start()
+            try:
+                write_frame(self._process.stdin, header, body)
+                response = read_frame(self._process.stdout)
+            except (BrokenPipeError, EOFError) as e:
+                response = None
+                error = e
+            else:
+                error = "no response"
+
+            if response is None:
+                try:
+                    returncode = self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                    returncode = None
+                self._process = None
+                raise RuntimeError(f"ChromaDB worker process exited unexpectedly (code {returncode}): {error}")
+
+        response_header, response_body = response
+        if response_header.get("status") != "ok":
+            raise RuntimeError(f"ChromaDB worker error: {response_header.get('error')}")
+        return response_header, response_body
+
+    # --- Operations ---
+    def _write(self, op: str, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        body, count, dim = encode_embeddings(embeddings)
+        header = {"op": op, "ids": ids, "documents": documents, "metadatas": metadatas,
+                  "count": count, "dim": dim}
+        response, _ = self.request(header, body)
+        return response["written"]
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        return self._write("add", ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        return self._write("upsert", ids, embeddings, documents, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> int:
+        response, _ = self.request({"op": "delete", "ids": ids, "where": where})
+        return response["deleted"]
+
+    def query(self, embeddings, n_results: int = 3, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        body, count, dim = encode_embeddings(embeddings)
+        header = {"op": "query", "count": count, "dim": dim, "n_results": n_results, "where": where}
+        response, _ = self.request(header, body)
+        return response["result"]
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        response, body = self.request({"op": "get", "ids": ids, "where": where, "include": list(include)})
+        result = response["result"]
+        if "embeddings" in include:
+            result["embeddings"] = decode_embeddings(body, response["count"], response["dim"])
+        return result
+
+    def count(self) -> int:
+        response, _ = self.request({"op": "count"})
+        return response["count"]
+
+    def close(self):
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                if self._process.poll() is None:
+                    write_frame(self._process.stdin, {"op": "close"})
+                    read_frame(self._process.stdout)
+                    self._process.stdin.close()
+                    self._process.wait(timeout=30)
+            except (BrokenPipeError, EOFError, OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+            finally:
+                self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from src.admission import AdmissionController, AdmissionRejected
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queue=1, timeout=5.0)
+        first = await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status_code == 429
+        first.release()
+        (await waiting).release()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert (controller.active, controller.queue_depth) == (0, 0)
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queue=4, timeout=0.01)
+        slot = await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status_code == 503
+        assert controller.queue_depth == 0
+        slot.release()
+        return controller
+
+    assert asyncio.run(scenario()).active == 0
+
+
+def test_released_slot_goes_to_the_oldest_waiter():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queue=2, timeout=5.0)
+        slot = await controller.acquire()
+        order = []
+
+        async def wait(name):
+            admitted = await controller.acquire()
+            order.append(name)
+            return admitted
+
+        waiters = [asyncio.create_task(wait("first")), asyncio.create_task(wait("second"))]
+        await asyncio.sleep(0)
+        slot.release()
+        (await waiters[0]).release()
+        (await waiters[1]).release()
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert controller.active == 0
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        controller = AdmissionController(max_active=2, max_queue=0, timeout=1.0)
+        slot = await controller.acquire()
+        slot.release()
+        slot.release()
+        return controller
+
+    assert asyncio.run(scenario()).active == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queue=1, timeout=5.0)
+        slot = await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert controller.queue_depth == 0
+        slot.release()
+        return controller
+
+    assert asyncio.run(scenario()).active == 0
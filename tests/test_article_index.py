@@ -0,0 +1,50 @@
+import pytest
+
+from src.article_index import ArticleIndex, ArticleReference, parse_article_reference
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("6446 sayılı Kanunun 14. maddesi ne der?", ArticleReference("madde 14", "6446")),
+    ("MADDE 14 nedir, 5686 sayılı", ArticleReference("madde 14", "5686")),
+    ("14 üncü maddesi", ArticleReference("madde 14")),
+    ("14'üncü madde", ArticleReference("madde 14")),
+    ("Geçici Madde 3 neyi düzenler?", ArticleReference("geçici madde 3")),
+    ("ek 2 nci madde", ArticleReference("ek madde 2")),
+    ("Madde 6/A kapsamı", ArticleReference("madde 6/a")),
+    ("Kanun no: 6446, madde 5", ArticleReference("madde 5", "6446")),
+])
+def test_single_article_reference(query, expected):
+    assert parse_article_reference(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    # Counts or plain numbers next to "madde", not an ordinal reference
+    "3 maddede belirtilen şartlar nelerdir?",
+    "Kurul 5 madde yayımladı mı?",
+    "Elektrik Piyasası Kanunu 14 madde",
+    # More than one article: left to normal retrieval
+    "Yönetmeliğin 9. ve 10. maddeleri",
+    "6446 sayılı Kanunun 4, 5 ve 6. maddeleri",
+    "madde 9 ve 10",
+    "Madde 3 ile madde 5 arasındaki fark nedir?",
+    # No article at all
+    "Lisans nedir?",
+])
+def test_no_single_article_reference(query):
+    assert parse_article_reference(query) is None
+
+
+def test_resolve_requires_a_unique_law_without_a_law_number():
+    index = ArticleIndex.build(
+        ["a0", "a1", "b0", "c0"],
+        [
+            {"source_file": "1.5.6446.pdf", "article_number": "MADDE 14", "section": "Genel", "chunk_index": 0},
+            {"source_file": "1.5.6446.pdf", "article_number": "MADDE 14", "section": "Genel", "chunk_index": 1},
+            {"source_file": "1.5.5686.pdf", "article_number": "MADDE 14", "section": "Genel", "chunk_index": 0},
+            {"source_file": "1.5.5686.pdf", "article_number": "GEÇİCİ MADDE 3", "section": "Genel", "chunk_index": 0},
+        ],
+    )
+    assert index.resolve("6446 sayılı Kanunun 14. maddesi") == ["a0", "a1"]
+    assert index.resolve("14. madde nedir?") is None
+    assert index.resolve("geçici madde 3") == ["c0"]
+    assert index.resolve("Yönetmeliğin 9. ve 14. maddeleri") is None
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from benchmarks.stub_models import make_stub_causal_lm
+from src.generation_scheduler import GenerationScheduler
+
+PROMPTS = [
+    "Elektrik piyasasında lisans alma yükümlülüğünden muaf faaliyetler nelerdir?",
+    "Arama ruhsatı süresi kaç yıldır?",
+    "EPDK hangi durumlarda idari para cezası uygular?",
+]
+NEW_TOKENS = 12
+
+
+@pytest.fixture(scope="module")
+def stub():
+    return make_stub_causal_lm(hidden_size=64, layers=2)
+
+
+@pytest.fixture
+def scheduler(stub):
+    model, tokenizer = stub
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=len(PROMPTS))
+    yield scheduler
+    scheduler.shutdown()
+
+
+def greedy(model, tokenizer, prompt):
+    input_ids = torch.tensor([tokenizer.encode(prompt)])
+    with torch.no_grad():
+        output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=NEW_TOKENS,
+                                do_sample=False)
+    return tokenizer.decode(output[0, input_ids.shape[1]:])
+
+
+def test_concurrent_greedy_outputs_match_generate(stub, scheduler):
+    model, tokenizer = stub
+    requests = [scheduler.submit(tokenizer.encode(prompt), max_new_tokens=NEW_TOKENS, do_sample=False,
+                                 repetition_penalty=1.0) for prompt in PROMPTS]
+    outputs = [None] * len(requests)
+
+    def consume(i, request):
+        outputs[i] = "".join(request)
+
+    consumers = [threading.Thread(target=consume, args=(i, r)) for i, r in enumerate(requests)]
+    for consumer in consumers:
+        consumer.start()
+    for consumer in consumers:
+        consumer.join()
+
+    assert outputs == [greedy(model, tokenizer, prompt) for prompt in PROMPTS]
+    assert all(len(request.generated_ids) == NEW_TOKENS for request in requests)
+
+
+def test_cancelled_request_stops_early(stub, scheduler):
+    _, tokenizer = stub
+    request = scheduler.submit(tokenizer.encode(PROMPTS[0]), max_new_tokens=10_000, do_sample=False)
+    for _ in request:
+        request.cancel()
+    assert len(request.generated_ids) < 10_000
+
+
+def test_request_over_the_token_budget_is_rejected(stub):
+    model, tokenizer = stub
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_tokens=16)
+    try:
+        with pytest.raises(ValueError):
+            scheduler.submit(tokenizer.encode(PROMPTS[0]), max_new_tokens=8)
+    finally:
+        scheduler.shutdown()
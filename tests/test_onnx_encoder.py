@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnxscript")
+
+from transformers import AutoModel, AutoTokenizer
+
+from benchmarks.stub_models import write_stub_encoder
+from src.cpu_profile import PROBE_TEXTS, embedding_cosine
+from src.onnx_encoder import (ENCODER_MAX_LENGTH, MIN_PARITY_COSINE, OnnxEmbeddings, OnnxEncoder, export_encoder,
+                              find_encoder)
+
+TEXTS = PROBE_TEXTS + [
+    "Lisans nedir?",
+    "Bu Kanunun amacı; elektriğin yeterli, kaliteli, sürekli, düşük maliyetli ve çevreyle uyumlu bir şekilde "
+    "tüketicilerin kullanımına sunulması için rekabet ortamında özel hukuk hükümlerine göre faaliyet gösteren, "
+    "mali açıdan güçlü, istikrarlı ve şeffaf bir elektrik enerjisi piyasasının oluşturulmasıdır.",
+]
+
+
+def torch_encode(model, tokenizer, texts):
+    inputs = tokenizer(list(texts), padding=True, truncation=True, max_length=ENCODER_MAX_LENGTH,
+                       return_tensors="pt")
+    with torch.no_grad():
+        hidden = model(**inputs).last_hidden_state
+    mask = inputs["attention_mask"].unsqueeze(-1).float()
+    return ((hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)).numpy()
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("onnx")
+    model_path = write_stub_encoder(str(workdir / "stub"), TEXTS, hidden_size=64, layers=2, heads=2,
+                                    vocab_size=2000)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+    onnx_dir = str(workdir / "onnx")
+    export_encoder(model, tokenizer, onnx_dir, model_path, lambda texts: torch_encode(model, tokenizer, texts))
+    return model, tokenizer, onnx_dir, model_path
+
+
+def test_onnx_vectors_match_torch(exported):
+    model, tokenizer, onnx_dir, model_path = exported
+    encoder = OnnxEncoder(find_encoder(onnx_dir, model_path))
+    # One text per call and all at once: padding inside a batch must not change a vector
+    expected = torch_encode(model, tokenizer, TEXTS)
+    assert embedding_cosine(expected, encoder.embed(tokenizer, TEXTS)) > MIN_PARITY_COSINE
+    single = np.stack([encoder.embed(tokenizer, [text])[0] for text in TEXTS])
+    assert embedding_cosine(expected, single) > MIN_PARITY_COSINE
+
+
+def test_onnx_embeddings_embed_query(exported):
+    model, tokenizer, onnx_dir, model_path = exported
+    embeddings = OnnxEmbeddings(onnx_dir, model_path, tokenizer=tokenizer)
+    vector = np.asarray([embeddings.embed_query(TEXTS[0])], dtype=np.float32)
+    assert embedding_cosine(torch_encode(model, tokenizer, TEXTS[:1]), vector) > MIN_PARITY_COSINE
+
+
+def test_export_is_found_only_for_its_model_and_max_length(exported):
+    _, _, onnx_dir, model_path = exported
+    assert find_encoder(onnx_dir, model_path) is not None
+    assert find_encoder(onnx_dir, "another/model") is None
+    assert find_encoder(onnx_dir, model_path, max_length=ENCODER_MAX_LENGTH // 2) is None
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("fitz")
+
+from src.pdf_extractor import strip_repeated_lines  # noqa: E402
+
+
+def gazette_pages(count):
+    bodies = ["Lisans başvurusu Kuruma yapılır.", "Tarifeler her yıl onaylanır.", "Denetim yerinde yapılır.",
+              "Ceza tebliğ edilir.", "İtiraz süresi otuz gündür.", "Yönetmelik yayımı tarihinde yürürlüğe girer."]
+    return [f"RESMİ GAZETE Sayı : 32690\nMADDE {page} - {bodies[page - 1]}\nBu madde {page}. fıkradır ve değişir"
+            f" {'.' * page}\nSayfa {page}\n" for page in range(1, count + 1)]
+
+
+def test_repeated_header_and_page_numbers_are_removed():
+    pages, removed = strip_repeated_lines(gazette_pages(6))
+    assert removed == 12
+    assert pages[2] == "MADDE 3 - Denetim yerinde yapılır.\nBu madde 3. fıkradır ve değişir ...\n"
+
+
+def test_article_headings_are_kept_even_when_repeated():
+    pages = ["Genel hükümler\nMADDE 1 - Amaç\nmetin\nson satır"] * 6
+    cleaned, _ = strip_repeated_lines(pages)
+    assert all("MADDE 1 - Amaç" in page for page in cleaned)
+
+
+def test_short_documents_are_left_alone():
+    pages = gazette_pages(3)
+    assert strip_repeated_lines(pages) == (pages, 0)
@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from benchmarks.stub_models import make_stub_causal_lm
+from src.generation_scheduler import GenerationScheduler, _kv_layers
+from src.prefix_cache import PrefixCache
+from src.prompts import RAG_PROMPT_TEMPLATE, split_template
+
+QUESTIONS = ["Arama ruhsatı süresi kaç yıldır?", "EPDK hangi durumlarda idari para cezası uygular?"]
+CONTEXT = "MADDE 14 - (1) Lisans sahibi tüzel kişiler, lisanslarında belirtilen faaliyetler dışında faaliyette bulunamaz."
+NEW_TOKENS = 8
+
+
+@pytest.fixture(scope="module")
+def stub():
+    model, tokenizer = make_stub_causal_lm(hidden_size=64, layers=2)
+    return model, tokenizer, PrefixCache(model, tokenizer, split_template()[0])
+
+
+def prompt_ids(tokenizer, question):
+    return tokenizer(RAG_PROMPT_TEMPLATE.format(context=CONTEXT, question=question))["input_ids"]
+
+
+def generate(model, ids, past_key_values=None):
+    input_ids = torch.tensor([ids])
+    with torch.no_grad():
+        output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=NEW_TOKENS,
+                                do_sample=False, past_key_values=past_key_values)
+    return output[0, len(ids):].tolist()
+
+
+def test_prompts_start_with_the_cached_prefix(stub):
+    _, tokenizer, prefix = stub
+    assert all(prefix.matches(prompt_ids(tokenizer, question)) for question in QUESTIONS)
+    assert not prefix.matches(prefix.ids)
+
+
+def test_generate_from_a_fork_matches_full_prefill(stub):
+    model, tokenizer, prefix = stub
+    for question in QUESTIONS:
+        ids = prompt_ids(tokenizer, question)
+        assert generate(model, ids, prefix.fork()) == generate(model, ids)
+
+
+def test_forks_leave_the_prefix_unchanged(stub):
+    model, tokenizer, prefix = stub
+    before = [(keys.clone(), values.clone()) for keys, values in _kv_layers(prefix.cache)]
+    generate(model, prompt_ids(tokenizer, QUESTIONS[0]), prefix.fork())
+    after = _kv_layers(prefix.cache)
+    assert len(after) == len(before)
+    assert all(torch.equal(k0, k1) and torch.equal(v0, v1) for (k0, v0), (k1, v1) in zip(before, after))
+
+
+def test_scheduler_with_prefix_matches_full_prefill(stub):
+    model, tokenizer, prefix = stub
+    scheduler = GenerationScheduler(model, tokenizer)
+    try:
+        outputs = {}
+        for cache in (None, prefix):
+            requests = [scheduler.submit(prompt_ids(tokenizer, question), prefix=cache, max_new_tokens=NEW_TOKENS,
+                                         do_sample=False, repetition_penalty=1.0) for question in QUESTIONS]
+            outputs[cache is None] = ["".join(request) for request in requests]
+    finally:
+        scheduler.shutdown()
+    assert outputs[False] == outputs[True]
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from src.query_cache import QueryCache
+
+
+class RecordingEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return [float(len(self.texts))]
+
+
+def make_cache():
+    embeddings = RecordingEmbeddings()
+    return QueryCache(SimpleNamespace(embeddings=embeddings), version_fn=lambda: 0), embeddings
+
+
+def test_embeds_exactly_the_cache_key():
+    cache, embeddings = make_cache()
+    first = cache.embed_query("  MADDE 14 nedir?\n")
+    again = cache.embed_query("MADDE   14 nedir?")
+    assert first == again
+    assert embeddings.texts == ["MADDE 14 nedir?"]
+
+
+def test_case_variants_get_their_own_embedding():
+    cache, embeddings = make_cache()
+    upper = cache.embed_query("MADDE 14 nedir?")
+    lower = cache.embed_query("madde 14 nedir")
+    assert upper != lower
+    assert embeddings.texts == ["MADDE 14 nedir?", "madde 14 nedir"]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from src.streaming import stream_in_thread
+
+
+def collect(iterable, **kwargs):
+    async def scenario():
+        return [frame async for frame in stream_in_thread(iterable, **kwargs)]
+
+    return asyncio.run(scenario())
+
+
+def slow_tokens(count, seconds_per_token):
+    for i in range(count):
+        time.sleep(seconds_per_token)
+        yield f"tok{i} "
+
+
+def test_fast_tokens_are_coalesced_by_size():
+    tokens = [f"tok{i} " for i in range(100)]
+    frames = collect(tokens, flush_chars=32, flush_interval=10.0)
+    assert "".join(frames) == "".join(tokens)
+    assert len(frames) < len(tokens)
+    assert all(len(frame) >= 32 for frame in frames[:-1])
+
+
+def test_slow_tokens_are_flushed_by_age():
+    frames = collect(slow_tokens(5, 0.03), flush_chars=1000, flush_interval=0.01)
+    assert "".join(frames) == "".join(f"tok{i} " for i in range(5))
+    assert len(frames) > 1
+
+
+def test_iterable_errors_are_raised_after_the_buffered_text():
+    def failing():
+        yield "partial"
+        raise RuntimeError("generation failed")
+
+    received = []
+
+    async def scenario():
+        async for frame in stream_in_thread(failing(), flush_chars=1000, flush_interval=10.0):
+            received.append(frame)
+
+    with pytest.raises(RuntimeError, match="generation failed"):
+        asyncio.run(scenario())
+    assert received == ["partial"]
+
+
+def test_concurrent_streams_do_not_serialize():
+    streams, tokens, seconds_per_token = 8, 20, 0.01
+
+    async def one_stream():
+        return "".join([frame async for frame in stream_in_thread(slow_tokens(tokens, seconds_per_token))])
+
+    async def scenario():
+        start = time.perf_counter()
+        texts = await asyncio.gather(*(one_stream() for _ in range(streams)))
+        return time.perf_counter() - start, texts
+
+    seconds, texts = asyncio.run(scenario())
+    assert texts == ["".join(f"tok{i} " for i in range(tokens))] * streams
+    # Serialized streams would take streams * tokens * seconds_per_token (1.6 s)
+    assert seconds < streams * tokens * seconds_per_token / 2